@@ -0,0 +1,721 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmarks for the designer's hot paths.
+
+Usage: python dev/benchmarks.py [benchmark ...]
+"""
+
+import sys
+import os
+from argparse import ArgumentParser
+from collections import OrderedDict
+from timeit import default_timer
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def generate_config(plugins=1000, plugins_per_group=50, groups_per_step=5):
+    """
+    Generates a ModuleConfig.xml with *plugins* plugins, every plugin adds 17 elements to the installer.
+
+    :return: The installer as bytes.
+    """
+    plugin = (
+        '<plugin name="Plugin {0}">'
+        '<description>Description {0}</description>'
+        '<image path="images/{0}.png"/>'
+        '<files>'
+        '<file source="files/{0}.esp" destination="{0}.esp" priority="0" alwaysInstall="false" '
+        'installIfUsable="false"/>'
+        '<folder source="folders/{0}" destination="textures" priority="{1}" alwaysInstall="false" '
+        'installIfUsable="false"/>'
+        '</files>'
+        '<conditionFlags><flag name="flag{1}">On</flag></conditionFlags>'
+        '<typeDescriptor><dependencyType>'
+        '<defaultType name="Optional"/>'
+        '<patterns><pattern>'
+        '<dependencies operator="And"><flagDependency flag="flag{1}" value="On"/>'
+        '<dependencies operator="Or"><fileDependency file="{0}.esp" state="Active"/></dependencies>'
+        '</dependencies>'
+        '<type name="Recommended"/>'
+        '</pattern></patterns>'
+        '</dependencyType></typeDescriptor>'
+        '</plugin>'
+    )
+    steps = []
+    for step_start in range(0, plugins, plugins_per_group * groups_per_step):
+        groups = []
+        for group_start in range(step_start, min(step_start + plugins_per_group * groups_per_step, plugins),
+                                 plugins_per_group):
+            group_plugins = "".join(plugin.format(index, index % 10)
+                                    for index in range(group_start, min(group_start + plugins_per_group, plugins)))
+            groups.append('<group name="Group {}" type="SelectAny"><plugins order="Explicit">{}</plugins>'
+                          '</group>'.format(group_start, group_plugins))
+        steps.append('<installStep name="Step {}"><optionalFileGroups order="Explicit">{}</optionalFileGroups>'
+                     '</installStep>'.format(step_start, "".join(groups)))
+
+    return (
+        '<config xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:noNamespaceSchemaLocation="http://qconsulting.ca/fo3/ModConfig5.0.xsd">'
+        '<moduleName>Benchmark</moduleName>'
+        '<moduleDependencies operator="And"><dependencies operator="Or">'
+        '<fileDependency file="base.esm" state="Active"/></dependencies></moduleDependencies>'
+        '<installSteps order="Explicit">{}</installSteps>'
+        '<conditionalFileInstalls><patterns><pattern>'
+        '<dependencies operator="And"><flagDependency flag="flag0" value="On"/></dependencies>'
+        '<files><file source="patch.esp" destination="patch.esp" priority="0" alwaysInstall="false" '
+        'installIfUsable="false"/></files>'
+        '</pattern></patterns></conditionalFileInstalls>'
+        '</config>'
+    ).format("".join(steps)).encode()
+
+
+def _timed(function, *args, repeat=5):
+    """
+    :return: The best time out of *repeat* runs of function(*args), in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        function(*args)
+        elapsed = default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _legacy_lookup(element):
+    """
+    The if/elif chain _NodeClassLookup used before the lookup tables, kept as a reference.
+    """
+    from src import nodes
+
+    if element.tag == "fomod":
+        return nodes.NodeInfoRoot
+    elif element.tag == "Name":
+        return nodes.NodeInfoName
+    elif element.tag == "Author":
+        return nodes.NodeInfoAuthor
+    elif element.tag == "Version":
+        return nodes.NodeInfoVersion
+    elif element.tag == "Id":
+        return nodes.NodeInfoID
+    elif element.tag == "Website":
+        return nodes.NodeInfoWebsite
+    elif element.tag == "Description":
+        return nodes.NodeInfoDescription
+    elif element.tag == "Groups":
+        return nodes.NodeInfoGroup
+    elif element.tag == "element":
+        return nodes.NodeInfoElement
+    elif element.tag == "config":
+        return nodes.NodeConfigRoot
+    elif element.tag == "moduleName":
+        return nodes.NodeConfigModName
+    elif element.tag == "moduleImage":
+        return nodes.NodeConfigModImage
+    elif element.tag == "moduleDependencies":
+        return nodes.NodeConfigModDepend
+    elif element.tag == "requiredInstallFiles":
+        return nodes.NodeConfigReqFiles
+    elif element.tag == "installSteps":
+        return nodes.NodeConfigInstallSteps
+    elif element.tag == "conditionalFileInstalls":
+        return nodes.NodeConfigCondInstall
+    elif element.tag == "fileDependency":
+        return nodes.NodeConfigDependFile
+    elif element.tag == "flagDependency":
+        return nodes.NodeConfigDependFlag
+    elif element.tag == "gameDependency":
+        return nodes.NodeConfigDependGame
+    elif element.tag == "file":
+        return nodes.NodeConfigFile
+    elif element.tag == "folder":
+        return nodes.NodeConfigFolder
+    elif element.tag == "patterns":
+        if element.getparent().tag == "dependencyType":
+            return nodes.NodeConfigInstallPatterns
+        elif element.getparent().tag == "conditionalFileInstalls":
+            return nodes.NodeConfigPatterns
+    elif element.tag == "pattern":
+        if element.getparent().getparent().tag == "conditionalFileInstalls":
+            return nodes.NodeConfigPattern
+        elif element.getparent().getparent().tag == "dependencyType":
+            return nodes.NodeConfigInstallPattern
+    elif element.tag == "files":
+        return nodes.NodeConfigFiles
+    elif element.tag == "dependencies":
+        if element.getparent().tag == "dependencies" or \
+                element.getparent().tag == "moduleDependencies" or \
+                element.getparent().tag == "visible":
+            return nodes.NodeConfigNestedDependencies
+        else:
+            return nodes.NodeConfigDependencies
+    elif element.tag == "installStep":
+        return nodes.NodeConfigInstallStep
+    elif element.tag == "visible":
+        return nodes.NodeConfigVisible
+    elif element.tag == "optionalFileGroups":
+        return nodes.NodeConfigOptGroups
+    elif element.tag == "group":
+        return nodes.NodeConfigGroup
+    elif element.tag == "plugins":
+        return nodes.NodeConfigPlugins
+    elif element.tag == "plugin":
+        return nodes.NodeConfigPlugin
+    elif element.tag == "description":
+        return nodes.NodeConfigPluginDescription
+    elif element.tag == "image":
+        return nodes.NodeConfigImage
+    elif element.tag == "conditionFlags":
+        return nodes.NodeConfigConditionFlags
+    elif element.tag == "typeDescriptor":
+        return nodes.NodeConfigTypeDesc
+    elif element.tag == "flag":
+        return nodes.NodeConfigFlag
+    elif element.tag == "dependencyType":
+        return nodes.NodeConfigDependencyType
+    elif element.tag == "defaultType":
+        return nodes.NodeConfigDefaultType
+    elif element.tag == "type":
+        return nodes.NodeConfigType
+
+
+def bench_lookup():
+    """
+    Element class resolution: lookup tables against the old if/elif chain.
+    """
+    from lxml.etree import fromstring
+    from src.io import _NodeClassLookup
+
+    elements = list(fromstring(generate_config()).iter())
+    table_lookup = _NodeClassLookup()
+
+    for element in elements:
+        assert table_lookup.lookup(None, element) is _legacy_lookup(element), element.tag
+
+    legacy_time = _timed(lambda: [_legacy_lookup(element) for element in elements])
+    table_time = _timed(lambda: [table_lookup.lookup(None, element) for element in elements])
+    print("{} elements".format(len(elements)))
+    print("  if/elif chain: {:8.2f} ms".format(legacy_time * 1000))
+    print("  lookup tables: {:8.2f} ms ({:.1f}x)".format(table_time * 1000, legacy_time / table_time))
+
+
+def bench_copy():
+    """
+    Subtree copies with copy_node, the time per node should stay flat as the subtree grows.
+    """
+    from src.io import copy_node, module_parser
+    from lxml.etree import fromstring
+
+    for plugins in (50, 100, 200, 400):
+        # the proxies are kept for as long as their document's root is, like the designer's open installers
+        root = fromstring(generate_config(plugins, plugins_per_group=plugins), module_parser)
+        plugins_node = root.find("installSteps/installStep/optionalFileGroups/group/plugins")
+        node_count = sum(1 for _ in plugins_node.iter())
+        copy_time = _timed(copy_node, plugins_node, repeat=3)
+        print("  {:5} nodes: {:8.2f} ms ({:.1f} us/node)".format(
+            node_count, copy_time * 1000, copy_time * 1000000 / node_count
+        ))
+
+
+def _legacy_instances(parent, child):
+    """
+    The sibling scan _validate_child and can_add_child used before the child counts, kept as a reference.
+    """
+    instances = 0
+    for item in parent:
+        if type(item) == type(child):
+            instances += 1
+    return instances
+
+
+def bench_children():
+    """
+    Instance limit checks on a group with thousands of plugins: sibling scans against the child counts.
+    """
+    from src.io import module_parser, node_factory
+    from lxml.etree import fromstring
+
+    for plugins in (1000, 2000, 4000):
+        # the proxies are kept for as long as their document's root is, like the designer's open installers
+        root = fromstring(generate_config(plugins, plugins_per_group=plugins), module_parser)
+        plugins_node = root.find("installSteps/installStep/optionalFileGroups/group/plugins")
+        children = list(plugins_node)
+        # any child with an instance limit needs its siblings counted, the plugins node is the worst case
+        limited_child = node_factory("description", children[0])
+        scan_time = _timed(lambda: [_legacy_instances(plugins_node, limited_child) for _ in children], repeat=1)
+        count_time = _timed(lambda: [plugins_node.child_count(type(limited_child)) for _ in children])
+        print("  {:5} plugins: one check per plugin, scans {:9.2f} ms, counts {:6.2f} ms ({:.0f}x)".format(
+            plugins, scan_time * 1000, count_time * 1000, scan_time / count_time
+        ))
+
+
+def bench_sort():
+    """
+    Sorting a plugins node with 5000 children with the cached sort keys, in lxml and in the node tree - both should
+    stay below a frame (16.7 ms).
+    """
+    from src.io import module_parser
+    from src.items import SORT_ROLE
+    from lxml.etree import fromstring
+    from PyQt5.QtGui import QStandardItemModel
+
+    plugins = 5000
+    plugins_node = fromstring(
+        '<plugins order="Explicit">{}</plugins>'.format(
+            "".join('<plugin name="Plugin {}"/>'.format(index) for index in range(plugins))
+        ),
+        module_parser,
+    )
+    children = list(plugins_node)
+    for index, plugin in enumerate(children):
+        plugin.user_sort_order = str((index * 7919) % plugins).zfill(7)
+    model = QStandardItemModel()
+    model.setSortRole(SORT_ROLE)
+    model_item = plugins_node.model_item
+    model.appendRow(model_item)
+    reverse_children = list(reversed(children))
+
+    def sort_tree():
+        plugins_node[:] = reverse_children
+        plugins_node.mark_sort_dirty()
+        plugins_node.sort()
+
+    legacy_time = _timed(lambda: sorted(children, key=lambda x: x.sort_order + "." + x.user_sort_order))
+    key_time = _timed(lambda: sorted(children, key=lambda x: x.sort_key))
+    tree_time = _timed(sort_tree) - _timed(plugins_node.__setitem__, slice(None), reverse_children)
+    item_time = _timed(model_item.sortChildren, 0)
+    print("  {} plugins".format(plugins))
+    print("  string keys:      {:8.2f} ms".format(legacy_time * 1000))
+    print("  cached keys:      {:8.2f} ms ({:.1f}x)".format(key_time * 1000, legacy_time / key_time))
+    print("  sort():           {:8.2f} ms".format(tree_time * 1000))
+    print("  sortChildren(0):  {:8.2f} ms".format(item_time * 1000))
+
+
+def bench_metadata():
+    """
+    Decoding the metadata comments of 5000 plugins, half of them with the same text, with jsonpickle and the codec.
+    """
+    from src.metadata import decode_metadata, encode_metadata, _decode_text
+    from jsonpickle import decode
+
+    texts = [
+        encode_metadata({
+            "name": "Plugin {}".format(index % 2500),
+            "user_sort": str(index % 2500).zfill(7),
+            "hidden_nodes": ['<image path="images/{}.png"/>'.format(index % 2500)],
+        })
+        for index in range(5000)
+    ]
+
+    def decode_cold():
+        _decode_text.cache_clear()
+        for text in texts:
+            decode_metadata(text)
+
+    legacy_time = _timed(lambda: [decode(text.split(maxsplit=1)[1]) for text in texts])
+    cold_time = _timed(decode_cold)
+    warm_time = _timed(lambda: [decode_metadata(text) for text in texts])
+    print("  jsonpickle:    {:6.2f} ms".format(legacy_time * 1000))
+    print("  codec (cold):  {:6.2f} ms ({:.1f}x)".format(cold_time * 1000, legacy_time / cold_time))
+    print("  codec (warm):  {:6.2f} ms ({:.1f}x)".format(warm_time * 1000, legacy_time / warm_time))
+
+
+#: The bytes per node bench_memory measured before the node types shared their schemas, every node built its own
+#: properties and children tuples then.
+_LEGACY_BYTES_PER_NODE = 1451
+
+
+def _traced(function, *args):
+    """
+    :return: The result of function(*args), the snapshots taken before and after it and the bytes it allocated.
+    """
+    import tracemalloc
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = function(*args)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return result, before, after, sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+
+def bench_memory():
+    """
+    The memory held by each node of a 50k element installer, measured with tracemalloc.
+    """
+    from src.io import module_parser
+    from src.nodes import node_registry
+    from lxml.etree import fromstring, XMLParser
+
+    data = generate_config(3000)
+
+    def parse(parser):
+        root = fromstring(data, parser)
+        # every proxy has to be created for the nodes to be counted
+        return root, list(root.iter())
+
+    (_, elements), _, _, plain_total = _traced(parse, XMLParser())
+    del elements
+    (root, elements), before, after, total = _traced(parse, module_parser)
+    nodes = len(elements)
+    del elements
+    print("  {} nodes, {:.1f} MiB".format(nodes, total / 2 ** 20))
+    print("  plain lxml elements: {:6.0f} bytes per node".format(plain_total / nodes))
+    print("  before the schemas:  {:6.0f} bytes per node (recorded)".format(_LEGACY_BYTES_PER_NODE))
+    print("  nodes:               {:6.0f} bytes per node ({:.1f}x less)".format(
+        total / nodes, _LEGACY_BYTES_PER_NODE / (total / nodes)
+    ))
+    for stat in after.compare_to(before, "lineno")[:5]:
+        print("    {}".format(stat))
+    # walking the tree again must not rebuild any proxy
+    created = node_registry.stats()["created"]
+    sum(1 for _ in root.iter())
+    print("  proxies rebuilt on a second walk: {}".format(node_registry.stats()["created"] - created))
+    return root
+
+
+def bench_bulk():
+    """
+    Adding 2000 plugins to a plugins node shown in a tree view, one add_child at a time against one add_children.
+    """
+    from src.io import node_factory
+    from PyQt5.QtWidgets import QApplication, QTreeView
+    from PyQt5.QtGui import QStandardItemModel
+
+    app = QApplication.instance() or QApplication([])
+    plugins = 2000
+
+    def setup():
+        plugins_node = node_factory("plugins", node_factory("group"))
+        model = QStandardItemModel()
+        model.appendRow(plugins_node.model_item)
+        view = QTreeView()
+        view.setModel(model)
+        view.expandAll()
+        return plugins_node, [node_factory("plugin", plugins_node) for _ in range(plugins)], view
+
+    def one_by_one(plugins_node, children, _):
+        for child in children:
+            plugins_node.add_child(child)
+
+    def bulk(plugins_node, children, _):
+        plugins_node.add_children(children)
+
+    single_time = _timed(lambda: one_by_one(*setup())) - _timed(setup)
+    bulk_time = _timed(lambda: bulk(*setup())) - _timed(setup)
+    app.processEvents()
+    print("  {} plugins".format(plugins))
+    print("  add_child:     {:8.2f} ms".format(single_time * 1000))
+    print("  add_children:  {:8.2f} ms ({:.1f}x)".format(bulk_time * 1000, single_time / bulk_time))
+
+
+def bench_completers():
+    """
+    Filling the flag completers on a 3000 plugin installer: tree scans against the document index.
+    """
+    from src.io import module_parser
+    from src.document import DocumentIndex
+    from lxml.etree import fromstring
+
+    root = fromstring(generate_config(3000), module_parser)
+    for element in root.iter():
+        element.parse_attribs()
+        element.write_attribs()
+
+    def legacy_completers():
+        label_list = []
+        for elem in root.iter():
+            if elem.tag == "flag":
+                value = elem.properties["name"].value
+                if value not in label_list:
+                    label_list.append(value)
+        value_list = []
+        for elem in root.iter():
+            if elem.tag == "flag" and elem.text not in value_list and elem.properties["name"].value == "flag0":
+                value_list.append(elem.text)
+        return label_list, value_list
+
+    def indexed_completers():
+        index = DocumentIndex.of(root)
+        return index.flag_labels(), index.flag_values("flag0")
+
+    build_time = _timed(lambda: DocumentIndex.of(root), repeat=1)
+    assert legacy_completers() == indexed_completers()
+    legacy_time = _timed(legacy_completers)
+    index_time = _timed(indexed_completers)
+    print("  building the index: {:8.2f} ms (once per document)".format(build_time * 1000))
+    print("  scans:              {:8.2f} ms".format(legacy_time * 1000))
+    print("  index:              {:8.4f} ms ({:.0f}x)".format(index_time * 1000, legacy_time / index_time))
+
+
+def bench_snapshot():
+    """
+    Preparing a preview of a 3000 plugin installer: sorting the live tree against snapshotting the selected step.
+    """
+    from src.io import module_parser
+    from src.previews import take_snapshot, _thaw
+    from lxml.etree import fromstring
+
+    root = fromstring(generate_config(3000), module_parser)
+    for element in root.iter():
+        element.parse_attribs()
+        element.write_attribs()
+    root.sort()
+    plugin = next(root.iter("plugin"))
+
+    def legacy_dispatch():
+        # what the dispatcher thread did to the live tree on every request, on an already sorted tree
+        plugin.write_attribs()
+        plugin.load_metadata()
+        root.sort()
+
+    snapshot = take_snapshot(plugin, None, root)
+    legacy_time = _timed(legacy_dispatch)
+    snapshot_time = _timed(take_snapshot, plugin, None, root)
+    thaw_time = _timed(_thaw, snapshot.step, snapshot.step_keys)
+    print("  live tree:          {:8.2f} ms (dispatcher thread, racing the ui)".format(legacy_time * 1000))
+    print("  snapshot:           {:8.2f} ms (ui thread)".format(snapshot_time * 1000))
+    print("  thaw and sort step: {:8.2f} ms (worker threads, in parallel)".format(thaw_time * 1000))
+
+
+def bench_code_cache():
+    """
+    Previewing the code of a 500 plugin config root twice: writing the code against the code cache.
+    """
+    from src.io import module_parser
+    from src.previews import take_snapshot, fragment_key, CodeCache, _thaw
+    from lxml.etree import fromstring, tostring
+    from lxml.objectify import deannotate
+
+    root = fromstring(generate_config(500), module_parser)
+    for element in root.iter():
+        element.parse_attribs()
+        element.write_attribs()
+    snapshot = take_snapshot(root, None, root)
+    cache = CodeCache()
+
+    def render():
+        key = fragment_key(snapshot.element, snapshot.element_keys)
+        code = cache.get(key)
+        if code is None:
+            element = _thaw(snapshot.element, snapshot.element_keys)
+            deannotate(element, cleanup_namespaces=True)
+            code = tostring(element, encoding="Unicode", pretty_print=True, xml_declaration=False)
+            cache.put(key, code)
+        return code
+
+    miss_time = _timed(render, repeat=1)
+    hit_time = _timed(render)
+    print("  writing the code:   {:8.2f} ms ({:.1f} MB of code)".format(miss_time * 1000, cache.size / 1024 / 1024))
+    print("  cached:             {:8.2f} ms ({:.0f}x)".format(hit_time * 1000, miss_time / hit_time))
+
+
+def bench_code_view():
+    """
+    Showing 20000 lines of code: pygments html in a QTextBrowser against the lazily highlighted code view.
+    """
+    from PyQt5.QtWidgets import QApplication, QTextBrowser
+    from pygments import highlight
+    from pygments.formatters.html import HtmlFormatter
+    from pygments.lexers.html import XmlLexer
+    from src.code_view import CodeView
+
+    app = QApplication.instance() or QApplication([])
+    code = "\n".join(
+        "<plugin name=\"plugin{0}\"><description>Plugin {0} &amp; more.</description></plugin>".format(number)
+        for number in range(20000)
+    )
+    browser = QTextBrowser()
+    browser.resize(600, 400)
+    code_view = CodeView()
+    code_view.resize(600, 400)
+
+    def show_html():
+        browser.setHtml(highlight(code, XmlLexer(), HtmlFormatter(noclasses=True, style="autumn", linenos="table")))
+        app.processEvents()
+
+    def show_code():
+        code_view.set_code(code)
+        app.processEvents()
+
+    html_time = _timed(show_html, repeat=1)
+    code_time = _timed(show_code, repeat=3)
+    print("  html browser:       {:8.2f} ms".format(html_time * 1000))
+    print("  code view:          {:8.2f} ms ({:.0f}x)".format(code_time * 1000, html_time / code_time))
+
+
+def bench_step():
+    """
+    Previewing the installer page of a 250 plugin step: compiling the step against the compiled step cache.
+    """
+    from src.io import module_parser
+    from src.previews import PreviewQueue, PreviewGuiWorker, take_snapshot
+    from lxml.etree import fromstring
+
+    root = fromstring(generate_config(250, groups_per_step=5), module_parser)
+    for element in root.iter():
+        element.parse_attribs()
+        element.write_attribs()
+    plugin = next(root.iter("plugin"))
+    snapshot = take_snapshot(plugin, None, root)
+    requests = PreviewQueue()
+
+    def compile_step():
+        worker = PreviewGuiWorker(PreviewQueue(), requests, package_path=lambda: "", package_index=lambda: None)
+        return worker.step_data(snapshot, requests.generation)
+
+    worker = PreviewGuiWorker(PreviewQueue(), requests, package_path=lambda: "", package_index=lambda: None)
+    worker.step_data(snapshot, requests.generation)
+    compile_time = _timed(compile_step)
+    cached_time = _timed(worker.step_data, snapshot, requests.generation)
+    print("  compiling:          {:8.2f} ms".format(compile_time * 1000))
+    print("  cached:             {:8.2f} ms ({:.0f}x)".format(cached_time * 1000, compile_time / cached_time))
+
+
+def bench_installed():
+    """
+    Merging the installed files of 100 plugins with 20 files each: findItems against the destination trie.
+    """
+    from PyQt5.QtGui import QStandardItemModel, QStandardItem
+    from PyQt5.QtCore import Qt
+    from src.installed import InstalledFiles
+
+    plugins = [
+        ["textures/plugin{}/file{}.dds".format(plugin % 10, number) for number in range(20)]
+        for plugin in range(100)
+    ]
+
+    def legacy_merge():
+        # what update_installed_files did on every toggle, for files only
+        model = QStandardItemModel()
+        root = QStandardItem("<root>")
+        model.appendRow(root)
+        for plugin, files in enumerate(plugins):
+            for path in files:
+                parent_item = root
+                for dest_folder in path.split("/")[:-1]:
+                    for existing_folder in model.findItems(dest_folder, Qt.MatchRecursive):
+                        if existing_folder.parent() is parent_item:
+                            parent_item = existing_folder
+                            break
+                    else:
+                        item = QStandardItem(dest_folder)
+                        parent_item.appendRow([item, QStandardItem(), QStandardItem(str(plugin))])
+                        parent_item = item
+                name = path.split("/")[-1]
+                for existing_file in model.findItems(name, Qt.MatchRecursive):
+                    if existing_file.parent() is parent_item:
+                        parent_item.removeRow(existing_file.row())
+                        break
+                parent_item.appendRow([QStandardItem(name), QStandardItem(path), QStandardItem(str(plugin))])
+        return model
+
+    def entries(files):
+        return [(tuple(path.split("/")), False, 0, path) for path in files]
+
+    def build_items(node):
+        node.item = QStandardItem(node.name)
+        for child in node.children.values():
+            node.item.appendRow(build_items(child))
+        return [node.item, QStandardItem(node.winner.source), QStandardItem(str(node.winner.plugin))]
+
+    def trie_merge():
+        model = QStandardItemModel()
+        root = QStandardItem("<root>")
+        model.appendRow(root)
+        installed = InstalledFiles()
+        for plugin, files in enumerate(plugins):
+            installed.set_plugin(plugin, plugin, entries(files))
+        for node in installed.root.children.values():
+            root.appendRow(build_items(node))
+        return installed
+
+    installed = trie_merge()
+
+    def toggle():
+        installed.set_plugin(50, 50, [])
+        installed.set_plugin(50, 50, entries(plugins[50]))
+
+    legacy_time = _timed(legacy_merge, repeat=1)
+    trie_time = _timed(trie_merge)
+    toggle_time = _timed(toggle)
+    print("  findItems:          {:8.2f} ms".format(legacy_time * 1000))
+    print("  trie:               {:8.2f} ms ({:.0f}x)".format(trie_time * 1000, legacy_time / trie_time))
+    print("  toggle one plugin:  {:8.2f} ms (before its items are updated)".format(toggle_time * 1000))
+
+
+def bench_folders():
+    """
+    Expanding a 5000 file folder source on a plugin toggle: walking the package index against the cached listing.
+    """
+    from tempfile import TemporaryDirectory
+    from src.package import PackageIndex
+    from src.installed import FolderListings, walk_folder
+
+    with TemporaryDirectory() as package_path:
+        for folder in range(50):
+            os.makedirs(os.path.join(package_path, "textures", str(folder)))
+            for number in range(100):
+                open(os.path.join(package_path, "textures", str(folder), "{}.dds".format(number)), "w").close()
+        index = PackageIndex(package_path)
+        listings = FolderListings(index)
+        scan_time = _timed(listings.scan, "textures", repeat=1)
+
+        def walk():
+            return [(parts, entry.is_dir) for parts, entry in walk_folder(index, "textures")]
+
+        def cached():
+            return list(listings.get("textures"))
+
+        assert sorted(walk()) == sorted(cached())
+        walk_time = _timed(walk)
+        cached_time = _timed(cached)
+    print("  first scan:         {:8.2f} ms (background thread)".format(scan_time * 1000))
+    print("  index walk:         {:8.2f} ms".format(walk_time * 1000))
+    print("  cached listing:     {:8.2f} ms ({:.0f}x)".format(cached_time * 1000, walk_time / cached_time))
+
+
+benchmarks = OrderedDict([
+    ("lookup", bench_lookup),
+    ("copy", bench_copy),
+    ("children", bench_children),
+    ("sort", bench_sort),
+    ("metadata", bench_metadata),
+    ("memory", bench_memory),
+    ("bulk", bench_bulk),
+    ("completers", bench_completers),
+    ("snapshot", bench_snapshot),
+    ("code_cache", bench_code_cache),
+    ("code_view", bench_code_view),
+    ("step", bench_step),
+    ("installed", bench_installed),
+    ("folders", bench_folders),
+])
+
+
+if __name__ == '__main__':
+    arg_parser = ArgumentParser(description="Runs the designer's micro-benchmarks.")
+    arg_parser.add_argument("benchmark", nargs="*", help="Benchmarks to run: {}.".format(", ".join(benchmarks)))
+    names = arg_parser.parse_args().benchmark or list(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            arg_parser.error("unknown benchmark: {}".format(name))
+    for name in names:
+        print("[{}] {}".format(name, benchmarks[name].__doc__.strip()))
+        benchmarks[name]()
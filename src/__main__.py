@@ -15,13 +15,18 @@
 # limitations under the License.
 
 import sys
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtGui import QPalette, QColor
-from .exceptions import excepthook
-from .gui import IntroWindow, read_settings
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from .batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtGui import QPalette, QColor
+    from .exceptions import excepthook
+    from .gui import IntroWindow, read_settings
+
     sys.excepthook = excepthook
 
     settings = read_settings()
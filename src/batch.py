@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Headless batch processing of fomod packages.
+
+Usage: python -m src batch [-j PROCESSES] [--export] [--no-validate] [--report-dir DIR] package [package ...]
+"""
+
+from os import makedirs
+from os.path import join, basename, normpath, abspath
+from argparse import ArgumentParser
+from hashlib import sha1
+from json import dump
+from multiprocessing import Pool
+from timeit import default_timer
+from . import cur_folder
+from .exceptions import DesignerError
+from .package import PackageIndex
+
+
+def process_package(package_path, validate=True, export_=False):
+    """
+    Imports the installer at *package_path*, sorts it and optionally validates and exports it again.
+
+    Runs in the pool's worker processes so it only returns plain data.
+
+    :param package_path: The package to process.
+    :param validate: Optional. Whether the installer is validated against the schema.
+    :param export_: Optional. Whether the sorted installer is written back to the package.
+    :return: A report dict for the package.
+    """
+    from .io import import_, export
+
+    start = default_timer()
+    report = {
+        "package": package_path,
+        "status": "ok",
+        "valid": None,
+        "error": "",
+        "written": [],
+    }
+    try:
+        index = PackageIndex(package_path)
+        # nothing here looks at the hidden nodes, they're written back as they were read
+        info_root, config_root = import_(package_path, index=index, lazy_hidden=True)
+        if info_root is None or config_root is None:
+            report["status"] = "missing"
+            report["error"] = "No installer found."
+        else:
+            info_root.sort()
+            config_root.sort()
+            if validate:
+                from validator import validate_tree, ValidatorError, ValidationError
+
+                try:
+                    validate_tree(config_root.getroottree(), join(cur_folder, "resources", "mod_schema.xsd"))
+                    report["valid"] = True
+                except ValidationError as e:
+                    report["valid"] = False
+                    report["error"] = str(e)
+                except ValidatorError as e:
+                    report["status"] = "error"
+                    report["error"] = str(e)
+            if export_ and report["status"] == "ok":
+                report["written"] = export(info_root, config_root, package_path, index)
+    except (DesignerError, OSError) as e:
+        report["status"] = "error"
+        report["error"] = str(e)
+    report["elapsed"] = default_timer() - start
+    return report
+
+
+def _process(args):
+    return process_package(*args)
+
+
+def _report_name(package_path):
+    """
+    :return: The name of the report file for *package_path*, unique even between packages with the same name.
+    """
+    digest = sha1(abspath(package_path).encode("utf-8")).hexdigest()[:8]
+    return "{}-{}.json".format(basename(normpath(package_path)), digest)
+
+
+def run_batch(package_paths, processes=None, validate=True, export_=False, report_dir=None, output=print):
+    """
+    Processes every package in a pool of worker processes.
+
+    :param package_paths: The packages to process.
+    :param processes: Optional. The number of worker processes, defaults to the number of cpus.
+    :param validate: Optional. Whether the installers are validated against the schema.
+    :param export_: Optional. Whether the sorted installers are written back to the packages.
+    :param report_dir: Optional. The folder where a json report is written for each package.
+    :param output: Optional. Called with each line of progress.
+    :return: The reports of every package, in the order they finished.
+    """
+    if report_dir is not None:
+        makedirs(report_dir, exist_ok=True)
+
+    reports = []
+    start = default_timer()
+    with Pool(processes) as pool:
+        for report in pool.imap_unordered(_process, [(path, validate, export_) for path in package_paths]):
+            reports.append(report)
+            if report_dir is not None:
+                with open(join(report_dir, _report_name(report["package"])), "w") as report_file:
+                    dump(report, report_file, indent=4, sort_keys=True)
+            status = report["status"] if report["valid"] is not False else "invalid"
+            output("[{}] {} ({:.2f}s)".format(status, report["package"], report["elapsed"]))
+            if report["error"]:
+                output("    " + report["error"])
+
+    elapsed = default_timer() - start
+    output("Processed {} packages in {:.2f}s ({:.2f} packages/s).".format(
+        len(reports), elapsed, len(reports) / elapsed if elapsed else 0
+    ))
+    return reports
+
+
+def main(argv=None):
+    """
+    The entry point for the batch subcommand.
+
+    :param argv: Optional. The command line arguments, after the subcommand. Defaults to sys.argv[1:].
+    :return: The exit code - 0 if every package was imported (and validated), 1 otherwise.
+    """
+    arg_parser = ArgumentParser(prog="fomod-designer batch",
+                                description="Imports, sorts and validates fomod packages without the gui.")
+    arg_parser.add_argument("packages", nargs="+", help="The root folders of the packages to process.")
+    arg_parser.add_argument("-j", "--processes", type=int, default=None,
+                            help="The number of worker processes, defaults to the number of cpus.")
+    arg_parser.add_argument("--export", action="store_true", help="Write the sorted installers back.")
+    arg_parser.add_argument("--no-validate", action="store_true", help="Skip schema validation.")
+    arg_parser.add_argument("--report-dir", default=None, help="Write a json report for each package here.")
+    args = arg_parser.parse_args(argv)
+
+    reports = run_batch(
+        args.packages,
+        processes=args.processes,
+        validate=not args.no_validate,
+        export_=args.export,
+        report_dir=args.report_dir,
+    )
+    if any(report["status"] != "ok" or report["valid"] is False for report in reports):
+        return 1
+    return 0
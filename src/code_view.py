@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The code preview pane - a plain text view with line numbers and a lazy xml highlighter.
+"""
+
+import re
+from PyQt5.QtWidgets import QPlainTextEdit, QWidget
+from PyQt5.QtGui import QSyntaxHighlighter, QTextCharFormat, QColor, QFont, QFontDatabase, QPainter
+from PyQt5.QtCore import Qt, QRect, QSize
+
+_NO_STATE, _IN_COMMENT = -1, 1
+_TOKENS = re.compile(
+    r'(?P<comment><!--.*?(?:-->|$))'
+    r'|(?P<tag></?[^\s/>]+|/?>|\?>)'
+    r'|(?P<attribute>[^\s=<>"]+)(?==)'
+    r'|(?P<string>"[^"]*"|\'[^\']*\')'
+    r'|(?P<entity>&[^\s;]+;)'
+)
+
+
+def _char_format(colour, italic=False):
+    char_format = QTextCharFormat()
+    char_format.setForeground(QColor(colour))
+    char_format.setFontItalic(italic)
+    return char_format
+
+
+class XmlHighlighter(QSyntaxHighlighter):
+    """
+    Highlights xml, but only the blocks it's asked to through highlight_blocks.
+
+    Every other block only gets its state (whether it ends inside a comment) so a block further down is highlighted
+    correctly whenever it's asked for.
+    """
+    formats = {
+        "comment": _char_format("#aaaaaa", italic=True),
+        "tag": _char_format("#1e90ff"),
+        "attribute": _char_format("#1e90ff"),
+        "string": _char_format("#aa5500"),
+        "entity": _char_format("#800000"),
+    }
+
+    def __init__(self, document):
+        super().__init__(document)
+        self._highlighting = False
+        self._highlighted = set()
+
+    def highlight_blocks(self, first, last):
+        """
+        Highlights every block from *first* to *last* that wasn't highlighted before.
+
+        :param first: The first QTextBlock.
+        :param last: The last QTextBlock, included.
+        """
+        block = first
+        self._highlighting = True
+        try:
+            while block.isValid() and block.blockNumber() <= last.blockNumber():
+                if block.blockNumber() not in self._highlighted:
+                    self._highlighted.add(block.blockNumber())
+                    self.rehighlightBlock(block)
+                block = block.next()
+        finally:
+            self._highlighting = False
+
+    def highlightBlock(self, text):
+        in_comment = self.previousBlockState() == _IN_COMMENT
+        if not self._highlighting:
+            # the block's formats are gone, highlight it again next time it's on screen
+            self._highlighted.discard(self.currentBlock().blockNumber())
+            if in_comment:
+                ends_inside = text.find("-->") < 0 or text.rfind("<!--") > text.rfind("-->")
+            else:
+                ends_inside = text.rfind("<!--") > text.rfind("-->")
+            self.setCurrentBlockState(_IN_COMMENT if ends_inside else _NO_STATE)
+            return
+
+        start = 0
+        if in_comment:
+            start = text.find("-->")
+            if start < 0:
+                self.setFormat(0, len(text), self.formats["comment"])
+                self.setCurrentBlockState(_IN_COMMENT)
+                return
+            start += 3
+            self.setFormat(0, start, self.formats["comment"])
+
+        self.setCurrentBlockState(_NO_STATE)
+        for match in _TOKENS.finditer(text, start):
+            kind = match.lastgroup
+            self.setFormat(match.start(kind), len(match.group(kind)), self.formats[kind])
+            if kind == "comment" and not match.group(kind).endswith("-->"):
+                self.setCurrentBlockState(_IN_COMMENT)
+
+
+class _LineNumberArea(QWidget):
+    def __init__(self, code_view):
+        super().__init__(code_view)
+        self.code_view = code_view
+
+    def sizeHint(self):
+        return QSize(self.code_view.line_number_width(), 0)
+
+    def paintEvent(self, event):
+        self.code_view.paint_line_numbers(event)
+
+
+class CodeView(QPlainTextEdit):
+    """
+    A read-only view for the generated code.
+
+    QPlainTextEdit only lays out the blocks on screen, so large documents scroll without any cost upfront, and the
+    highlighter follows it - only the blocks that get scrolled into view are highlighted.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.setTextInteractionFlags(Qt.TextSelectableByMouse | Qt.TextSelectableByKeyboard)
+        font = QFontDatabase.systemFont(QFontDatabase.FixedFont)
+        font.setStyleHint(QFont.Monospace)
+        self.setFont(font)
+
+        self.highlighter = XmlHighlighter(self.document())
+        self.line_number_area = _LineNumberArea(self)
+        self.blockCountChanged.connect(self._update_margins)
+        self.updateRequest.connect(self._update_line_numbers)
+        self.updateRequest.connect(self._highlight_visible)
+        self._update_margins()
+
+    def set_code(self, code):
+        """
+        Replaces the code shown.
+
+        :param code: The new code, as plain text.
+        """
+        self.setPlainText(code)
+        self._highlight_visible()
+
+    def line_number_width(self):
+        """
+        :return: The width of the line number gutter, enough for the highest line number.
+        """
+        digits = len(str(max(1, self.blockCount())))
+        return 6 + self.fontMetrics().width("9") * digits
+
+    def paint_line_numbers(self, event):
+        """
+        Paints the numbers of the blocks on screen in the line number gutter.
+        """
+        painter = QPainter(self.line_number_area)
+        painter.fillRect(event.rect(), QColor("#f0f0f0"))
+        painter.setPen(QColor("#808080"))
+        block = self.firstVisibleBlock()
+        top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
+        width = self.line_number_area.width() - 3
+        height = self.fontMetrics().height()
+        while block.isValid() and top <= event.rect().bottom():
+            bottom = top + self.blockBoundingRect(block).height()
+            if block.isVisible() and bottom >= event.rect().top():
+                painter.drawText(0, int(top), width, height, Qt.AlignRight, str(block.blockNumber() + 1))
+            block = block.next()
+            top = bottom
+
+    def _update_margins(self, *args):
+        self.setViewportMargins(self.line_number_width(), 0, 0, 0)
+
+    def _update_line_numbers(self, rect, dy):
+        if dy:
+            self.line_number_area.scroll(0, dy)
+        else:
+            self.line_number_area.update(0, rect.y(), self.line_number_area.width(), rect.height())
+        if rect.contains(self.viewport().rect()):
+            self._update_margins()
+
+    def _highlight_visible(self, *args):
+        first = self.firstVisibleBlock()
+        last = self.cursorForPosition(self.viewport().rect().bottomRight()).block()
+        self.highlighter.highlight_blocks(first, last)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        rect = self.contentsRect()
+        self.line_number_area.setGeometry(QRect(rect.left(), rect.top(), self.line_number_width(), rect.height()))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An index of the things in an installer that the gui looks up by name - flags, file and folder sources and the names
+of steps, groups and plugins.
+"""
+
+from collections import OrderedDict
+from lxml.etree import Element
+
+#: The tags indexed by their name property.
+NAMED_TAGS = ("installStep", "group", "plugin")
+#: The tags indexed by their source property.
+SOURCE_TAGS = ("file", "folder")
+
+
+def _entry(node):
+    """
+    :return: The index entry for *node* - a (kind, key, value) tuple - or None if it isn't indexed.
+    """
+    tag = node.tag
+    if tag == "flag":
+        return "flag", node.value_of("name"), node.text or ""
+    if tag in SOURCE_TAGS:
+        return "source", node.value_of("source"), None
+    if tag in NAMED_TAGS:
+        return "name", (tag, node.value_of("name")), None
+    return None
+
+
+class DocumentIndex(object):
+    """
+    The index of a single document, kept up to date as nodes are added, removed and written
+    (see _NodeElement.update_child_count and write_attribs) so lookups never walk the tree.
+
+    Each document's index is built the first time it's asked for, through DocumentIndex.of.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._flags = OrderedDict()
+        self._sources = OrderedDict()
+        self._names = OrderedDict()
+
+    @classmethod
+    def of(cls, root):
+        """
+        :param root: The root node of the document.
+        :return: The document's index, built if it doesn't have one yet.
+        """
+        if root._document_index is None:
+            index = cls()
+            index.add_subtree(root)
+            root._document_index = index
+        return root._document_index
+
+    def update(self, node):
+        """
+        Indexes *node* again after its properties changed.
+        """
+        self.discard(node)
+        entry = _entry(node)
+        if entry is None:
+            return
+        kind, key, value = entry
+        if kind == "flag":
+            self._flags.setdefault(key, OrderedDict()).setdefault(value, OrderedDict())[node] = None
+        elif kind == "source":
+            self._sources.setdefault(key, OrderedDict())[node] = None
+        else:
+            self._names.setdefault(key, OrderedDict())[node] = None
+        self._entries[node] = entry
+
+    def discard(self, node):
+        """
+        Drops *node* from the index, if it's there.
+        """
+        entry = self._entries.pop(node, None)
+        if entry is None:
+            return
+        kind, key, value = entry
+        if kind == "flag":
+            values = self._flags[key]
+            del values[value][node]
+            if not values[value]:
+                del values[value]
+                if not values:
+                    del self._flags[key]
+            return
+        table = self._sources if kind == "source" else self._names
+        del table[key][node]
+        if not table[key]:
+            del table[key]
+
+    def add_subtree(self, node):
+        """
+        Indexes *node* and all of its descendants.
+        """
+        for element in node.iter(tag=Element):
+            self.update(element)
+
+    def remove_subtree(self, node):
+        """
+        Drops *node* and all of its descendants from the index.
+        """
+        for element in node.iter(tag=Element):
+            self.discard(element)
+
+    def flag_labels(self):
+        """
+        :return: The labels of every flag set in the document, in the order they were first indexed.
+        """
+        return list(self._flags)
+
+    def flag_values(self, label):
+        """
+        :return: The values the flag *label* is set to.
+        """
+        return list(self._flags.get(label, ()))
+
+    def flag_setters(self, label, value=None):
+        """
+        :param label: The flag's label.
+        :param value: Optional. Only the plugins that set the flag to this value.
+        :return: The plugins that set the flag *label*.
+        """
+        values = self._flags.get(label, {})
+        flags = [flag for flag_value, nodes in values.items() if value is None or flag_value == value
+                 for flag in nodes]
+        setters = OrderedDict()
+        for flag in flags:
+            plugin = flag.getparent().getparent() if flag.getparent() is not None else None
+            if plugin is not None and plugin.tag == "plugin":
+                setters[plugin] = None
+        return list(setters)
+
+    def nodes_with_source(self, source):
+        """
+        :return: The file and folder nodes whose source is *source*.
+        """
+        return list(self._sources.get(source, ()))
+
+    def nodes_named(self, tag, name):
+        """
+        :param tag: One of NAMED_TAGS.
+        :param name: The name to look up.
+        :return: The nodes with the tag *tag* called *name*.
+        """
+        return list(self._names.get((tag, name), ()))
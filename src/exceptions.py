@@ -17,8 +17,6 @@
 from traceback import print_tb
 from io import StringIO
 from os.path import join
-from PyQt5.QtWidgets import QMessageBox
-from PyQt5.QtGui import QPixmap
 from . import __version__, cur_folder
 
 
@@ -29,6 +27,8 @@ def excepthook(exc_type, exc_value, tracebackobj):
     :param exc_value: exception value
     :param tracebackobj: traceback object
     """
+    from PyQt5.QtWidgets import QMessageBox
+    from PyQt5.QtGui import QPixmap
 
     notice = (
         "An unhandled exception occurred. Please report the problem"
@@ -104,6 +104,17 @@ class TagNotFound(DesignerError):
         Exception.__init__(self, self.message)
 
 
+class CancelledError(DesignerError):
+    """
+    Exception raised when a long running operation (like importing an installer) was cancelled by the user.
+    """
+    def __init__(self):
+        self.title = "Cancelled"
+        self.message = "The operation was cancelled."
+        self.detailed = ""
+        Exception.__init__(self, self.message)
+
+
 class BaseInstanceException(Exception):
     """
     Exception raised when trying to instanced base classes (not meant to be used).
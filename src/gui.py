@@ -14,11 +14,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from os import makedirs, listdir
-from os.path import expanduser, normpath, basename, join, relpath, isdir, isfile, abspath
+import sys
+from os import makedirs
+from os.path import expanduser, normpath, basename, join, relpath, isdir, abspath
 from io import BytesIO
-from threading import Thread
-from queue import Queue
+from threading import Thread, Event
+from concurrent.futures import ThreadPoolExecutor
 from webbrowser import open_new_tab
 from datetime import datetime
 from collections import deque
@@ -28,19 +29,23 @@ from lxml.etree import parse, tostring, Comment
 from PyQt5.QtWidgets import (QFileDialog, QColorDialog, QMessageBox, QLabel, QHBoxLayout, QCommandLinkButton, QDialog,
                              QFormLayout, QLineEdit, QSpinBox, QComboBox, QWidget, QPushButton, QSizePolicy, QStatusBar,
                              QCompleter, QApplication, QMainWindow, QUndoCommand, QUndoStack, QMenu, QHeaderView,
-                             QAction, QVBoxLayout, QGroupBox, QCheckBox, QRadioButton)
+                             QAction, QVBoxLayout, QGroupBox, QCheckBox, QRadioButton, QProgressBar)
 from PyQt5.QtGui import QIcon, QPixmap, QColor, QFont, QStandardItemModel, QStandardItem
-from PyQt5.QtCore import Qt, pyqtSignal, QStringListModel, QMimeData, QEvent
+from PyQt5.QtCore import Qt, pyqtSignal, QStringListModel, QMimeData, QEvent, QFileSystemWatcher
 from PyQt5.uic import loadUi
 from requests import get, head, codes, ConnectionError, Timeout
 from validator import validate_tree, check_warnings, ValidatorError, ValidationError, WarningError, MissingFolderError
 from . import cur_folder, __version__
 from .nodes import _NodeElement, NodeComment
 from .io import import_, new, export, node_factory, copy_node
-from .previews import PreviewDispatcherThread
+from .previews import PreviewDispatcherThread, PreviewQueue, take_snapshot
 from .props import PropertyFile, PropertyColour, PropertyFolder, PropertyCombo, PropertyInt, PropertyText, \
     PropertyFlagLabel, PropertyFlagValue, PropertyHTML
-from .exceptions import DesignerError
+from .exceptions import DesignerError, CancelledError
+from .package import PackageIndex
+from .items import SORT_ROLE
+from .document import DocumentIndex
+from .installed import InstalledFiles, FolderListings, destination_parts, parse_priority
 from .ui_templates import window_intro, window_mainframe, window_about, window_settings, window_texteditor, \
     window_plaintexteditor, preview_mo
 
@@ -160,6 +165,19 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
     #: Signals the previews need to be updated.
     update_previews = pyqtSignal([object])
 
+    #: Signals the progress of an installer import (job, bytes read, total bytes, nodes imported).
+    #: Every import signal starts with the job it comes from, the open's cancel Event.
+    import_progress = pyqtSignal([object, int, int, int])
+
+    #: Signals an installer open has moved on to a stage without progress (job, message).
+    import_stage = pyqtSignal([object, str])
+
+    #: Signals an installer open has finished (job, package index, info root, config root, [validation, warnings]).
+    import_finished = pyqtSignal([object, object, object, object, object])
+
+    #: Signals an installer import has failed (job, error).
+    import_failed = pyqtSignal([object, object])
+
     class NodeMimeData(QMimeData):
         def __init__(self):
             super().__init__()
@@ -211,7 +229,8 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
 
         def canDropMimeData(self, mime_data, drop_action, row, col, parent_index):
             if self.itemFromIndex(parent_index) and mime_data.has_node() and mime_data.has_item() and drop_action == 2:
-                if isinstance(self.itemFromIndex(parent_index).xml_node, type(mime_data.node().getparent())):
+                original_parent = mime_data.original_item().xml_node.getparent()
+                if isinstance(self.itemFromIndex(parent_index).xml_node, type(original_parent)):
                     return True
                 else:
                     return False
@@ -224,14 +243,17 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
 
             parent = self.itemFromIndex(parent_index)
             xml_node = mime_data.node()
-            parent.xml_node.remove(mime_data.original_item().xml_node)
-            parent.xml_node.append(mime_data.node())
+            original_node = mime_data.original_item().xml_node
+            parent.xml_node.remove(original_node)
+            parent.xml_node.update_child_count(original_node, -1)
+            parent.xml_node.append(xml_node)
+            parent.xml_node.update_child_count(xml_node, 1)
             parent.insertRow(row, xml_node.model_item)
             for row_index in range(0, parent.rowCount()):
                 if parent.child(row_index) == mime_data.original_item():
                     continue
                 parent.child(row_index).xml_node.user_sort_order = str(parent.child(row_index).row()).zfill(7)
-                parent.child(row_index).xml_node.save_metadata()
+                parent.child(row_index).xml_node.mark_metadata_dirty()
             return True
 
         def supportedDragActions(self):
@@ -405,6 +427,7 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
         def redo(self):
             self.pasted_node = copy_node(QApplication.clipboard().mimeData().node())
             self.parent_item.xml_node.append(self.pasted_node)
+            self.parent_item.xml_node.update_child_count(self.pasted_node, 1)
             self.parent_item.appendRow(self.pasted_node.model_item)
             self.parent_item.sortChildren(0)
 
@@ -454,8 +477,10 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
 
         # manage node tree model
         self.node_tree_model = self.NodeStandardModel()
+        self.node_tree_model.setSortRole(SORT_ROLE)
         self.node_tree_view.setModel(self.node_tree_model)
-        self.node_tree_model.itemChanged.connect(lambda item: item.xml_node.save_metadata())
+        self.node_tree_model.itemChanged.connect(lambda item: item.xml_node.set_item_text(item.text()))
+        self.node_tree_model.itemChanged.connect(lambda item: item.xml_node.mark_metadata_dirty())
         self.node_tree_model.itemChanged.connect(lambda item: self.xml_code_changed.emit(item.xml_node))
 
         # connect actions to the respective methods
@@ -468,6 +493,9 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
         self.actionShow_Node.triggered.connect(self.show_node)
         self.actionHe_lp.triggered.connect(self.help)
         self.action_About.triggered.connect(lambda _, self_=self: self.about(self_))
+        self.action_preview_stats = QAction("Preview Statistics", self)
+        self.action_preview_stats.triggered.connect(self.preview_stats)
+        self.menu_Help.addAction(self.action_preview_stats)
         self.actionClear.triggered.connect(self.clear_recent_files)
         self.actionCopy.triggered.connect(
             lambda: self.copy_item_to_clipboard()
@@ -477,7 +505,10 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
             lambda: self.paste_item_from_clipboard()
             if self.node_tree_view.selectedIndexes() else None
         )
-        self.actionExpand_All.triggered.connect(self.node_tree_view.expandAll)
+        self.actionExpand_All.triggered.connect(self.expand_all)
+        self.node_tree_view.expanded.connect(
+            lambda index: self._restore_hidden(self.node_tree_model.itemFromIndex(index).xml_node)
+        )
         self.actionCollapse_All.triggered.connect(self.node_tree_view.collapseAll)
         self.action_Object_Tree.toggled.connect(self.node_tree.setVisible)
         self.actionObject_Box.toggled.connect(self.children_box.setVisible)
@@ -489,25 +520,35 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
         # setup any necessary variables
         self.original_title = self.windowTitle()
         self._package_path = ""
+        self._package_index = None
         self.package_name = ""
         self.settings_dict = read_settings()
         self._info_root = None
         self._config_root = None
         self._current_prop_list = []
         self.original_prop_value_list = {}
+        self._import_cancel = None
+        self._import_widgets = []
+
+        # manage installer imports
+        self.import_progress.connect(self._update_import_progress)
+        self.import_stage.connect(self._update_import_stage)
+        self.import_finished.connect(self._open_finished)
+        self.import_failed.connect(self._open_failed)
 
         # start the preview threads
-        self.preview_queue = Queue()
-        self.preview_gui_worker = PreviewMoGui(self.layout_mo)
-        self.update_previews.connect(self.preview_queue.put)
-        self.update_code_preview.connect(self.xml_code_browser.setHtml)
+        self.preview_queue = PreviewQueue(self.settings_dict["General"]["preview_debounce"] / 1000)
+        self.preview_gui_worker = PreviewMoGui(self.layout_mo, self.package_index)
+        self.update_previews.connect(
+            lambda node: self.preview_queue.put(take_snapshot(node, self._info_root, self._config_root))
+        )
+        self.update_code_preview.connect(self.xml_code_browser.set_code)
         self.preview_thread = PreviewDispatcherThread(
             self.preview_queue,
             self.update_code_preview,
             **{
                 "package_path": self.package_path,
-                "info_root": self.info_root,
-                "config_root": self.config_root,
+                "package_index": self.package_index,
                 "gui_worker": self.preview_gui_worker
             }
         )
@@ -617,6 +658,9 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
     def package_path(self):
         return self._package_path
 
+    def package_index(self):
+        return self._package_index
+
     def copy_item_to_clipboard(self):
         item = self.node_tree_model.itemFromIndex(self.node_tree_view.selectedIndexes()[0])
         QApplication.clipboard().setMimeData(self.node_tree_model.mimeData([self.node_tree_model.indexFromItem(item)]))
@@ -639,21 +683,11 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
 
     @staticmethod
     def update_flag_label_completer(label_model, elem_root):
-        label_list = []
-        for elem in elem_root.iter():
-            if elem.tag == "flag":
-                value = elem.properties["name"].value
-                if value not in label_list:
-                    label_list.append(value)
-        label_model.setStringList(label_list)
+        label_model.setStringList(DocumentIndex.of(elem_root).flag_labels())
 
     @staticmethod
     def update_flag_value_completer(value_model, elem_root, label):
-        value_list = []
-        for elem in elem_root.iter():
-            if elem.tag == "flag" and elem.text not in value_list and elem.properties["name"].value == label:
-                value_list.append(elem.text)
-        value_model.setStringList(value_list)
+        value_model.setStringList(DocumentIndex.of(elem_root).flag_values(label))
 
     def check_updates(self):
         """
@@ -701,6 +735,22 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
 
         Thread(target=check_remote).start()
 
+    def _restore_hidden(self, node):
+        """
+        Restores the hidden nodes of *node* and its children, which are the ones shown when *node* is expanded.
+
+        Opened installers keep their hidden nodes serialized until their parent can be seen.
+        """
+        node.restore_hidden()
+        for child in node:
+            if isinstance(child, _NodeElement):
+                child.restore_hidden()
+
+    def expand_all(self):
+        for row in range(self.node_tree_model.rowCount()):
+            self.node_tree_model.item(row).xml_node.restore_hidden(recursive=True)
+        self.node_tree_view.expandAll()
+
     def hide_node(self):
         if self.current_node is not None:
             self.current_node.set_hidden(True)
@@ -734,51 +784,193 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
                 package_path = path
 
             if package_path:
-                info_root, config_root = import_(normpath(package_path))
-                if info_root is not None and config_root is not None:
-                    if self.settings_dict["Load"]["validate"]:
-                        try:
-                            validate_tree(
-                                parse(BytesIO(tostring(config_root, pretty_print=True))),
-                                join(cur_folder, "resources", "mod_schema.xsd"),
-                            )
-                        except ValidationError as p:
-                            generic_errorbox(p.title, str(p), p.detailed).exec_()
-                            if not self.settings_dict["Load"]["validate_ignore"]:
-                                return
-                    if self.settings_dict["Load"]["warnings"]:
-                        try:
-                            check_warnings(
-                                package_path,
-                                config_root,
-                            )
-                        except WarningError as p:
-                            generic_errorbox(p.title, str(p), p.detailed).exec_()
-                            if not self.settings_dict["Save"]["warn_ignore"]:
-                                return
-                else:
-                    info_root, config_root = new()
+                self._import_package(normpath(package_path))
+        except (DesignerError, ValidatorError) as p:
+            generic_errorbox(p.title, str(p), p.detailed).exec_()
+            return
 
-                self._package_path = package_path
-                self._info_root, self._config_root = info_root, config_root
+    def _import_package(self, package_path):
+        """
+        Opens the installer at package_path as a background job, cancelling any open still running.
 
-                self.node_tree_model.clear()
+        The job imports both installer files and then, if enabled in the Settings, validates the installer
+        and checks it for common errors at the same time. The result is delivered through the
+        import_finished or import_failed signals.
 
-                self.node_tree_model.appendRow(self._info_root.model_item)
-                self.node_tree_model.appendRow(self._config_root.model_item)
+        :param package_path: The path to import the installer from.
+        """
+        self._cancel_import()
+        cancel = self._import_cancel = Event()
+        index = PackageIndex(package_path)
+        validate = self.settings_dict["Load"]["validate"]
+        warnings = self.settings_dict["Load"]["warnings"]
 
-                self.package_name = basename(normpath(self._package_path))
-                self.current_node = None
-                self.xml_code_changed.emit(self.current_node)
-                self.undo_stack.setClean()
-                self.undo_stack.cleanChanged.emit(True)
-                self.undo_stack.clear()
-                QApplication.clipboard().clear()
-                self.actionPaste.setEnabled(False)
-                self.action_Delete.setEnabled(False)
-                self.update_recent_files(self._package_path)
-                self.clear_prop_list()
-                self.button_wizard.setEnabled(False)
+        def validate_job(config_root):
+            try:
+                validate_tree(config_root.getroottree(), join(cur_folder, "resources", "mod_schema.xsd"))
+            except ValidationError as e:
+                return e
+
+        def warnings_job(config_root):
+            try:
+                check_warnings(package_path, config_root)
+            except WarningError as e:
+                return e
+
+        def import_worker():
+            try:
+                info_root, config_root = import_(
+                    package_path,
+                    lambda *progress: self.import_progress.emit(cancel, *progress),
+                    cancel,
+                    index,
+                    True
+                )
+                validation_error, warning_error = None, None
+                if info_root is not None and config_root is not None and not cancel.is_set():
+                    self.import_stage.emit(cancel, "Checking installer...")
+                    with ThreadPoolExecutor(max_workers=2) as executor:
+                        validation = executor.submit(validate_job, config_root) if validate else None
+                        warning = executor.submit(warnings_job, config_root) if warnings else None
+                        validation_error = validation.result() if validation is not None else None
+                        warning_error = warning.result() if warning is not None else None
+            except CancelledError:
+                return
+            except Exception as e:
+                # anything unexpected still has to take the open's progress down
+                if not cancel.is_set():
+                    self.import_failed.emit(cancel, e)
+                return
+            if not cancel.is_set():
+                self.import_finished.emit(cancel, index, info_root, config_root, [validation_error, warning_error])
+
+        progress_bar = QProgressBar()
+        progress_bar.setMaximumWidth(200)
+        progress_bar.setTextVisible(False)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(lambda: self._cancel_import())
+        self._import_widgets = [progress_bar, cancel_button]
+        self.statusBar().addPermanentWidget(progress_bar)
+        self.statusBar().addPermanentWidget(cancel_button)
+        self.statusBar().showMessage("Importing installer...")
+        Thread(target=import_worker, daemon=True).start()
+
+    def _update_import_progress(self, job, bytes_read, total_bytes, nodes):
+        """
+        Shows an import's progress in the status bar.
+
+        :param job: The open the progress comes from, ignored if it isn't the current one.
+        :param bytes_read: How many bytes were parsed so far.
+        :param total_bytes: The size of the installer files.
+        :param nodes: How many nodes were imported so far.
+        """
+        if job is not self._import_cancel:
+            return
+        if self._import_widgets:
+            progress_bar = self._import_widgets[0]
+            progress_bar.setMaximum(total_bytes)
+            progress_bar.setValue(bytes_read)
+        self.statusBar().showMessage("Importing installer... ({} nodes)".format(nodes))
+
+    def _update_import_stage(self, job, message):
+        """
+        Shows the stage an open is at in the status bar, these stages give no progress.
+
+        :param job: The open the stage comes from, ignored if it isn't the current one.
+        :param message: The message to show.
+        """
+        if job is not self._import_cancel:
+            return
+        if self._import_widgets:
+            self._import_widgets[0].setRange(0, 0)
+        self.statusBar().showMessage(message)
+
+    def _cancel_import(self):
+        """
+        Cancels the installer open in progress, if any.
+        """
+        if self._import_cancel is not None:
+            self._import_cancel.set()
+            self._import_cancel = None
+        self._clear_import_status()
+
+    def _clear_import_status(self):
+        """
+        Removes the import's progress from the status bar.
+        """
+        for widget in self._import_widgets:
+            self.statusBar().removeWidget(widget)
+            widget.deleteLater()
+        self._import_widgets = []
+        self.statusBar().clearMessage()
+
+    def _open_failed(self, job, error):
+        """
+        Reports an installer open that failed.
+
+        :param job: The open that failed, ignored if it isn't the current one.
+        :param error: The error raised during the open.
+        """
+        if job is not self._import_cancel:
+            return
+        self._import_cancel = None
+        self._clear_import_status()
+        if isinstance(error, (DesignerError, ValidatorError)):
+            generic_errorbox(error.title, str(error), error.detailed).exec_()
+        else:
+            sys.excepthook(type(error), error, error.__traceback__)
+
+    def _open_finished(self, job, package_index, info_root, config_root, errors):
+        """
+        Finishes opening an installer once it's been imported and checked - loads it into the node tree.
+
+        :param job: The open that finished, ignored if it isn't the current one (it was cancelled or replaced).
+        :param package_index: The PackageIndex of the package the installer was imported from.
+        :param info_root: The imported info root or None if there was no installer.
+        :param config_root: The imported config root or None if there was no installer.
+        :param errors: The validation and the warnings errors, either one is None if there was none.
+        """
+        if job is not self._import_cancel:
+            return
+        self._import_cancel = None
+        self._clear_import_status()
+        try:
+            if info_root is not None and config_root is not None:
+                validation_error, warning_error = errors
+                if validation_error is not None:
+                    generic_errorbox(validation_error.title, str(validation_error), validation_error.detailed).exec_()
+                    if not self.settings_dict["Load"]["validate_ignore"]:
+                        return
+                if warning_error is not None:
+                    generic_errorbox(warning_error.title, str(warning_error), warning_error.detailed).exec_()
+                    if not self.settings_dict["Save"]["warn_ignore"]:
+                        return
+            else:
+                info_root, config_root = new()
+
+            self._package_path = package_index.package_path
+            self._package_index = package_index
+            self._info_root, self._config_root = info_root, config_root
+
+            self.node_tree_model.clear()
+
+            self._restore_hidden(self._info_root)
+            self._restore_hidden(self._config_root)
+            self.node_tree_model.appendRow(self._info_root.model_item)
+            self.node_tree_model.appendRow(self._config_root.model_item)
+
+            self.package_name = basename(normpath(self._package_path))
+            self.current_node = None
+            self.xml_code_changed.emit(self.current_node)
+            self.undo_stack.setClean()
+            self.undo_stack.cleanChanged.emit(True)
+            self.undo_stack.clear()
+            QApplication.clipboard().clear()
+            self.actionPaste.setEnabled(False)
+            self.action_Delete.setEnabled(False)
+            self.update_recent_files(self._package_path)
+            self.clear_prop_list()
+            self.button_wizard.setEnabled(False)
         except (DesignerError, ValidatorError) as p:
             generic_errorbox(p.title, str(p), p.detailed).exec_()
             return
@@ -817,7 +1009,7 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
                         generic_errorbox(e.title, str(e), e.detailed).exec_()
                         if not self.settings_dict["Save"]["warn_ignore"]:
                             return
-                export(self._info_root, self._config_root, self._package_path)
+                export(self._info_root, self._config_root, self._package_path, self._package_index)
                 self.undo_stack.setClean()
         except (DesignerError, ValidatorError) as e:
             generic_errorbox(e.title, str(e), e.detailed).exec_()
@@ -830,6 +1022,7 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
         config = SettingsDialog(self)
         config.exec_()
         self.settings_dict = read_settings()
+        self.preview_queue.debounce = self.settings_dict["General"]["preview_debounce"] / 1000
 
     def refresh(self):
         """
@@ -867,6 +1060,24 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
         except (Timeout, ConnectionError):
             open_new_tab(local_docs)
 
+    def preview_stats(self):
+        """
+        Shows how many preview renders were requested and how many were skipped because a newer one superseded them.
+        """
+        stats = self.preview_thread.stats()
+        QMessageBox.information(
+            self,
+            "Preview Statistics",
+            "Preview requests: {}\nSkipped renders: {}\nCode previews from cache: {} ({:.1f} MB cached)\n"
+            "Debounce: {} ms".format(
+                stats["requests"],
+                stats["skipped"],
+                stats["cache_hits"],
+                stats["cache_size"] / 1024 / 1024,
+                self.settings_dict["General"]["preview_debounce"]
+            )
+        )
+
     @staticmethod
     def about(parent):
         """
@@ -1546,6 +1757,8 @@ class MainFrame(QMainWindow, window_mainframe.Ui_MainWindow):
             pass
         elif answer == QMessageBox.Cancel:
             event.ignore()
+            return
+        self._cancel_import()
 
 
 class SettingsDialog(QDialog, window_settings.Ui_Dialog):
@@ -1749,6 +1962,7 @@ class PreviewMoGui(QWidget, preview_mo.Ui_Form):
     missing_node_signal = pyqtSignal()
     set_labels_signal = pyqtSignal([str, str, str, str])
     create_page_signal = pyqtSignal([object])
+    folders_scanned_signal = pyqtSignal([list])
 
     class ScaledLabel(QLabel):
         def __init__(self, parent=None):
@@ -1768,9 +1982,13 @@ class PreviewMoGui(QWidget, preview_mo.Ui_Form):
         def set_priority(self, value):
             self.priority = value
 
-    def __init__(self, mo_preview_layout):
+    def __init__(self, mo_preview_layout, package_index):
         super().__init__()
         self.mo_preview_layout = mo_preview_layout
+        self.package_index = package_index
+        self.folder_listings = None
+        self.folder_watcher = QFileSystemWatcher(self)
+        self.folder_watcher.directoryChanged.connect(self._folder_changed)
         self.setupUi(self)
         self.mo_preview_layout.addWidget(self)
         self.label_image = self.ScaledLabel(self)
@@ -1834,6 +2052,7 @@ class PreviewMoGui(QWidget, preview_mo.Ui_Form):
         self.missing_node_signal.connect(self.missing_node)
         self.set_labels_signal.connect(self.set_labels)
         self.create_page_signal.connect(self.create_page)
+        self.folders_scanned_signal.connect(self._folders_scanned)
 
     def on_custom_context_menu(self, position):
         node_tree_context_menu = QMenu(self.tree_results)
@@ -1875,6 +2094,11 @@ class PreviewMoGui(QWidget, preview_mo.Ui_Form):
         self.model_files_root = QStandardItem(QIcon(join(cur_folder, "resources/logos/logo_folder.png")), "<root>")
         self.model_files.appendRow(self.model_files_root)
         self.tree_results.setModel(self.model_files)
+        self.installed_files = InstalledFiles()
+        self.installed_files.root.item = self.model_files_root
+        self.reset_flags()
+
+    def reset_flags(self):
         self.model_flags.clear()
         self.model_flags.setHorizontalHeaderLabels(["Flag Label", "Flag Value", "Plugin"])
         self.list_flags.setModel(self.model_flags)
@@ -1906,6 +2130,7 @@ class PreviewMoGui(QWidget, preview_mo.Ui_Form):
         group_step.setLayout(layout_step)
 
         check_first_radio = True
+        plugin_order = 0
         for group in page_data.group_list:
             group_group = QGroupBox(group.name)
             layout_group = QVBoxLayout()
@@ -1942,6 +2167,8 @@ class PreviewMoGui(QWidget, preview_mo.Ui_Form):
                 button_plugin.setProperty("folder_list", plugin.folder_list)
                 button_plugin.setProperty("flag_list", plugin.flag_list)
                 button_plugin.setProperty("type", plugin.type)
+                button_plugin.setProperty("order", plugin_order)
+                plugin_order += 1
                 button_plugin.setAttribute(Qt.WA_Hover)
 
                 if plugin.type == "Required":
@@ -1952,8 +2179,10 @@ class PreviewMoGui(QWidget, preview_mo.Ui_Form):
                     button_plugin.setChecked(False)
                     button_plugin.setEnabled(False)
 
-                button_plugin.toggled.connect(self.reset_models)
-                button_plugin.toggled.connect(self.update_installed_files)
+                button_plugin.toggled.connect(self.reset_flags)
+                button_plugin.toggled.connect(
+                    lambda checked, button=button_plugin: self.update_plugin_files(button)
+                )
                 button_plugin.toggled.connect(self.update_set_flags)
 
                 button_plugin.installEventFilter(self)
@@ -1970,129 +2199,156 @@ class PreviewMoGui(QWidget, preview_mo.Ui_Form):
         self.reset_models()
         self.update_installed_files()
         self.update_set_flags()
+        self.scan_folders(
+            [folder_.rel_source for plugin in self.findChildren((QCheckBox, QRadioButton), "preview_button")
+             for folder_ in plugin.property("folder_list")],
+            check_stale=True
+        )
         self.show()
 
-    def update_installed_files(self):
-        def recurse_add_items(folder, parent):
-            for boop in listdir(folder):  # I was very tired
-                if isdir(join(folder, boop)):
-                    folder_item = None
-                    existing_folder_ = self.model_files.findItems(boop, Qt.MatchRecursive)
-                    if existing_folder_:
-                        for boopity in existing_folder_:
-                            if boopity.parent() is parent:
-                                folder_item = boopity
-                                break
-                    if not folder_item:
-                        folder_item = self.PreviewItem(
-                            QIcon(join(cur_folder, "resources/logos/logo_folder.png")),
-                            boop
-                        )
-                        folder_item.set_priority(folder_.priority)
-                        parent.appendRow([folder_item, QStandardItem(rel_source), QStandardItem(button.text())])
-                    recurse_add_items(join(folder, boop), folder_item)
-
-                elif isfile(join(folder, boop)):
-                    file_item_ = None
-                    existing_file_ = self.model_files.findItems(boop, Qt.MatchRecursive)
-                    if existing_file_:
-                        for boopity in existing_file_:
-                            if boopity.parent() is parent:
-                                if folder_.priority < boopity.priority:
-                                    file_item_ = boopity
-                                    break
-                                else:
-                                    parent.removeRow(boopity.row())
-                                    break
-                    if not file_item_:
-                        file_item_ = self.PreviewItem(
-                            QIcon(join(cur_folder, "resources/logos/logo_file.png")),
-                            boop
-                        )
-                        file_item_.set_priority(folder_.priority)
-                        parent.appendRow([file_item_, QStandardItem(rel_source), QStandardItem(button.text())])
+    def _folder_listings(self):
+        """
+        :return: The FolderListings of the current package, None if there's no package.
+        """
+        package_index = self.package_index()
+        if package_index is None:
+            return None
+        if self.folder_listings is None or self.folder_listings.package_index is not package_index:
+            self.folder_listings = FolderListings(package_index)
+            if self.folder_watcher.directories():
+                self.folder_watcher.removePaths(self.folder_watcher.directories())
+        return self.folder_listings
+
+    def scan_folders(self, sources, check_stale=False):
+        """
+        Scans folder sources in the background, the installed files are merged again once they're done.
+
+        :param sources: The folder sources, as written in the installer. Sources already scanned are skipped.
+        :param check_stale: Optional. Whether the scanned folders are checked for changes through their mtime too.
+        """
+        folder_listings = self._folder_listings()
+        if folder_listings is None:
+            return
+        sources = {source for source in sources if folder_listings.get(source) is None}
+        if not sources and not check_stale:
+            return
+
+        def scan_worker():
+            if check_stale:
+                sources.update(folder_listings.stale())
+            folders = []
+            for source in sources:
+                folders.extend(folder_listings.scan(source))
+            if sources:
+                self.folders_scanned_signal.emit(folders)
+
+        Thread(target=scan_worker, daemon=True).start()
+
+    def _folders_scanned(self, folders):
+        """
+        Watches the folders that were just scanned and merges every plugin's files again.
 
+        :param folders: The scanned folders, relative to the package.
+        """
+        package_index = self.package_index()
+        if package_index is None:
+            return
+        watched = set(self.folder_watcher.directories())
+        paths = [join(package_index.package_path, folder) for folder in folders]
+        paths = [path for path in paths if path not in watched]
+        if paths:
+            self.folder_watcher.addPaths(paths)
         for button in self.findChildren((QCheckBox, QRadioButton), "preview_button"):
-            for folder_ in button.property("folder_list"):
-                if (button.isChecked() and button.property("type") != "NotUsable" or
-                        folder_.always_install or
-                        folder_.install_usable and button.property("type") != "NotUsable" or
-                        button.property("type") == "Required"):
-                    destination = folder_.destination
-                    abs_source = folder_.abs_source
-                    rel_source = folder_.rel_source
-                    parent_item = self.model_files_root
-
-                    destination_split = destination.split("/")
-                    if destination_split[0] == ".":
-                        destination_split = destination_split[1:]
-                    for dest_folder in destination_split:
-                        existing_folder_list = self.model_files.findItems(dest_folder, Qt.MatchRecursive)
-                        if existing_folder_list:
-                            for existing_folder in existing_folder_list:
-                                if existing_folder.parent() is parent_item:
-                                    parent_item = existing_folder
-                                    break
-                            continue
-                        item_ = self.PreviewItem(
-                            QIcon(join(cur_folder, "resources/logos/logo_folder.png")),
-                            dest_folder
-                        )
-                        item_.set_priority(folder_.priority)
-                        parent_item.appendRow([item_, QStandardItem(), QStandardItem(button.text())])
-                        parent_item = item_
-
-                    if isdir(abs_source):
-                        recurse_add_items(abs_source, parent_item)
-
-            for file_ in button.property("file_list"):
-                if (button.isChecked() and button.property("type") != "NotUsable" or
-                        file_.always_install or
-                        file_.install_usable and button.property("type") != "NotUsable" or
-                        button.property("type") == "Required"):
-                    destination = file_.destination
-                    abs_source = file_.abs_source
-                    rel_source = file_.rel_source
-                    parent_item = self.model_files_root
-
-                    destination_split = destination.split("/")
-                    if destination_split[0] == ".":
-                        destination_split = destination_split[1:]
-                    for dest_folder in destination_split:
-                        existing_folder_list = self.model_files.findItems(dest_folder, Qt.MatchRecursive)
-                        if existing_folder_list:
-                            for existing_folder in existing_folder_list:
-                                if existing_folder.parent() is parent_item:
-                                    parent_item = existing_folder
-                                    break
-                            continue
-                        item_ = self.PreviewItem(
-                            QIcon(join(cur_folder, "resources/logos/logo_folder.png")),
-                            dest_folder
-                        )
-                        item_.set_priority(file_.priority)
-                        parent_item.appendRow([item_, QStandardItem(), QStandardItem(button.text())])
-                        parent_item = item_
-
-                    source_file = abs_source.split("/")[len(abs_source.split("/")) - 1]
-                    file_item = None
-                    existing_file_list = self.model_files.findItems(source_file, Qt.MatchRecursive)
-                    if existing_file_list:
-                        for existing_file in existing_file_list:
-                            if existing_file.parent() is parent_item:
-                                if file_.priority < existing_file.priority:
-                                    file_item = existing_file
-                                    break
-                                else:
-                                    parent_item.removeRow(existing_file.row())
-                                    break
-                    if not file_item:
-                        file_item = self.PreviewItem(
-                            QIcon(join(cur_folder, "resources/logos/logo_file.png")),
-                            source_file
-                        )
-                        file_item.set_priority(file_.priority)
-                        parent_item.appendRow([file_item, QStandardItem(rel_source), QStandardItem(button.text())])
+            self.update_plugin_files(button)
+
+    def _folder_changed(self, path):
+        folder_listings = self._folder_listings()
+        if folder_listings is not None:
+            self.scan_folders(folder_listings.invalidate(relpath(path, folder_listings.package_index.package_path)))
+
+    def _plugin_entries(self, button):
+        """
+        :param button: A plugin's button.
+        :return: The entries the plugin installs in its current state, for InstalledFiles.set_plugin.
+        """
+        folder_listings = self._folder_listings()
+        type_ = button.property("type")
+        entries = []
+        for folder_ in button.property("folder_list"):
+            if (button.isChecked() and type_ != "NotUsable" or
+                    folder_.always_install or
+                    folder_.install_usable and type_ != "NotUsable" or
+                    type_ == "Required"):
+                destination = destination_parts(folder_.destination)
+                priority = parse_priority(folder_.priority)
+                entries.append((destination, True, priority, ""))
+                # folders only show their contents once they're scanned in the background
+                listing = folder_listings.get(folder_.rel_source) if folder_listings is not None else None
+                for parts, is_dir in listing or ():
+                    entries.append((destination + parts, is_dir, priority, folder_.rel_source))
+
+        for file_ in button.property("file_list"):
+            if (button.isChecked() and type_ != "NotUsable" or
+                    file_.always_install or
+                    file_.install_usable and type_ != "NotUsable" or
+                    type_ == "Required"):
+                source_file = file_.abs_source.replace("\\", "/").split("/")[-1]
+                entries.append((
+                    destination_parts(file_.destination) + (source_file,),
+                    False,
+                    parse_priority(file_.priority),
+                    file_.rel_source
+                ))
+        return entries
+
+    def _installed_row(self, node):
+        """
+        Creates the items for *node* and all its children.
+
+        :return: The node's row.
+        """
+        winner = node.winner
+        logo = "resources/logos/logo_folder.png" if node.is_dir else "resources/logos/logo_file.png"
+        node.item = self.PreviewItem(QIcon(join(cur_folder, logo)), node.name)
+        node.item.set_priority(winner.priority)
+        for child in node.children.values():
+            node.item.appendRow(self._installed_row(child))
+        return [node.item, QStandardItem(winner.source), QStandardItem(winner.plugin.text())]
+
+    def update_installed_files(self):
+        """
+        Merges the files of every plugin into the installed files tree, the items are created in one go.
+        """
+        for button in self.findChildren((QCheckBox, QRadioButton), "preview_button"):
+            self.installed_files.set_plugin(button, button.property("order"), self._plugin_entries(button))
+        for node in self.installed_files.root.children.values():
+            self.model_files_root.appendRow(self._installed_row(node))
+
+        self.tree_results.header().resizeSections(QHeaderView.Stretch)
+
+    def update_plugin_files(self, button):
+        """
+        Merges the files of a single plugin again after it was toggled, leaving the other items alone.
+
+        :param button: The plugin's button.
+        """
+        removed, changed = self.installed_files.set_plugin(
+            button, button.property("order"), self._plugin_entries(button)
+        )
+        for node in removed:
+            if node.item is not None:
+                node.parent.item.removeRow(node.item.row())
+                node.item = None
+        for node in changed:
+            if node.item is None:
+                node.parent.item.appendRow(self._installed_row(node))
+                continue
+            winner = node.winner
+            logo = "resources/logos/logo_folder.png" if node.is_dir else "resources/logos/logo_file.png"
+            node.item.setIcon(QIcon(join(cur_folder, logo)))
+            node.item.set_priority(winner.priority)
+            node.parent.item.child(node.item.row(), 1).setText(winner.source)
+            node.parent.item.child(node.item.row(), 2).setText(winner.plugin.text())
 
         self.tree_results.header().resizeSections(QHeaderView.Stretch)
 
@@ -2145,6 +2401,7 @@ class DefaultsSettings(object):
 default_settings = {
     "General": {
         "code_refresh": 3,
+        "preview_debounce": 150,
         "show_intro": True,
         "show_advanced": False,
         "tutorial_advanced": True,
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The files a fomod installer would install, merged by destination for the installer preview.
+"""
+
+from os import stat
+from os.path import join, normpath
+from collections import namedtuple, OrderedDict
+from operator import attrgetter
+from threading import Lock
+
+#: One plugin's claim on a destination path. *order* is (plugin order, entry index) and breaks priority ties.
+InstallCandidate = namedtuple("InstallCandidate", ["priority", "order", "plugin", "source", "is_dir"])
+
+_by_order = attrgetter("order")
+_by_depth = attrgetter("depth")
+
+
+def _by_priority(candidate):
+    return candidate.priority, candidate.order
+
+
+def parse_priority(value):
+    """
+    :return: The installer's priority attribute *value* as an int, 0 (the schema's default) when missing or invalid.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def destination_parts(destination):
+    """
+    :return: The components of an installer destination path, both slashes are accepted as separators.
+    """
+    return tuple(part for part in destination.replace("\\", "/").split("/") if part and part != ".")
+
+
+def walk_folder(package_index, rel_folder, parts=()):
+    """
+    Lists a package folder recursively, every folder right before its contents.
+
+    :param package_index: The package's PackageIndex.
+    :param rel_folder: The folder, relative to the package.
+    :return: A generator of (path components relative to *rel_folder*, PackageEntry) tuples.
+    """
+    for entry in package_index.listdir(rel_folder):
+        entry_parts = parts + (entry.name,)
+        yield entry_parts, entry
+        if entry.is_dir:
+            yield from walk_folder(package_index, entry.path, entry_parts)
+
+
+def _key(rel_folder):
+    return normpath(rel_folder.replace("\\", "/")).casefold()
+
+
+class FolderListings(object):
+    """
+    The recursive listings of package folders, each scanned once and kept until something in it changes.
+
+    Scanning is slow so it's meant for a background thread, everything else only reads the cache. A listing is
+    dropped when one of its folders is invalidated (by a filesystem watcher) or its mtime changed (see stale).
+
+    Safe to use from several threads.
+
+    :param package_index: The package's PackageIndex.
+    """
+    def __init__(self, package_index):
+        self.package_index = package_index
+        self._listings = {}
+        self._lock = Lock()
+
+    def get(self, rel_folder):
+        """
+        :param rel_folder: The folder, relative to the package, as it was scanned.
+        :return: The folder's cached listing, a tuple of (path components, is_dir) tuples, or None if not scanned.
+        """
+        with self._lock:
+            listing = self._listings.get(_key(rel_folder))
+        return listing[0] if listing is not None else None
+
+    def scan(self, rel_folder):
+        """
+        Lists a folder recursively and caches the listing.
+
+        :param rel_folder: The folder, relative to the package, as written in the installer.
+        :return: The real paths of every folder in the listing, *rel_folder* included.
+        """
+        folder = self.package_index.lookup(rel_folder)
+        if folder is None or not folder.is_dir:
+            return []
+        entries = []
+        folders = OrderedDict([(folder.path, folder.mtime)])
+        for parts, entry in walk_folder(self.package_index, folder.path):
+            entries.append((parts, entry.is_dir))
+            if entry.is_dir:
+                folders[entry.path] = entry.mtime
+        with self._lock:
+            self._listings[_key(rel_folder)] = (tuple(entries), folders, rel_folder)
+        return list(folders)
+
+    def stale(self):
+        """
+        Drops the listings with a folder whose mtime changed since it was scanned.
+
+        :return: The dropped listings' folders, as they were scanned.
+        """
+        with self._lock:
+            listings = list(self._listings.items())
+        dropped = []
+        for key, (_, folders, scanned) in listings:
+            for rel_folder, mtime in folders.items():
+                try:
+                    changed = stat(join(self.package_index.package_path, rel_folder)).st_mtime_ns != mtime
+                except OSError:
+                    changed = True
+                if changed:
+                    self.package_index.invalidate(rel_folder)
+                    with self._lock:
+                        self._listings.pop(key, None)
+                    dropped.append(scanned)
+                    break
+        return dropped
+
+    def invalidate(self, rel_folder):
+        """
+        Drops the listings that include a folder, for when it changed.
+
+        :param rel_folder: The folder that changed, relative to the package.
+        :return: The dropped listings' folders, as they were scanned.
+        """
+        self.package_index.invalidate(rel_folder)
+        key = _key(rel_folder)
+        dropped = []
+        with self._lock:
+            for listing_key, (_, folders, scanned) in list(self._listings.items()):
+                if any(_key(folder) == key for folder in folders):
+                    del self._listings[listing_key]
+                    dropped.append(scanned)
+        return dropped
+
+
+class InstalledNode(object):
+    """
+    A file or folder in the installed files tree.
+
+    :param name: The file or folder's name.
+    :param parent: The parent InstalledNode, None for the root.
+    """
+    __slots__ = ("name", "parent", "depth", "children", "candidates", "item")
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.children = OrderedDict()
+        self.candidates = {}
+        #: Free for the presentation to keep its item for the node.
+        self.item = None
+
+    @property
+    def is_dir(self):
+        """
+        Whether the node is a folder - it holds something or no plugin installs it as a file.
+        """
+        return bool(self.children) or not any(not candidate.is_dir for candidate in self.candidates.values())
+
+    @property
+    def winner(self):
+        """
+        The candidate shown for the node - the first plugin to create a folder, the highest priority for a file
+        (the later plugin on a tie).
+        """
+        if not self.candidates:
+            return None
+        if self.is_dir:
+            return min(self.candidates.values(), key=_by_order)
+        return max((candidate for candidate in self.candidates.values() if not candidate.is_dir), key=_by_priority)
+
+
+class InstalledFiles(object):
+    """
+    A trie of the installed files by destination path.
+
+    Each plugin's entries are kept apart, so toggling one plugin only touches the paths that plugin installs.
+    """
+    def __init__(self):
+        self.root = InstalledNode("", None)
+        self._plugins = {}
+
+    def set_plugin(self, plugin, order, entries):
+        """
+        Replaces everything *plugin* installs.
+
+        :param plugin: Any hashable that identifies the plugin.
+        :param order: The plugin's position in the installer, a later plugin wins priority ties.
+        :param entries: Iterable of (destination path components, is_dir, priority, source) tuples, empty to remove
+                        the plugin. Folders must come before their contents.
+        :return: The nodes that were removed, deepest first, and the nodes that changed, shallowest first.
+        """
+        touched = set()
+        for node, key in self._plugins.pop(plugin, ()):
+            del node.candidates[key]
+            touched.add(node)
+
+        refs = []
+        implied = (plugin, -1)
+        for index, (parts, is_dir, priority, source) in enumerate(entries):
+            node = self.root
+            for depth, part in enumerate(parts):
+                child = node.children.get(part)
+                if child is None:
+                    child = node.children[part] = InstalledNode(part, node)
+                node = child
+                if depth < len(parts) - 1 and implied not in node.candidates:
+                    # folders that are only there to hold the entry
+                    node.candidates[implied] = InstallCandidate(priority, (order, index), plugin, "", True)
+                    refs.append((node, implied))
+                    touched.add(node)
+            if node is self.root:
+                continue
+            node.candidates[(plugin, index)] = InstallCandidate(priority, (order, index), plugin, source, is_dir)
+            refs.append((node, (plugin, index)))
+            touched.add(node)
+        if refs:
+            self._plugins[plugin] = refs
+
+        removed = []
+        for node in sorted(touched, key=_by_depth, reverse=True):
+            if not node.candidates and not node.children and node.parent.children.get(node.name) is node:
+                del node.parent.children[node.name]
+                removed.append(node)
+        changed = [node for node in sorted(touched, key=_by_depth) if node.candidates]
+        return removed, changed
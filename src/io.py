@@ -14,13 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from os import listdir, makedirs
-from os.path import join
-from lxml.etree import (PythonElementClassLookup, XMLParser, tostring, fromstring, CommentBase, Comment,
-                        Element, SubElement, parse, ParseError, ElementTree, CustomElementClassLookup)
-from .exceptions import MissingFileError, ParserError, TagNotFound
+from os import makedirs, fsync, replace, remove
+from os.path import join, getsize, isfile
+from io import BytesIO
+from hashlib import sha256
+from shutil import copymode
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from lxml.etree import (PythonElementClassLookup, XMLParser, Comment, Element, ParseError,
+                        CustomElementClassLookup, iterparse, tostring, fromstring)
+from .exceptions import MissingFileError, ParserError, TagNotFound, CancelledError
+from .package import PackageIndex
 
 module_parser = XMLParser(remove_pis=True, remove_blank_text=True)
+_export_parser = XMLParser(remove_blank_text=True)
 
 
 class _CommentLookup(CustomElementClassLookup):
@@ -36,124 +43,133 @@ class _CommentLookup(CustomElementClassLookup):
 class _NodeClassLookup(PythonElementClassLookup):
     """
     Class that handles the custom lookup for the element factories.
+
+    Most tags belong to a single node class and are resolved from the tag alone. The parent and grandparent
+    are only fetched for the few tags that are shared between node classes (patterns, pattern and dependencies).
     """
+    def __init__(self):
+        super().__init__()
+        self._tag_table = None
+        self._context_table = None
+        self._shared_tags = None
+
     def lookup(self, doc, element):
-        from . import nodes
-
-        if element.tag == "fomod":
-            return nodes.NodeInfoRoot
-        elif element.tag == "Name":
-            return nodes.NodeInfoName
-        elif element.tag == "Author":
-            return nodes.NodeInfoAuthor
-        elif element.tag == "Version":
-            return nodes.NodeInfoVersion
-        elif element.tag == "Id":
-            return nodes.NodeInfoID
-        elif element.tag == "Website":
-            return nodes.NodeInfoWebsite
-        elif element.tag == "Description":
-            return nodes.NodeInfoDescription
-        elif element.tag == "Groups":
-            return nodes.NodeInfoGroup
-        elif element.tag == "element":
-            return nodes.NodeInfoElement
-
-        elif element.tag == "config":
-            return nodes.NodeConfigRoot
-        elif element.tag == "moduleName":
-            return nodes.NodeConfigModName
-        elif element.tag == "moduleImage":
-            return nodes.NodeConfigModImage
-        elif element.tag == "moduleDependencies":
-            return nodes.NodeConfigModDepend
-        elif element.tag == "requiredInstallFiles":
-            return nodes.NodeConfigReqFiles
-        elif element.tag == "installSteps":
-            return nodes.NodeConfigInstallSteps
-        elif element.tag == "conditionalFileInstalls":
-            return nodes.NodeConfigCondInstall
-        elif element.tag == "fileDependency":
-            return nodes.NodeConfigDependFile
-        elif element.tag == "flagDependency":
-            return nodes.NodeConfigDependFlag
-        elif element.tag == "gameDependency":
-            return nodes.NodeConfigDependGame
-        elif element.tag == "file":
-            return nodes.NodeConfigFile
-        elif element.tag == "folder":
-            return nodes.NodeConfigFolder
-        elif element.tag == "patterns":
-            if element.getparent().tag == "dependencyType":
-                return nodes.NodeConfigInstallPatterns
-            elif element.getparent().tag == "conditionalFileInstalls":
-                return nodes.NodeConfigPatterns
-        elif element.tag == "pattern":
-            if element.getparent().getparent().tag == "conditionalFileInstalls":
-                return nodes.NodeConfigPattern
-            elif element.getparent().getparent().tag == "dependencyType":
-                return nodes.NodeConfigInstallPattern
-        elif element.tag == "files":
-            return nodes.NodeConfigFiles
-        elif element.tag == "dependencies":
-            if element.getparent().tag == "dependencies" or \
-                    element.getparent().tag == "moduleDependencies" or \
-                    element.getparent().tag == "visible":
-                return nodes.NodeConfigNestedDependencies
-            else:
-                return nodes.NodeConfigDependencies
-        elif element.tag == "installStep":
-            return nodes.NodeConfigInstallStep
-        elif element.tag == "visible":
-            return nodes.NodeConfigVisible
-        elif element.tag == "optionalFileGroups":
-            return nodes.NodeConfigOptGroups
-        elif element.tag == "group":
-            return nodes.NodeConfigGroup
-        elif element.tag == "plugins":
-            return nodes.NodeConfigPlugins
-        elif element.tag == "plugin":
-            return nodes.NodeConfigPlugin
-        elif element.tag == "description":
-            return nodes.NodeConfigPluginDescription
-        elif element.tag == "image":
-            return nodes.NodeConfigImage
-        elif element.tag == "conditionFlags":
-            return nodes.NodeConfigConditionFlags
-        elif element.tag == "typeDescriptor":
-            return nodes.NodeConfigTypeDesc
-        elif element.tag == "flag":
-            return nodes.NodeConfigFlag
-        elif element.tag == "dependencyType":
-            return nodes.NodeConfigDependencyType
-        elif element.tag == "defaultType":
-            return nodes.NodeConfigDefaultType
-        elif element.tag == "type":
-            return nodes.NodeConfigType
+        if self._tag_table is None:
+            self._tag_table, self._context_table, self._shared_tags = _build_lookup_tables()
+
+        tag = element.tag
+        try:
+            return self._tag_table[tag]
+        except KeyError:
+            if tag not in self._shared_tags:
+                raise TagNotFound(element)
+
+        parent = element.getparent()
+        if parent is None:
+            return self._shared_tags[tag]
+        parent_tag = parent.tag
+        try:
+            return self._context_table[(tag, parent_tag)]
+        except KeyError:
+            pass
+
+        grandparent = parent.getparent()
+        grandparent_tag = grandparent.tag if grandparent is not None else None
+        try:
+            return self._context_table[(tag, parent_tag, grandparent_tag)]
+        except KeyError:
+            return self._shared_tags[tag]
+
+    def resolve(self, tag, parent=None):
+        """
+        Resolves the node class for a new element with *tag* that is going to be a child of *parent*.
+
+        Shared tags are resolved from the parent node's allowed children, the parent is only used as an
+        element (its tag and its parent's tag) if it's not a node.
+
+        :param tag: The tag of the new element.
+        :param parent: Optional. The parent of the new element, either a node or a plain element.
+        :return: The node class, raises TagNotFound if there is none.
+        """
+        if self._tag_table is None:
+            self._tag_table, self._context_table, self._shared_tags = _build_lookup_tables()
+
+        try:
+            return self._tag_table[tag]
+        except KeyError:
+            pass
+
+        node_class = None
+        if tag in self._shared_tags and parent is not None:
+            for child_class in getattr(parent, "allowed_children", ()):
+                if child_class.tag == tag:
+                    return child_class
+
+            grandparent = parent.getparent()
+            node_class = self._context_table.get((tag, parent.tag)) or self._context_table.get(
+                (tag, parent.tag, grandparent.tag if grandparent is not None else None)
+            )
+
+        if node_class is None:
+            node_class = self._shared_tags.get(tag)
+        if node_class is None:
+            raise TagNotFound(Element(tag))
+        return node_class
+
+
+def _build_lookup_tables():
+    """
+    Builds the tables used by _NodeClassLookup.
 
-        else:
-            raise TagNotFound(element)
+    The tables are generated by walking the allowed children of each node class, starting at the root nodes.
+    Shared tags are keyed by (tag, parent tag) when the parent is enough to tell the node classes apart,
+    otherwise by (tag, parent tag, grandparent tag).
 
+    :return: A tuple with the tag table (tag -> node class), the context table (key above -> node class)
+             and the shared tags (tag -> node class used when the context is not in the table, or None).
+    """
+    from . import nodes
 
-module_parser.set_element_class_lookup(_CommentLookup(_NodeClassLookup()))
+    allowed_children = {}
+    contexts = {}
+    stack = [(nodes.NodeInfoRoot, None, None), (nodes.NodeConfigRoot, None, None)]
+    while stack:
+        node_class, parent_tag, grandparent_tag = stack.pop()
+        context = (node_class.tag, parent_tag, grandparent_tag)
+        if context in contexts:
+            contexts[context].add(node_class)
+            continue
+        contexts[context] = {node_class}
+
+        if node_class not in allowed_children:
+            allowed_children[node_class] = node_class().allowed_children
+        for child_class in allowed_children[node_class]:
+            stack.append((child_class, node_class.tag, parent_tag))
+
+    tag_classes = {}
+    parent_classes = {}
+    for (tag, parent_tag, grandparent_tag), classes in contexts.items():
+        tag_classes.setdefault(tag, set()).update(classes)
+        parent_classes.setdefault((tag, parent_tag), set()).update(classes)
+
+    tag_table = {tag: classes.pop() for tag, classes in tag_classes.items() if len(classes) == 1}
+    context_table = {}
+    for (tag, parent_tag, grandparent_tag), classes in contexts.items():
+        if tag in tag_table:
+            continue
+        if len(parent_classes[(tag, parent_tag)]) == 1:
+            context_table[(tag, parent_tag)] = next(iter(classes))
+        else:
+            context_table[(tag, parent_tag, grandparent_tag)] = next(iter(classes))
 
+    shared_tags = dict.fromkeys((tag for tag in tag_classes if tag not in tag_table), None)
+    # the wizards use placeholder parents that are not in the table to create top-level dependencies
+    shared_tags["dependencies"] = nodes.NodeConfigDependencies
+    return tag_table, context_table, shared_tags
 
-def _check_file(base_path, file_):
-    """
-    Function used to search case-insensitively for a file/folder is a given path.
 
-    :param base_path: The path to search for the file/folder in.
-    :param file_: The file/folder to search for.
-    :return: The file if found, raises an exception if not.
-    """
-    base_file = file_
-    try:
-        for item in listdir(base_path):
-            if item.casefold() == base_file.casefold():
-                return item
-        raise MissingFileError(base_file)
-    except FileNotFoundError:
-        raise MissingFileError(base_file)
+_node_class_lookup = _NodeClassLookup()
+module_parser.set_element_class_lookup(_CommentLookup(_node_class_lookup))
 
 
 def _validate_child(child):
@@ -163,13 +179,10 @@ def _validate_child(child):
     :param child: The child to check.
     :return: True if valid, False if not.
     """
-    if type(child) in child.getparent().allowed_children or child.tag is Comment:
+    parent = child.getparent()
+    if type(child) in parent.allowed_children or child.tag is Comment:
         if child.allowed_instances:
-            instances = 0
-            for item in child.getparent():
-                if type(item) == type(child):
-                    instances += 1
-            if instances <= child.allowed_instances:
+            if parent.child_count(type(child)) <= child.allowed_instances:
                 return True
         else:
             return True
@@ -180,9 +193,8 @@ def node_factory(tag, parent=None):
     """
     Function meant as a replacement for the default element factory.
 
-    Creates a tree up to the root, re-parses that tree and returns an element corresponding to the tag given.
-    This is necessary due to the way the _NodeLookup class works when checking for tags
-    (it requires parents and grandparents).
+    The node class is resolved from the tag and, for tags shared between node classes, from the parent's class
+    and then instantiated directly.
 
     :param tag: The tag to create an element from.
     :param parent: The parent of the future element.
@@ -191,27 +203,27 @@ def node_factory(tag, parent=None):
     if tag is Comment:
         from .nodes import NodeComment
         return NodeComment()
-    elif parent is not None:
-        list_ = [parent]
-        for elem in parent.iterancestors():
-            list_.append(elem)
-
-        list_ = list_[::-1]
-        list_[0] = Element(list_[0].tag)
-        for elem in list_[1:]:
-            list_[list_.index(elem)] = SubElement(list_[list_.index(elem) - 1], elem.tag)
-        SubElement(list_[len(list_) - 1], tag)
-
-        root = fromstring(tostring(list_[0]), module_parser)
-        parsed_list = []
-        for elem in root.iterdescendants():
-            parsed_list.append(elem)
-        return parsed_list[len(parsed_list) - 1]
-    else:
-        return module_parser.makeelement(tag)
+    return _node_class_lookup.resolve(tag, parent)()
 
 
 def copy_node(node, parent=None):
+    """
+    Copies *node* and all of its children into new nodes.
+
+    :param node: The node to copy, plain elements are also accepted.
+    :param parent: Optional. The parent the copy is meant for, used to resolve the copy's node class.
+                   Defaults to the node's parent.
+    :return: The copied node.
+    """
+    from .nodes import flush_metadata
+
+    if node.tag is Comment:
+        result = node_factory(Comment)
+        result.text = node.text
+        result.parse_attribs()
+        return result
+
+    flush_metadata()
     if parent is None:
         parent = node.getparent()
     result = node_factory(node.tag, parent)
@@ -219,51 +231,139 @@ def copy_node(node, parent=None):
     for key in node.keys():
         result.set(key, node.get(key))
     result.parse_attribs()
-    for child in node:
-        if child.tag is Comment:
-            result.append(CommentBase(child.text))
-        else:
-            new_child = copy_node(child)
-            result.add_child(new_child)
+    children = [copy_node(child, result) for child in node]
+    result.add_children(children, load_metadata=False)
     result.load_metadata()
     return result
 
 
-def import_(package_path):
+class _ImportProgress(object):
+    """
+    Keeps track of an import's progress and reports it through *callback*.
+
+    Shared by the files being imported at the same time, the counters are guarded by a lock.
+
+    :param callback: Called as callback(bytes_read, total_bytes, elements) every time the parser reads a chunk.
+    :param total_bytes: The size of all the files being imported.
+    """
+    def __init__(self, callback, total_bytes):
+        self.callback = callback
+        self.total_bytes = total_bytes
+        self.bytes_read = 0
+        self.elements = 0
+        self.lock = Lock()
+
+    def add_element(self):
+        with self.lock:
+            self.elements += 1
+
+    def open(self, path):
+        """
+        :return: A file-like object for *path* that reports every read.
+        """
+        progress = self
+
+        class _ProgressFile(object):
+            def __init__(self):
+                self.file = open(path, "rb")
+
+            def read(self, size=-1):
+                data = self.file.read(size)
+                with progress.lock:
+                    progress.bytes_read += len(data)
+                    if progress.callback is not None:
+                        progress.callback(progress.bytes_read, progress.total_bytes, progress.elements)
+                return data
+
+            def close(self):
+                self.file.close()
+
+        return _ProgressFile()
+
+
+def _stream_import(path, progress, cancel=None, lazy_hidden=False):
+    """
+    Parses the file at *path* and processes each node as soon as the parser is done with it.
+
+    Each node's python proxy is created when it starts and kept alive for as long as the root is (see NodeRegistry),
+    their comments, properties, children and metadata are processed when they end.
+
+    :param path: The path to the installer file.
+    :param progress: The _ImportProgress to report to.
+    :param cancel: Optional. A threading.Event, CancelledError is raised as soon as it is set.
+    :param lazy_hidden: Optional. Whether the hidden nodes are left serialized, see _NodeElement.load_metadata.
+    :return: The root node.
+    """
+    source = progress.open(path)
+    try:
+        # comments are handled with their parent, lxml's comment events would tie the root to its document's parser
+        # for good and the document could never be freed (see NodeRegistry)
+        context = iterparse(source, events=("start", "end"), remove_blank_text=True, remove_pis=True)
+        context.set_element_class_lookup(_CommentLookup(_node_class_lookup))
+
+        root = None
+        for event, element in context:
+            if cancel is not None and cancel.is_set():
+                raise CancelledError()
+
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+
+            for child in element:
+                if child.tag is Comment:
+                    child.parse_attribs()
+                    child.write_attribs()
+            element.parse_attribs()
+            for child in list(element):
+                if not _validate_child(child):
+                    element.remove_child(child)
+            element.write_attribs()
+            element.load_metadata(lazy_hidden)
+            element.sort()
+            progress.add_element()
+
+        return root
+    finally:
+        source.close()
+
+
+def import_(package_path, progress=None, cancel=None, index=None, lazy_hidden=False):
     """
     Function used to import an existing installer from *package_path*.
 
-    Raises ``ParserError`` if the lxml parser could not read a file.
+    Both files are streamed through the parser at the same time and each node is built as soon as it is parsed.
+    Safe to call from a worker thread - the nodes are only handed back once they are complete.
+
+    Raises ``ParserError`` if the lxml parser could not read a file and ``CancelledError`` if *cancel* was set.
 
     :param package_path: The package where the installer is.
+    :param progress: Optional. Called as progress(bytes_read, total_bytes, elements) while the files are parsed.
+    :param cancel: Optional. A threading.Event that cancels the import when set.
+    :param index: Optional. The package's PackageIndex, used to find the installer files.
+    :param lazy_hidden: Optional. Whether the hidden nodes are left serialized until restore_hidden is called on
+                        their parent.
     :return: The root elements of each installer file. A tuple of None, None if any file is missing.
     """
+    if index is None:
+        index = PackageIndex(package_path)
     try:
-        fomod_folder = _check_file(package_path, "fomod")
+        fomod_folder = index.find("", "fomod")
         fomod_folder_path = join(package_path, fomod_folder)
 
-        info_file = _check_file(fomod_folder_path, "Info.xml")
-        config_file = _check_file(fomod_folder_path, "ModuleConfig.xml")
+        info_file = index.find(fomod_folder, "Info.xml")
+        config_file = index.find(fomod_folder, "ModuleConfig.xml")
 
         info_path = join(fomod_folder_path, info_file)
         config_path = join(fomod_folder_path, config_file)
 
-        info_root = parse(info_path, parser=module_parser).getroot()
-        config_root = parse(config_path, parser=module_parser).getroot()
-
-        for root in (info_root, config_root):
-            root.sort()
-            root.model_item.sortChildren(0)
-            for element in root.iter():
-                element.parse_attribs()
-
-                for elem in element:
-                    element.model_item.appendRow(elem.model_item)
-                    if not _validate_child(elem):
-                        element.remove_child(elem)
-
-                element.write_attribs()
-                element.load_metadata()
+        import_progress = _ImportProgress(progress, getsize(info_path) + getsize(config_path))
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            info_future = executor.submit(_stream_import, info_path, import_progress, cancel, lazy_hidden)
+            config_future = executor.submit(_stream_import, config_path, import_progress, cancel, lazy_hidden)
+            info_root = info_future.result()
+            config_root = config_future.result()
 
     except ParseError as e:
         raise ParserError(str(e))
@@ -285,51 +385,110 @@ def new():
     return info_root, config_root
 
 
-def export(info_root, config_root, package_path):
+def _serialize(root):
+    """
+    Serializes *root*'s document, without its hidden nodes, as it would be saved to an installer file.
+
+    The serialization is done on a plain copy of the document so the live tree is never touched.
+
+    :param root: The root element to serialize.
+    :return: The serialized document as bytes.
+    """
+    tree = root.getroottree()
+    hidden_paths = [tree.getpath(hidden_node)
+                    for node in root.iter() if getattr(node, "hidden_children", None)
+                    for hidden_node in node.hidden_children]
+
+    copy = fromstring(tostring(tree), _export_parser).getroottree()
+    # the hidden nodes are looked up first, removing them while resolving the paths would shift their positions
+    for hidden_node in [copy.xpath(path)[0] for path in hidden_paths]:
+        hidden_node.getparent().remove(hidden_node)
+
+    buffer = BytesIO()
+    copy.write(buffer, pretty_print=True)
+    return buffer.getvalue()
+
+
+def _file_hash(path):
+    """
+    :return: The sha256 digest of the file at *path* or None if it doesn't exist.
+    """
+    if not isfile(path):
+        return None
+    digest = sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(65536), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _write_atomic(path, data):
+    """
+    Writes *data* to a temporary file next to *path* and then renames it over *path*,
+    so the file at *path* is either the old or the new version, never a partial one.
+
+    :param path: The file to write.
+    :param data: The bytes to write.
+    """
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            fsync(temp_file.fileno())
+        if isfile(path):
+            copymode(path, temp_path)
+        replace(temp_path, path)
+    except BaseException:
+        if isfile(temp_path):
+            remove(temp_path)
+        raise
+
+
+def export(info_root, config_root, package_path, index=None):
     """
     Exports the root elements and saves them to installer files.
 
+    Hidden nodes are left out of the files. Files whose contents would not change are not written
+    and the others are replaced atomically.
+
     :param info_root: The root element of the info.xml file.
     :param config_root: The root element of the moduleconfig.xml file.
     :param package_path: The path to save the files to.
-    :param hidden_nodes: The currently hidden nodes in either tree.
+    :param index: Optional. The package's PackageIndex, used to find the installer files and kept up to date.
+    :return: The paths of the files that were written.
     """
-    hidden_nodes_pairs = []
-    for root in (info_root, config_root):
-        for node in root:
-            if node.hidden_children:
-                for hidden_node in node.hidden_children:
-                    hidden_nodes_pairs.append((node, hidden_node, node.index(hidden_node)))
-                    node.remove(hidden_node)
-
+    if index is None:
+        index = PackageIndex(package_path)
     try:
-        fomod_folder = _check_file(package_path, "fomod")
+        fomod_folder = index.find("", "fomod")
     except MissingFileError as e:
         makedirs(join(package_path, e.file))
-        fomod_folder = join(package_path, e.file)
+        index.invalidate("")
+        fomod_folder = e.file
 
     fomod_folder_path = join(package_path, fomod_folder)
 
     try:
-        info_file = _check_file(fomod_folder_path, "Info.xml")
+        info_file = index.find(fomod_folder, "Info.xml")
     except MissingFileError as e:
         info_file = e.file
 
     try:
-        config_file = _check_file(fomod_folder_path, "ModuleConfig.xml")
+        config_file = index.find(fomod_folder, "ModuleConfig.xml")
     except MissingFileError as e:
         config_file = e.file
 
-    info_path = join(fomod_folder_path, info_file)
-    config_path = join(fomod_folder_path, config_file)
-
-    with open(info_path, "wb") as infofile:
-        info_tree = ElementTree(info_root)
-        info_tree.write(infofile, pretty_print=True)
-
-    with open(config_path, "wb") as configfile:
-        config_tree = ElementTree(config_root)
-        config_tree.write(configfile, pretty_print=True)
-
-    for pair in hidden_nodes_pairs:
-        pair[0].insert(pair[2], pair[1])
+    from .nodes import flush_metadata
+
+    flush_metadata()
+    written = []
+    for root, file_name in ((info_root, info_file), (config_root, config_file)):
+        path = join(fomod_folder_path, file_name)
+        data = _serialize(root)
+        if _file_hash(path) != sha256(data).digest():
+            _write_atomic(path, data)
+            written.append(path)
+    if written:
+        index.invalidate(fomod_folder)
+    return written
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The Qt presentation of the nodes - the node tree's items.
+
+Only imported once something asks a node for its model_item, so the core (io, nodes, props) runs without Qt.
+"""
+
+from PyQt5.QtGui import QStandardItem
+from PyQt5.QtCore import Qt
+from lxml.etree import Comment
+
+#: The item data role holding the node's sort key. Set it as the model's sort role so sorting stays in C++.
+SORT_ROLE = Qt.UserRole + 1
+
+
+class NodeStandardItem(QStandardItem):
+    """
+    A Standard Item but with an added reference to a xml node.
+
+    Items are compared through SORT_ROLE, which only applies inside a model whose sortRole is SORT_ROLE.
+    """
+    def __init__(self, node):
+        self.xml_node = node
+        super().__init__()
+        self.update_sort_key()
+
+    def update_sort_key(self):
+        """
+        Copies the node's sort key into SORT_ROLE, packed into a single int.
+
+        The model's signals are blocked meanwhile - the key isn't something the user changed, so it must not go
+        through itemChanged (that saves the metadata and refreshes the previews).
+        """
+        sort_order, user_sort_order = self.xml_node.sort_key
+        model = self.model()
+        blocked = model.blockSignals(True) if model is not None else False
+        try:
+            self.setData((sort_order << 32) + user_sort_order, SORT_ROLE)
+        finally:
+            if model is not None:
+                model.blockSignals(blocked)
+
+
+def hidden_colour(hidden):
+    """
+    :return: The colour for an item whose node is (or isn't) hidden.
+    """
+    return Qt.green if hidden else Qt.black
+
+
+def create_item(node):
+    """
+    Creates the item for *node* along with the items of all its displayed children.
+
+    :param node: The node to create the item for.
+    :return: The new NodeStandardItem.
+    """
+    item = NodeStandardItem(node)
+    item.setText(node.item_text)
+    if node.tag is Comment:
+        item.setForeground(Qt.blue)
+        item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsDragEnabled | Qt.ItemIsEnabled)
+        return item
+
+    if node.allowed_instances > 1 or not node.allowed_instances:
+        item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsDragEnabled | Qt.ItemIsEnabled | Qt.ItemIsEditable)
+    else:
+        item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsDropEnabled | Qt.ItemIsEnabled | Qt.ItemIsEditable)
+    item.setEditable(node.name_editable)
+    if node.is_hidden:
+        item.setForeground(hidden_colour(True))
+
+    for child in node:
+        if not child.is_metadata_comment():
+            item.appendRow(child.model_item)
+    return item
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The codec for the designer's metadata, kept in a comment under the node it belongs to.
+
+The payload is a json object with a "version" field - comments written before the field existed are version 0 and
+read the same way.
+"""
+
+from json import dumps, loads
+from functools import lru_cache
+from collections import OrderedDict
+
+#: The start of every metadata comment.
+METADATA_PREFIX = "<designer.metadata.do.not.edit>"
+#: The version written with new metadata.
+METADATA_VERSION = 1
+
+
+def is_metadata_text(text):
+    """
+    :return: True if *text* is the text of a metadata comment.
+    """
+    return text is not None and text.startswith(METADATA_PREFIX)
+
+
+@lru_cache(maxsize=4096)
+def _decode_text(text):
+    """
+    Decodes the comment text, shared by every call with the same text - never hand the result out directly.
+
+    :return: The decoded dict or None if the text isn't valid metadata.
+    """
+    parts = text.split(maxsplit=1)
+    if len(parts) < 2 or parts[0] != METADATA_PREFIX:
+        return None
+    try:
+        metadata = loads(parts[1])
+    except ValueError:
+        return None
+    if not isinstance(metadata, dict):
+        return None
+    metadata.pop("version", None)
+    return metadata
+
+
+def decode_metadata(text):
+    """
+    Decodes the text of a metadata comment. The same text is only ever parsed once.
+
+    :param text: The comment's text, prefix included.
+    :return: A new dict with the metadata (without the version) or None if the text isn't valid metadata.
+    """
+    metadata = _decode_text(text)
+    if metadata is None:
+        return None
+    return {key: list(value) if isinstance(value, list) else value for key, value in metadata.items()}
+
+
+def encode_metadata(metadata):
+    """
+    :param metadata: The metadata dict, only json types are allowed.
+    :return: The text of the metadata comment, prefix included.
+    """
+    payload = OrderedDict([("version", METADATA_VERSION)])
+    payload.update(metadata)
+    return METADATA_PREFIX + " " + dumps(payload, separators=(",", ":"))
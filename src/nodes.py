@@ -15,54 +15,329 @@
 # limitations under the License.
 
 from os import sep
-from collections import OrderedDict
-from PyQt5.QtGui import QStandardItem
-from PyQt5.QtCore import Qt
+from collections import OrderedDict, Counter, namedtuple
+from operator import attrgetter
+from functools import lru_cache
+from types import MappingProxyType
+from threading import Lock, RLock
+from weakref import ref
 from lxml import etree, objectify
-from jsonpickle import encode, decode, set_encoder_options
-from json import JSONDecodeError
-from .io import copy_node
-from .wizards import WizardFiles, WizardDepend
+from .io import copy_node, module_parser
 from .props import PropertyCombo, PropertyInt, PropertyText, PropertyFile, PropertyFolder, PropertyColour, \
-    PropertyFlagLabel, PropertyFlagValue, PropertyHTML
+    PropertyFlagLabel, PropertyFlagValue, PropertyHTML, BoundProperties
 from .exceptions import BaseInstanceException
+from .metadata import is_metadata_text, decode_metadata, encode_metadata
 
+_by_sort_key = attrgetter("sort_key")
+_NO_USER_SORT = "0".zfill(7)
+#: The metadata of every node that has none, save_metadata replaces it instead of changing it.
+_NO_METADATA = MappingProxyType({})
+_NO_PROPERTIES = MappingProxyType(OrderedDict())
+#: The nodes whose metadata changed since the last flush_metadata, in the order they changed.
+_pending_metadata = OrderedDict()
+_pending_metadata_lock = Lock()
 
-class NodeComment(etree.CommentBase):
+
+def flush_metadata():
+    """
+    Writes the metadata of every node marked with mark_metadata_dirty into its comment, in one pass.
+
+    Has to run before anything reads the metadata comments - exporting, serializing for the previews or copying.
+
+    :return: The number of nodes whose metadata was written.
+    """
+    with _pending_metadata_lock:
+        nodes = list(_pending_metadata)
+        _pending_metadata.clear()
+    for node in nodes:
+        if node._metadata_dirty:
+            node.save_metadata()
+    return len(nodes)
+
+
+@lru_cache(maxsize=1024)
+def _make_sort_key(sort_order, user_sort_order):
+    """
+    :return: The sort key for the given orders - a tuple of ints, an order that isn't a number counts as 0.
+    """
+    key = []
+    for order in (sort_order, user_sort_order):
+        try:
+            key.append(int(order))
+        except ValueError:
+            key.append(0)
+    return tuple(key)
+
+
+#: The parts of a node type that are the same for all of its nodes, built once per type - see _node_schema.
+_NodeSchema = namedtuple("_NodeSchema", [
+    "name",
+    "allowed_instances",
+    "sort_order",
+    "allowed_children",
+    "required_children",
+    "either_children_group",
+    "at_least_one_children_group",
+    "wizard",
+    "name_editable",
+    "properties",
+    "property_index",
+    "property_defaults",
+])
+
+
+def _node_schema(name, allowed_instances,
+                 sort_order="0",
+                 allowed_children=None,
+                 properties=None,
+                 wizard=None,
+                 required_children=None,
+                 either_children_group=None,
+                 at_least_one_children_group=None,
+                 name_editable=False,
+                 ):
+    """
+    :return: The _NodeSchema of a node type, the properties are declared here and every node only keeps their values.
+    """
+    properties = properties or _NO_PROPERTIES
+    return _NodeSchema(
+        name,
+        allowed_instances,
+        sort_order,
+        allowed_children or (),
+        required_children or (),
+        either_children_group or (),
+        at_least_one_children_group or (),
+        wizard,
+        name_editable,
+        properties,
+        {key: index for index, key in enumerate(properties)},
+        tuple(prop.default for prop in properties.values()),
+    )
+
+
+def _schema_field(field):
+    """
+    :return: A read-only property for *field* of the node type's schema.
+    """
+    return property(attrgetter("_schema." + field), doc="The node type's {} - see _NodeSchema.".format(field))
+
+
+class NodeRegistry(object):
+    """
+    Keeps exactly one live python proxy per node and counts how many proxies are created and released.
+
+    lxml drops a node's proxy, and all the state kept in it, once nothing references it - the next access builds a new
+    proxy and runs _init again. To prevent that, the registry keeps the proxies of every document, keyed by the
+    document's root, for as long as that root is referenced - a document is in use through its root. The roots
+    themselves are only referenced weakly and nodes never reference each other: once a root is no longer used its
+    document's proxies are freed right away, without waiting for the garbage collector.
+
+    The counters show the churn: on a tree that's kept alive properly *created* only grows with new nodes and
+    *released* only with discarded ones.
+    """
+    def __init__(self):
+        self.created = Counter()
+        self.released = Counter()
+        self._baseline = 0
+        self._documents = {}
+        # collections can free nodes, and call release, while the lock is held
+        self._lock = RLock()
+
+    def register(self, node):
+        """
+        Called from every node's _init. Counts the new proxy and keeps it for as long as its document's root is used.
+
+        :param node: The node whose proxy was just created.
+        """
+        root = node.getroottree().getroot()
+        with self._lock:
+            self.created[type(node)] += 1
+            # a comment of its own has no root element, it's its own document's root
+            if root is None or root is node:
+                self._nodes_of(node)
+            else:
+                self._nodes_of(root).append(node)
+
+    def adopt(self, node):
+        """
+        Called once *node* was added to another node. If *node* was the root of its own document - a new node or a
+        copy - it and the proxies kept for its document are now kept for its parent's document.
+
+        :param node: The node that was added.
+        """
+        with self._lock:
+            document = self._documents.pop(id(node), None)
+            if document is not None:
+                nodes = document[1]
+                nodes.append(node)
+                self._nodes_of(node.getroottree().getroot()).extend(nodes)
+
+    def _nodes_of(self, root):
+        """
+        :return: The list of nodes kept alive for as long as *root* is, *root* itself is only referenced weakly.
+        """
+        key = id(root)
+        document = self._documents.get(key)
+        if document is None:
+            # an id is only reused once its object is freed, by then the callback dropped the key
+            document = self._documents[key] = (ref(root, lambda _: self._documents.pop(key, None)), [])
+        return document[1]
+
+    def release(self, node):
+        """
+        Called when a node's proxy is freed.
+
+        :param node: The node being freed.
+        """
+        with self._lock:
+            self.released[type(node)] += 1
+
+    def stats(self):
+        """
+        :return: A dict with the total of proxies created and released and the number of live ones.
+        """
+        with self._lock:
+            created = sum(self.created.values())
+            released = sum(self.released.values())
+        return {"created": created, "released": released, "live": self._baseline + created - released}
+
+    def reset(self):
+        """
+        Resets the counters. The proxies alive at this point are carried over to the live count, they may still be
+        released later.
+        """
+        with self._lock:
+            self._baseline += sum(self.created.values()) - sum(self.released.values())
+            self.created.clear()
+            self.released.clear()
+
+
+#: The registry every node is registered with.
+node_registry = NodeRegistry()
+
+
+class _NodeMeta(type):
+    """
+    Gives every node class an empty __slots__ unless it defines its own, so no node carries a __dict__.
+    """
+    def __new__(mcs, name, bases, namespace):
+        namespace.setdefault("__slots__", ())
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class _NodeItemMixin(object):
+    """
+    The parts of a node that deal with its item in the node tree.
+
+    The item is only created the first time model_item is used so nodes that never reach the gui never load Qt.
+    Until then, everything that would change the item is kept in the node and applied when the item is created.
+    """
+    __slots__ = ()
+
+    @property
+    def properties(self):
+        """
+        This node's properties by key - see BoundProperties.
+        """
+        schema = self._schema
+        return BoundProperties(self, schema.properties, schema.property_index)
+
+    def value_of(self, key):
+        """
+        :return: The value of this node's property *key*, without binding the property.
+        """
+        return self.property_values[self._schema.property_index[key]]
+
+    def set_property_value(self, index, value):
+        """
+        Sets the value of this node's property at *index*.
+
+        Nodes start out sharing their type's default values, their own copy is only made once a value changes.
+        """
+        values = self.property_values
+        if values[index] == value:
+            return
+        if type(values) is tuple:
+            values = self.property_values = list(values)
+        values[index] = value
+
+    @property
+    def model_item(self):
+        """
+        This node's item in the node tree, created along with its children's items on first use.
+        """
+        if self._model_item is None:
+            from .items import create_item
+            self._model_item = create_item(self)
+        return self._model_item
+
+    def set_item_text(self, text):
+        """
+        Sets the text displayed in this node's item.
+
+        :param text: The text to display.
+        """
+        self.item_text = text
+        if self._model_item is not None:
+            self._model_item.setText(text)
+
+    def is_metadata_comment(self):
+        """
+        :return: True if this node is a comment that holds its parent's metadata - these are never displayed.
+        """
+        return False
+
+    def __del__(self):
+        # proxies whose _init failed, like a bare _NodeElement, were never registered
+        if hasattr(self, "property_values"):
+            node_registry.release(self)
+
+
+class NodeComment(_NodeItemMixin, etree.CommentBase):
     """
     The base class for all comment nodes.
     """
+    PARSER = module_parser
+
+    _schema = _node_schema("Comment", 0, properties=OrderedDict([("<node_text>", PropertyText("Comment"))]))
+    name = _schema_field("name")
+    allowed_instances = _schema_field("allowed_instances")
+    allowed_children = _schema_field("allowed_children")
+    wizard = None
+    sort_order = "0"
+    user_sort_order = _NO_USER_SORT
+    sort_key = _make_sort_key(sort_order, user_sort_order)
+    forbidden_sequences = ("<!- -", "- ->", "--")
+
     def __init__(self, text=""):
         super(NodeComment, self).__init__(text)
 
     def _init(self):
         super()._init()
-        self.sort_order = "0"
-        self.user_sort_order = "0".zfill(7)
-        self.allowed_children = ()
-        self.allowed_instances = 0
-        self.wizard = None
-        self.name = "Comment"
         self.is_hidden = False
-        self.forbidden_sequences = ["<!- -", "- ->", "--"]
-        self.properties = {"<node_text>": PropertyText("Comment")}
-        self.model_item = NodeStandardItem(self)
-        self.model_item.setForeground(Qt.blue)
+        self.property_values = self._schema.property_defaults
+        self._model_item = None
+        self.item_text = self.name
         self.update_item_name()
+        node_registry.register(self)
 
     def update_item_name(self):
-        self.model_item.setText(self.name) if not self.text else self.model_item.setText(self.text[:40])
+        self.set_item_text(self.name) if not self.text else self.set_item_text(self.text[:40])
+
+    def is_metadata_comment(self):
+        return is_metadata_text(self.text)
 
     def parse_attribs(self):
-        self.properties["<node_text>"].set_value(self.text)
+        self.set_property_value(0, self.text)
         self.update_item_name()
 
     def write_attribs(self):
-        self.text = self.properties["<node_text>"].value
-        if self.text.startswith("<designer.metadata.do.not.edit>"):
-            self.getparent().model_item.takeRow(self.model_item.row())
-        else:
-            self.model_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsDragEnabled | Qt.ItemIsEnabled)
+        self.text = self.property_values[0]
+        if self.is_metadata_comment():
+            parent = self.getparent()
+            if self._model_item is not None and parent._model_item is not None:
+                parent._model_item.takeRow(self._model_item.row())
 
     def load_metadata(self):
         pass
@@ -70,63 +345,195 @@ class NodeComment(etree.CommentBase):
     def save_metadata(self):
         pass
 
+    def mark_metadata_dirty(self):
+        pass
+
     def sort(self):
         pass
 
 
-class _NodeElement(etree.ElementBase):
+class _NodeElement(_NodeItemMixin, etree.ElementBase, metaclass=_NodeMeta):
     """
     The base class for all nodes. Should never be instantiated directly.
-    """
+
+    What every node of a type shares lives in the type's _NodeSchema, built once by the type's _define_schema - the
+    nodes only keep their own state in slots.
+    """
+    __slots__ = (
+        "property_values",
+        "hidden_children",
+        "_hidden_payloads",
+        "is_hidden",
+        "metadata",
+        "_sort_order",
+        "_user_sort_order",
+        "sort_key",
+        "_child_counts",
+        "_sort_dirty",
+        "_dirty_descendants",
+        "_model_item",
+        "item_text",
+        "_metadata_dirty",
+        "_document_index",
+        "__weakref__",
+    )
+
+    _schema = None
+    name = _schema_field("name")
+    allowed_instances = _schema_field("allowed_instances")
+    allowed_children = _schema_field("allowed_children")
+    required_children = _schema_field("required_children")
+    either_children_group = _schema_field("either_children_group")
+    at_least_one_children_group = _schema_field("at_least_one_children_group")
+    _wizard = _schema_field("wizard")
+    name_editable = _schema_field("name_editable")
+
+    #: Nodes created directly (as opposed to parsed) belong to the module parser's documents.
+    PARSER = module_parser
+
+    @property
+    def TAG(self):
+        """
+        The tag lxml uses when a node is created directly, each subclass defines its own *tag*.
+        """
+        tag = type(self).tag
+        return tag if isinstance(tag, str) else type(self).__name__
+
+    @classmethod
+    def _define_schema(cls):
+        """
+        Each subclass declares its type here, see _node_schema. Only called for the first node of a type.
+
+        :return: The type's _NodeSchema.
+        """
+        raise NotImplementedError
+
     def _init(self):
-        if type(self) is _NodeElement:
+        cls = type(self)
+        if cls is _NodeElement:
             raise BaseInstanceException(self)
+        schema = cls.__dict__.get("_schema")
+        if schema is None:
+            schema = cls._schema = cls._define_schema()
+
+        self._sort_order = schema.sort_order
+        self.property_values = schema.property_defaults
+        # most nodes never get hidden children, these are only allocated once needed
+        self.hidden_children = ()
+        self._hidden_payloads = ()
+        self.is_hidden = False
+        self.metadata = _NO_METADATA
+        self._user_sort_order = _NO_USER_SORT
+        self.sort_key = _make_sort_key(self._sort_order, self._user_sort_order)
+        self._child_counts = None
+        self._metadata_dirty = False
+        self._document_index = None
+        # a new proxy knows nothing about its children's order, so it starts out needing a sort
+        self._sort_dirty = True
+        self._dirty_descendants = True
+
+        self._model_item = None
+        self.item_text = schema.name
         super()._init()
+        node_registry.register(self)
+        self._mark_dirty_ancestors()
 
-    def init(self, name, tag, allowed_instances,
-             sort_order="0",
-             allowed_children=None,
-             properties=None,
-             wizard=None,
-             required_children=None,
-             either_children_group=None,
-             at_least_one_children_group=None,
-             name_editable=False,
-             ):
-
-        if not properties:
-            properties = OrderedDict()
-        if not allowed_children:
-            allowed_children = ()
-        if not required_children:
-            required_children = ()
-        if not either_children_group:
-            either_children_group = ()
-        if not at_least_one_children_group:
-            at_least_one_children_group = ()
-
-        self.name = name
-        self.tag = tag
-        self.sort_order = sort_order
-        self.properties = properties
-        self.allowed_children = allowed_children
-        self.required_children = required_children
-        self.either_children_group = either_children_group
-        self.at_least_one_children_group = at_least_one_children_group
-        self.hidden_children = []
-        self.is_hidden = False
-        self.allowed_instances = allowed_instances
-        self.wizard = wizard
-        self.metadata = {}
-        self.user_sort_order = "0".zfill(7)
-
-        self.model_item = NodeStandardItem(self)
-        self.model_item.setText(self.name)
-        if allowed_instances > 1 or not allowed_instances:
-            self.model_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsDragEnabled | Qt.ItemIsEnabled | Qt.ItemIsEditable)
-        else:
-            self.model_item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsDropEnabled | Qt.ItemIsEnabled | Qt.ItemIsEditable)
-        self.model_item.setEditable(name_editable)
+    @property
+    def wizard(self):
+        """
+        The wizard class for this node or None. The wizards need Qt so they're only imported when asked for.
+        """
+        if self._wizard is None:
+            return None
+        from . import wizards
+        return getattr(wizards, self._wizard)
+
+    @property
+    def sort_order(self):
+        """
+        The order of this node's type among its siblings' types.
+        """
+        return self._sort_order
+
+    @sort_order.setter
+    def sort_order(self, value):
+        if value == self._sort_order:
+            return
+        self._sort_order = value
+        self._update_sort_key()
+
+    @property
+    def user_sort_order(self):
+        """
+        The order the user gave this node among its siblings, as a zero-padded string.
+        """
+        return self._user_sort_order
+
+    @user_sort_order.setter
+    def user_sort_order(self, value):
+        if value == self._user_sort_order:
+            return
+        self._user_sort_order = value
+        self._update_sort_key()
+
+    def _update_sort_key(self):
+        """
+        Recomputes the cached sort_key after one of the orders changed, which leaves the parent out of order.
+        """
+        self.sort_key = _make_sort_key(self._sort_order, self._user_sort_order)
+        if self._model_item is not None:
+            self._model_item.update_sort_key()
+        parent = self.getparent()
+        if parent is not None:
+            parent.mark_sort_dirty()
+
+    def mark_sort_dirty(self):
+        """
+        Marks this node's children as out of order and lets its ancestors know there's something to sort below them.
+        """
+        self._sort_dirty = True
+        self._mark_dirty_ancestors()
+
+    def _mark_dirty_ancestors(self):
+        node = self.getparent()
+        while node is not None and not node._dirty_descendants:
+            node._dirty_descendants = True
+            node = node.getparent()
+
+    def child_count(self, child_type):
+        """
+        Counts this node's children of a given type.
+
+        The counts are gathered in a single pass the first time they're needed and kept up to date afterwards
+        by add_child, remove_child and update_child_count.
+
+        :param child_type: The node class to count.
+        :return: The number of children of type child_type.
+        """
+        if self._child_counts is None:
+            self._child_counts = Counter(type(child) for child in self)
+        return self._child_counts[child_type]
+
+    def update_child_count(self, child, delta):
+        """
+        Updates the child counts after a child was appended to or removed from this node without
+        going through add_child or remove_child.
+
+        Also lets the node registry know about the added child, which keeps its python state alive.
+
+        :param child: The child that was added or removed.
+        :param delta: 1 if the child was added, -1 if it was removed.
+        """
+        index = self.find_document_index()
+        if delta > 0:
+            node_registry.adopt(child)
+            self.mark_sort_dirty()
+            if index is not None:
+                index.add_subtree(child)
+        elif index is not None:
+            index.remove_subtree(child)
+        if self._child_counts is not None:
+            self._child_counts[type(child)] += delta
 
     def can_add_child(self, child):
         """
@@ -136,11 +543,7 @@ class _NodeElement(etree.ElementBase):
         :return: True if possible, False if not.
         """
         if child.allowed_instances:
-            instances = 0
-            for item in self:
-                if type(item) == type(child):
-                    instances += 1
-            if instances >= child.allowed_instances:
+            if self.child_count(type(child)) >= child.allowed_instances:
                 return False
         if type(child) in self.allowed_children or child.tag is etree.Comment:
             return True
@@ -154,48 +557,128 @@ class _NodeElement(etree.ElementBase):
         """
         if self.can_add_child(child):
             self.append(child)
-            self.model_item.appendRow(child.model_item)
+            self.update_child_count(child, 1)
+            if self._model_item is not None and not child.is_metadata_comment():
+                self._model_item.appendRow(child.model_item)
             child.write_attribs()
             child.load_metadata()
 
+    def add_children(self, children, load_metadata=True):
+        """
+        Adds several children at once, the bulk version of add_child. Children that can't be added are skipped.
+
+        The instance limits are checked once for the whole batch, the children are inserted with a single lxml call
+        and their items are inserted into the node tree as one block of rows. Metadata is only loaded once every
+        child is in place.
+
+        :param children: The children to add, in order.
+        :param load_metadata: Optional. Whether the children's metadata is loaded - turn it off for children that
+                              already loaded it, like the ones from copy_node.
+        :return: The list of children that were added.
+        """
+        added = []
+        if type(self).can_add_child is _NodeElement.can_add_child:
+            pending = Counter()
+            for child in children:
+                child_type = type(child)
+                if child.tag is not etree.Comment and child_type not in self.allowed_children:
+                    continue
+                if child.allowed_instances and \
+                        self.child_count(child_type) + pending[child_type] >= child.allowed_instances:
+                    continue
+                pending[child_type] += 1
+                added.append(child)
+            self.extend(added)
+            index = self.find_document_index()
+            for child in added:
+                node_registry.adopt(child)
+                if index is not None:
+                    index.add_subtree(child)
+            if self._child_counts is not None:
+                self._child_counts.update(pending)
+            if added:
+                self.mark_sort_dirty()
+        else:
+            # subclasses with their own rules are checked child by child
+            for child in children:
+                if self.can_add_child(child):
+                    self.append(child)
+                    self.update_child_count(child, 1)
+                    added.append(child)
+
+        if self._model_item is not None:
+            rows = [child.model_item for child in added if not child.is_metadata_comment()]
+            if rows:
+                self._model_item.appendRows(rows)
+        for child in added:
+            child.write_attribs()
+        if load_metadata:
+            for child in added:
+                child.load_metadata()
+        return added
+
     def remove_child(self, child):
         """
         Removes the given child from this node.
 
         :param child: The child to remove.
         """
-        if child in self:
-            self.model_item.takeRow(child.model_item.row())
+        if child.getparent() is self:
+            if self._model_item is not None and child._model_item is not None:
+                self._model_item.takeRow(child._model_item.row())
             self.remove(child)
+            self.update_child_count(child, -1)
 
     def set_hidden(self, hide: bool):
+        self._set_hidden(hide)
+        self.getparent().mark_metadata_dirty()
+
+    def _set_hidden(self, hide):
+        """
+        Hides or shows this node without saving its parent's metadata.
+        """
         self.is_hidden = hide
+        if self._model_item is not None:
+            from .items import hidden_colour
+            self._model_item.setForeground(hidden_colour(hide))
+        parent = self.getparent()
         if hide:
-            self.model_item.setForeground(Qt.green)
-            self.getparent().hidden_children.append(self)
+            if not parent.hidden_children:
+                parent.hidden_children = []
+            parent.hidden_children.append(self)
         else:
-            self.model_item.setForeground(Qt.black)
-            self.getparent().hidden_children.remove(self)
-        self.getparent().save_metadata()
+            parent.hidden_children.remove(self)
 
     def sort(self):
-        for parent in self.xpath('//*[./*]'):
-            parent[:] = sorted(
-                parent,
-                key=lambda x: x.sort_order + "." + x.user_sort_order
-            )
+        """
+        Sorts this node's subtree.
+
+        Only the nodes marked by mark_sort_dirty (and the paths to them) are visited - sorting a clean tree is free.
+        """
+        if not self._sort_dirty and not self._dirty_descendants:
+            return
+        if self._sort_dirty:
+            self[:] = sorted(self, key=_by_sort_key)
+        self._sort_dirty = False
+        self._dirty_descendants = False
+        for child in self:
+            if getattr(child, "_sort_dirty", False) or getattr(child, "_dirty_descendants", False):
+                child.sort()
 
     def parse_attribs(self):
         """
         Reads the values from the BaseElement's attrib dictionary into the node's properties.
         """
-        for key in self.properties:
+        attrib = self.attrib
+        for index, (key, prop) in enumerate(self._schema.properties.items()):
             if key == "<node_text>":
-                self.properties[key].set_value(self.text)
-                continue
-            if key not in self.attrib.keys():
+                value = self.text
+            elif key in attrib:
+                value = attrib[key]
+            else:
                 continue
-            self.properties[key].set_value(self.attrib[key])
+            if prop.accepts(value):
+                self.set_property_value(index, value)
         self.update_item_name()
 
     def write_attribs(self):
@@ -203,13 +686,29 @@ class _NodeElement(etree.ElementBase):
         Writes the values from the node's properties into the BaseElement's attrib dictionary.
         """
         self.attrib.clear()
-        for key in self.properties:
+        for key, value in zip(self._schema.properties, self.property_values):
             if key == "<node_text>":
-                self.text = self.properties[key].value
+                self.text = value
                 continue
-            self.set(key, str(self.properties[key].value))
+            self.set(key, str(value))
         if self.is_hidden:
-            self.getparent().save_metadata()
+            self.getparent().mark_metadata_dirty()
+        index = self.find_document_index()
+        if index is not None:
+            index.update(self)
+
+    def find_document_index(self):
+        """
+        :return: The DocumentIndex of this node's document or None if nothing asked for one yet, or if the node
+                 was removed from the document - lxml still reports the document's root for removed nodes.
+        """
+        top = self
+        for top in self.iterancestors():
+            pass
+        root = self.getroottree().getroot()
+        if top is not root:
+            return None
+        return getattr(root, "_document_index", None)
 
     def update_item_name(self):
         """
@@ -219,96 +718,124 @@ class _NodeElement(etree.ElementBase):
         """
         return self.name
 
-    def load_metadata(self):
+    def load_metadata(self, lazy_hidden=False):
         """
         Loads this node's metadata which is stored in a child comment encoded in json.
+
+        :param lazy_hidden: Optional. If True the hidden nodes are kept serialized until restore_hidden is called.
         """
+        if self._metadata_dirty:
+            # the comment is behind the node, bring it up to date instead of reading stale metadata back
+            self.save_metadata()
         for child in self:
-            if type(child) is NodeComment:
-                if child.text.startswith("<designer.metadata.do.not.edit>"):
-                    try:
-                        self.metadata = decode(child.text.split(maxsplit=1)[1])
-                    except JSONDecodeError:
-                        continue
-
-        self.model_item.setText(self.metadata.get("name", self.update_item_name()))
+            if type(child) is NodeComment and child.is_metadata_comment():
+                metadata = decode_metadata(child.text)
+                if metadata is not None:
+                    self.metadata = metadata
+
+        self.set_item_text(self.metadata.get("name", self.update_item_name()))
         self.user_sort_order = self.metadata.get("user_sort", "0".zfill(7))
-        if not self.hidden_children:
+        if not self.hidden_children and not self._hidden_payloads:
             hidden_nodes = self.metadata.get("hidden_nodes", [])
-            for node_string in hidden_nodes:
-                node_string = node_string.replace("<!- -", "<!--").replace("- ->", "-->")
-                node = copy_node(etree.fromstring(node_string), self)  # type: _NodeElement
-                self.add_child(node) if node.tag is not etree.Comment else self.append(node)
-                node.set_hidden(True)
-                self.sort()
-                self.model_item.sortChildren(0)
+            if lazy_hidden:
+                self._hidden_payloads = list(hidden_nodes)
+            else:
+                self._restore_hidden_nodes(hidden_nodes)
+
+    def restore_hidden(self, recursive=False):
+        """
+        Restores the hidden nodes that were kept serialized by load_metadata.
+
+        :param recursive: Optional. Whether the hidden nodes in this node's whole subtree are restored.
+        """
+        nodes = self.iter() if recursive else (self,)
+        for node in [node for node in nodes if getattr(node, "_hidden_payloads", None)]:
+            payloads, node._hidden_payloads = node._hidden_payloads, []
+            node._restore_hidden_nodes(payloads)
+
+    def _restore_hidden_nodes(self, node_strings):
+        """
+        Parses the serialized hidden nodes in one go, adds them as hidden children and sorts once.
+        """
+        if not node_strings:
+            return
+
+        wrapper = etree.fromstring("<hidden>{}</hidden>".format("".join(
+            node_string.replace("<!- -", "<!--").replace("- ->", "-->") for node_string in node_strings
+        )))
+        for node in self.add_children([copy_node(element, self) for element in wrapper], load_metadata=False):
+            node._set_hidden(True)
+        self.sort()
+        if self._model_item is not None:
+            self._model_item.sortChildren(0)
+
+    def mark_metadata_dirty(self):
+        """
+        Records that this node's metadata changed. It's written to the metadata comment by the next flush_metadata
+        (or save_metadata) so any number of changes between flushes cost a single write.
+        """
+        if not self._metadata_dirty:
+            self._metadata_dirty = True
+            with _pending_metadata_lock:
+                _pending_metadata[self] = None
 
     def save_metadata(self):
         """
-        Saves this node's metadata.
+        Saves this node's metadata into its metadata comment right away.
         """
-        if self.model_item.text() != self.name:
-            self.metadata["name"] = self.model_item.text()
+        if self._metadata_dirty:
+            self._metadata_dirty = False
+            with _pending_metadata_lock:
+                _pending_metadata.pop(self, None)
+        metadata = dict(self.metadata)
+        if self.item_text != self.name:
+            metadata["name"] = self.item_text
         else:
-            self.metadata.pop("name", None)
+            metadata.pop("name", None)
 
         if self.user_sort_order and self.user_sort_order != "0".zfill(7):
-            self.metadata["user_sort"] = self.user_sort_order.zfill(7)
+            metadata["user_sort"] = self.user_sort_order.zfill(7)
         else:
-            self.metadata.pop("user_sort", None)
+            metadata.pop("user_sort", None)
 
-        if self.hidden_children:
-            self.metadata["hidden_nodes"] = []
+        if self.hidden_children or self._hidden_payloads:
+            metadata["hidden_nodes"] = list(self._hidden_payloads)
             for element in self.hidden_children:
                 objectify.deannotate(element, cleanup_namespaces=True)
                 node_string = etree.tostring(element, pretty_print=False, encoding="unicode")
                 node_string = node_string.replace("<!--", "<!- -").replace("-->", "- ->")
-                self.metadata["hidden_nodes"].append(node_string)
+                metadata["hidden_nodes"].append(node_string)
         else:
-            self.metadata.pop("hidden_nodes", None)
+            metadata.pop("hidden_nodes", None)
 
-        if not self.allowed_children and "<node_text>" not in self.properties.keys():
+        self.metadata = metadata
+        if not self.allowed_children and "<node_text>" not in self._schema.properties:
             return
         else:
             meta_comment = None
-            set_encoder_options("json", separators=(',', ':'))
             for child in self:
-                if type(child) is NodeComment:
-                    if child.text.startswith("<designer.metadata.do.not.edit>"):
-                        meta_comment = child
-                        if self.metadata:
-                            child.text = "<designer.metadata.do.not.edit> " + encode(self.metadata)
-                        else:
-                            self.remove(child)
+                if type(child) is NodeComment and child.is_metadata_comment():
+                    meta_comment = child
+                    if self.metadata:
+                        child.text = encode_metadata(self.metadata)
+                    else:
+                        self.remove(child)
+                        self.update_child_count(child, -1)
 
             if meta_comment is None and self.metadata:
                 meta_comment = NodeComment()
-                meta_comment.properties["<node_text>"].set_value("<designer.metadata.do.not.edit> " + encode(self.metadata))
+                meta_comment.properties["<node_text>"].set_value(encode_metadata(self.metadata))
                 self.add_child(meta_comment)
 
 
-class NodeStandardItem(QStandardItem):
-    """A Standard Item but with an added reference to a xml node."""
-    def __init__(self, node):
-        self.xml_node = node
-        super().__init__()
-
-    def __lt__(self, other):
-        self_sort = self.xml_node.sort_order + "." + self.xml_node.user_sort_order
-        other_sort = other.xml_node.sort_order + "." + other.xml_node.user_sort_order
-        if self_sort < other_sort:
-            return True
-        else:
-            return False
-
-
 class NodeInfoRoot(_NodeElement):
     """
     A node for the tag fomod
     """
     tag = "fomod"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeInfoName,
             NodeInfoAuthor,
@@ -318,13 +845,11 @@ class NodeInfoRoot(_NodeElement):
             NodeInfoVersion,
             NodeInfoWebsite
         )
-        self.init(
+        return _node_schema(
             "Info",
-            type(self).tag,
             1,
             allowed_children=allowed_children
         )
-        super()._init()
 
 
 class NodeInfoName(_NodeElement):
@@ -333,17 +858,16 @@ class NodeInfoName(_NodeElement):
     """
     tag = "Name"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("<node_text>", PropertyText("Name"))
         ])
-        self.init(
+        return _node_schema(
             "Name",
-            type(self).tag,
             1,
             properties=properties
         )
-        super()._init()
 
 
 class NodeInfoAuthor(_NodeElement):
@@ -352,17 +876,16 @@ class NodeInfoAuthor(_NodeElement):
     """
     tag = "Author"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("<node_text>", PropertyText("Author"))
         ])
-        self.init(
+        return _node_schema(
             "Author",
-            type(self).tag,
             1,
             properties=properties
         )
-        super()._init()
 
 
 class NodeInfoVersion(_NodeElement):
@@ -371,17 +894,16 @@ class NodeInfoVersion(_NodeElement):
     """
     tag = "Version"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("<node_text>", PropertyText("Version"))
         ])
-        self.init(
+        return _node_schema(
             "Version",
-            type(self).tag,
             1,
             properties=properties
         )
-        super()._init()
 
 
 class NodeInfoID(_NodeElement):
@@ -390,17 +912,16 @@ class NodeInfoID(_NodeElement):
     """
     tag = "Id"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("<node_text>", PropertyText("ID"))
         ])
-        self.init(
+        return _node_schema(
             "ID",
-            type(self).tag,
             1,
             properties=properties
         )
-        super()._init()
 
 
 class NodeInfoWebsite(_NodeElement):
@@ -409,17 +930,16 @@ class NodeInfoWebsite(_NodeElement):
     """
     tag = "Website"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("<node_text>", PropertyText("Website"))
         ])
-        self.init(
+        return _node_schema(
             "Website",
-            type(self).tag,
             1,
             properties=properties
         )
-        super()._init()
 
 
 class NodeInfoDescription(_NodeElement):
@@ -428,17 +948,16 @@ class NodeInfoDescription(_NodeElement):
     """
     tag = "Description"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("<node_text>", PropertyText("Description"))
         ])
-        self.init(
+        return _node_schema(
             "Description",
-            type(self).tag,
             1,
             properties=properties
         )
-        super()._init()
 
 
 class NodeInfoGroup(_NodeElement):
@@ -447,17 +966,16 @@ class NodeInfoGroup(_NodeElement):
     """
     tag = "Groups"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_child = (
             NodeInfoElement,
         )
-        self.init(
+        return _node_schema(
             "Categories Group",
-            type(self).tag,
             1,
             allowed_children=allowed_child
         )
-        super()._init()
 
 
 class NodeInfoElement(_NodeElement):
@@ -466,17 +984,16 @@ class NodeInfoElement(_NodeElement):
     """
     tag = "element"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("<node_text>", PropertyText("Category"))
         ])
-        self.init(
+        return _node_schema(
             "Category",
-            type(self).tag,
             0,
             properties=properties
         )
-        super()._init()
 
 
 class NodeConfigRoot(_NodeElement):
@@ -485,7 +1002,8 @@ class NodeConfigRoot(_NodeElement):
     """
     tag = "config"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigModName,
             NodeConfigModImage,
@@ -511,16 +1029,14 @@ class NodeConfigRoot(_NodeElement):
                  ))
             ]
         )
-        self.init(
+        return _node_schema(
             "Config",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             properties=properties,
             required_children=required,
             at_least_one_children_group=at_least_one
         )
-        super()._init()
 
 
 class NodeConfigModName(_NodeElement):
@@ -529,20 +1045,19 @@ class NodeConfigModName(_NodeElement):
     """
     tag = "moduleName"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("<node_text>", PropertyText("Name")),
             ("position", PropertyCombo("Position", ("Left", "Right", "RightOfImage"))),
             ("colour", PropertyColour("Colour", "000000"))
         ])
-        self.init(
+        return _node_schema(
             "Name",
-            type(self).tag,
             1,
             properties=properties,
             sort_order="1"
         )
-        super()._init()
 
 
 class NodeConfigModImage(_NodeElement):
@@ -551,21 +1066,20 @@ class NodeConfigModImage(_NodeElement):
     """
     tag = "moduleImage"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("path", PropertyFile("Path")),
             ("showImage", PropertyCombo("Show Image", ("true", "false"))),
             ("showFade", PropertyCombo("Show Fade", ("true", "false"))),
             ("height", PropertyInt("Height", -1, 9999, -1))
         ])
-        self.init(
+        return _node_schema(
             "Image",
-            "moduleImage",
             1,
             properties=properties,
             sort_order="2"
         )
-        super()._init()
 
 
 class NodeConfigModDepend(_NodeElement):
@@ -574,7 +1088,8 @@ class NodeConfigModDepend(_NodeElement):
     """
     tag = "moduleDependencies"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigDependFile,
             NodeConfigDependFlag,
@@ -584,16 +1099,14 @@ class NodeConfigModDepend(_NodeElement):
         properties = OrderedDict([
             ("operator", PropertyCombo("Type", ["And", "Or"]))
         ])
-        self.init(
+        return _node_schema(
             "Mod Dependencies",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             properties=properties,
             sort_order="3",
-            wizard=WizardDepend
+            wizard="WizardDepend"
         )
-        super()._init()
 
 
 class NodeConfigReqFiles(_NodeElement):
@@ -602,20 +1115,19 @@ class NodeConfigReqFiles(_NodeElement):
     """
     tag = "requiredInstallFiles"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigFile,
             NodeConfigFolder
         )
-        self.init(
+        return _node_schema(
             "Mod Requirements",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             sort_order="4",
-            wizard=WizardFiles
+            wizard="WizardFiles"
         )
-        super()._init()
 
 
 class NodeConfigInstallSteps(_NodeElement):
@@ -624,7 +1136,8 @@ class NodeConfigInstallSteps(_NodeElement):
     """
     tag = "installSteps"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigInstallStep,
         )
@@ -634,16 +1147,14 @@ class NodeConfigInstallSteps(_NodeElement):
         properties = OrderedDict([
             ("order", PropertyCombo("Order", ["Ascending", "Descending", "Explicit"]))
         ])
-        self.init(
+        return _node_schema(
             "Installation Steps",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             properties=properties,
             sort_order="5",
             required_children=required
         )
-        super()._init()
 
 
 class NodeConfigCondInstall(_NodeElement):
@@ -652,22 +1163,21 @@ class NodeConfigCondInstall(_NodeElement):
     """
     tag = "conditionalFileInstalls"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigPatterns,
         )
         required = (
             NodeConfigPatterns,
         )
-        self.init(
+        return _node_schema(
             "Conditional Installation",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             sort_order="6",
             required_children=required
         )
-        super()._init()
 
 
 class NodeConfigDependFile(_NodeElement):
@@ -676,18 +1186,17 @@ class NodeConfigDependFile(_NodeElement):
     """
     tag = "fileDependency"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("file", PropertyText("File")),
             ("state", PropertyCombo("State", ("Active", "Inactive", "Missing")))
         ])
-        self.init(
+        return _node_schema(
             "File Dependency",
-            type(self).tag,
             0,
             properties=properties
         )
-        super()._init()
 
 
 class NodeConfigDependFlag(_NodeElement):
@@ -696,18 +1205,17 @@ class NodeConfigDependFlag(_NodeElement):
     """
     tag = "flagDependency"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("flag", PropertyFlagLabel("Label")),
             ("value", PropertyFlagValue("Value"))
         ])
-        self.init(
+        return _node_schema(
             "Flag Dependency",
-            type(self).tag,
             0,
             properties=properties
         )
-        super()._init()
 
 
 class NodeConfigDependGame(_NodeElement):
@@ -716,17 +1224,16 @@ class NodeConfigDependGame(_NodeElement):
     """
     tag = "gameDependency"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("version", PropertyText("Version"))
         ])
-        self.init(
+        return _node_schema(
             "Game Dependency",
-            "gameDependency",
             1,
             properties=properties
         )
-        super()._init()
 
 
 class NodeConfigFile(_NodeElement):
@@ -735,7 +1242,8 @@ class NodeConfigFile(_NodeElement):
     """
     tag = "file"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("source", PropertyFile("Source")),
             ("destination", PropertyText("Destination")),
@@ -743,13 +1251,11 @@ class NodeConfigFile(_NodeElement):
             ("alwaysInstall", PropertyCombo("Always Install", ("false", "true"))),
             ("installIfUsable", PropertyCombo("Install If Usable", ("false", "true")))
         ])
-        self.init(
+        return _node_schema(
             "File",
-            type(self).tag,
             0,
             properties=properties
         )
-        super()._init()
 
     def update_item_name(self):
         """
@@ -757,11 +1263,11 @@ class NodeConfigFile(_NodeElement):
 
         Override in subclasses as needed.
         """
-        if not self.properties["source"].value:
-            self.model_item.setText(self.name)
+        if not self.value_of("source"):
+            self.set_item_text(self.name)
             return self.name
-        split_name = self.properties["source"].value.split(sep)
-        self.model_item.setText(split_name[len(split_name) - 1])
+        split_name = self.value_of("source").split(sep)
+        self.set_item_text(split_name[len(split_name) - 1])
         return split_name[len(split_name) - 1]
 
 
@@ -771,7 +1277,8 @@ class NodeConfigFolder(_NodeElement):
     """
     tag = "folder"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("source", PropertyFolder("Source")),
             ("destination", PropertyText("Destination")),
@@ -779,13 +1286,11 @@ class NodeConfigFolder(_NodeElement):
             ("alwaysInstall", PropertyCombo("Always Install", ("false", "true"))),
             ("installIfUsable", PropertyCombo("Install If Usable", ("false", "true")))
         ])
-        self.init(
+        return _node_schema(
             "Folder",
-            type(self).tag,
             0,
             properties=properties
         )
-        super()._init()
 
     def update_item_name(self):
         """
@@ -793,11 +1298,11 @@ class NodeConfigFolder(_NodeElement):
 
         Override in subclasses as needed.
         """
-        if not self.properties["source"].value:
-            self.model_item.setText(self.name)
+        if not self.value_of("source"):
+            self.set_item_text(self.name)
             return self.name
-        split_name = self.properties["source"].value.split(sep)
-        self.model_item.setText(split_name[len(split_name) - 1])
+        split_name = self.value_of("source").split(sep)
+        self.set_item_text(split_name[len(split_name) - 1])
         return split_name[len(split_name) - 1]
 
 
@@ -807,21 +1312,20 @@ class NodeConfigPatterns(_NodeElement):
     """
     tag = "patterns"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigPattern,
         )
         required = (
             NodeConfigPattern,
         )
-        self.init(
+        return _node_schema(
             "Patterns",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             required_children=required
         )
-        super()._init()
 
 
 class NodeConfigPattern(_NodeElement):
@@ -830,7 +1334,8 @@ class NodeConfigPattern(_NodeElement):
     """
     tag = "pattern"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigFiles,
             NodeConfigDependencies
@@ -839,15 +1344,13 @@ class NodeConfigPattern(_NodeElement):
             NodeConfigFiles,
             NodeConfigDependencies
         )
-        self.init(
+        return _node_schema(
             "Pattern",
-            type(self).tag,
             0,
             allowed_children=allowed_children,
             required_children=required,
             name_editable=True
         )
-        super()._init()
 
 
 class NodeConfigFiles(_NodeElement):
@@ -856,20 +1359,19 @@ class NodeConfigFiles(_NodeElement):
     """
     tag = "files"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigFile,
             NodeConfigFolder
         )
-        self.init(
+        return _node_schema(
             "Files",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             sort_order="3",
-            wizard=WizardFiles
+            wizard="WizardFiles"
         )
-        super()._init()
 
 
 class NodeConfigDependencies(_NodeElement):
@@ -878,7 +1380,8 @@ class NodeConfigDependencies(_NodeElement):
     """
     tag = "dependencies"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigDependFile,
             NodeConfigDependFlag,
@@ -888,16 +1391,14 @@ class NodeConfigDependencies(_NodeElement):
         properties = OrderedDict([
             ("operator", PropertyCombo("Type", ["And", "Or"]))
         ])
-        self.init(
+        return _node_schema(
             "Dependencies",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             properties=properties,
             sort_order="1",
-            wizard=WizardDepend
+            wizard="WizardDepend"
         )
-        super()._init()
 
 
 class NodeConfigNestedDependencies(_NodeElement):
@@ -906,7 +1407,8 @@ class NodeConfigNestedDependencies(_NodeElement):
     """
     tag = "dependencies"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigDependFile,
             NodeConfigDependFlag,
@@ -916,15 +1418,13 @@ class NodeConfigNestedDependencies(_NodeElement):
         properties = OrderedDict([
             ("operator", PropertyCombo("Type", ["And", "Or"]))
         ])
-        self.init(
+        return _node_schema(
             "Dependencies",
-            type(self).tag,
             0,
             allowed_children=allowed_children,
             properties=properties,
-            wizard=WizardDepend
+            wizard="WizardDepend"
         )
-        super()._init()
 
 
 class NodeConfigInstallStep(_NodeElement):
@@ -933,7 +1433,8 @@ class NodeConfigInstallStep(_NodeElement):
     """
     tag = "installStep"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigVisible,
             NodeConfigOptGroups
@@ -944,15 +1445,13 @@ class NodeConfigInstallStep(_NodeElement):
         properties = OrderedDict([
             ("name", PropertyText("Name"))
         ])
-        self.init(
+        return _node_schema(
             "Install Step",
-            type(self).tag,
             0,
             allowed_children=allowed_children,
             properties=properties,
             required_children=required
         )
-        super()._init()
 
     def update_item_name(self):
         """
@@ -960,11 +1459,11 @@ class NodeConfigInstallStep(_NodeElement):
 
         Override in subclasses as needed.
         """
-        if not self.properties["name"].value:
-            self.model_item.setText(self.name)
+        if not self.value_of("name"):
+            self.set_item_text(self.name)
             return self.name
-        self.model_item.setText(self.properties["name"].value)
-        return self.properties["name"].value
+        self.set_item_text(self.value_of("name"))
+        return self.value_of("name")
 
 
 class NodeConfigVisible(_NodeElement):
@@ -973,7 +1472,8 @@ class NodeConfigVisible(_NodeElement):
     """
     tag = "visible"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigDependFile,
             NodeConfigDependFlag,
@@ -983,16 +1483,14 @@ class NodeConfigVisible(_NodeElement):
         properties = OrderedDict([
             ("operator", PropertyCombo("Type", ["And", "Or"]))
         ])
-        self.init(
+        return _node_schema(
             "Visibility",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             sort_order="1",
-            wizard=WizardDepend,
+            wizard="WizardDepend",
             properties=properties
         )
-        super()._init()
 
 
 class NodeConfigOptGroups(_NodeElement):
@@ -1001,7 +1499,8 @@ class NodeConfigOptGroups(_NodeElement):
     """
     tag = "optionalFileGroups"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigGroup,
         )
@@ -1011,16 +1510,14 @@ class NodeConfigOptGroups(_NodeElement):
         properties = OrderedDict([
             ("order", PropertyCombo("Order", ["Ascending", "Descending", "Explicit"]))
         ])
-        self.init(
+        return _node_schema(
             "Option Group",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             properties=properties,
             sort_order="2",
             required_children=required
         )
-        super()._init()
 
 
 class NodeConfigGroup(_NodeElement):
@@ -1029,7 +1526,8 @@ class NodeConfigGroup(_NodeElement):
     """
     tag = "group"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigPlugins,
         )
@@ -1046,15 +1544,13 @@ class NodeConfigGroup(_NodeElement):
                 "SelectAtLeastOne"
             ]))
         ])
-        self.init(
+        return _node_schema(
             "Group",
-            type(self).tag,
             0,
             allowed_children=allowed_children,
             properties=properties,
             required_children=required
         )
-        super()._init()
 
     def update_item_name(self):
         """
@@ -1062,11 +1558,11 @@ class NodeConfigGroup(_NodeElement):
 
         Override in subclasses as needed.
         """
-        if not self.properties["name"].value:
-            self.model_item.setText(self.name)
+        if not self.value_of("name"):
+            self.set_item_text(self.name)
             return self.name
-        self.model_item.setText(self.properties["name"].value)
-        return self.properties["name"].value
+        self.set_item_text(self.value_of("name"))
+        return self.value_of("name")
 
 
 class NodeConfigPlugins(_NodeElement):
@@ -1075,7 +1571,8 @@ class NodeConfigPlugins(_NodeElement):
     """
     tag = "plugins"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigPlugin,
         )
@@ -1085,15 +1582,13 @@ class NodeConfigPlugins(_NodeElement):
         properties = OrderedDict([
             ("order", PropertyCombo("Order", ["Ascending", "Descending", "Explicit"]))
         ])
-        self.init(
+        return _node_schema(
             "Plugins",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             properties=properties,
             required_children=required
         )
-        super()._init()
 
 
 class NodeConfigPlugin(_NodeElement):
@@ -1102,7 +1597,8 @@ class NodeConfigPlugin(_NodeElement):
     """
     tag = "plugin"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigPluginDescription,
             NodeConfigImage,
@@ -1117,15 +1613,13 @@ class NodeConfigPlugin(_NodeElement):
         properties = OrderedDict([
             ("name", PropertyText("Name"))
         ])
-        self.init(
+        return _node_schema(
             "Plugin",
-            type(self).tag,
             0,
             allowed_children=allowed_children,
             properties=properties,
             required_children=required
         )
-        super()._init()
 
     def update_item_name(self):
         """
@@ -1133,11 +1627,11 @@ class NodeConfigPlugin(_NodeElement):
 
         Override in subclasses as needed.
         """
-        if not self.properties["name"].value:
-            self.model_item.setText(self.name)
+        if not self.value_of("name"):
+            self.set_item_text(self.name)
             return self.name
-        self.model_item.setText(self.properties["name"].value)
-        return self.properties["name"].value
+        self.set_item_text(self.value_of("name"))
+        return self.value_of("name")
 
 
 class NodeConfigPluginDescription(_NodeElement):
@@ -1146,18 +1640,17 @@ class NodeConfigPluginDescription(_NodeElement):
     """
     tag = "description"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("<node_text>", PropertyHTML("Description"))
         ])
-        self.init(
+        return _node_schema(
             "Description",
-            type(self).tag,
             1,
             properties=properties,
             sort_order="1"
         )
-        super()._init()
 
 
 class NodeConfigImage(_NodeElement):
@@ -1166,18 +1659,17 @@ class NodeConfigImage(_NodeElement):
     """
     tag = "image"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("path", PropertyFile("Path"))
         ])
-        self.init(
+        return _node_schema(
             "Image",
-            type(self).tag,
             1,
             properties=properties,
             sort_order="2"
         )
-        super()._init()
 
 
 class NodeConfigConditionFlags(_NodeElement):
@@ -1186,22 +1678,21 @@ class NodeConfigConditionFlags(_NodeElement):
     """
     tag = "conditionFlags"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigFlag,
         )
         required = (
             NodeConfigFlag,
         )
-        self.init(
+        return _node_schema(
             "Flags",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             sort_order="3",
             required_children=required
         )
-        super()._init()
 
 
 class NodeConfigTypeDesc(_NodeElement):
@@ -1210,7 +1701,8 @@ class NodeConfigTypeDesc(_NodeElement):
     """
     tag = "typeDescriptor"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigDependencyType,
             NodeConfigType
@@ -1219,15 +1711,13 @@ class NodeConfigTypeDesc(_NodeElement):
             NodeConfigDependencyType,
             NodeConfigType
         )
-        self.init(
+        return _node_schema(
             "Type Descriptor",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             sort_order="4",
             either_children_group=either_children
         )
-        super()._init()
 
     def can_add_child(self, child):
         if super().can_add_child(child):
@@ -1242,18 +1732,17 @@ class NodeConfigFlag(_NodeElement):
     """
     tag = "flag"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("name", PropertyFlagLabel("Label")),
             ("<node_text>", PropertyText("Value")),
         ])
-        self.init(
+        return _node_schema(
             "Flag",
-            type(self).tag,
             0,
             properties=properties,
         )
-        super()._init()
 
     def update_item_name(self):
         """
@@ -1261,11 +1750,11 @@ class NodeConfigFlag(_NodeElement):
 
         Override in subclasses as needed.
         """
-        if not self.properties["name"].value:
-            self.model_item.setText(self.name)
+        if not self.value_of("name"):
+            self.set_item_text(self.name)
             return self.name
-        self.model_item.setText(self.properties["name"].value)
-        return self.properties["name"].value
+        self.set_item_text(self.value_of("name"))
+        return self.value_of("name")
 
 
 class NodeConfigDependencyType(_NodeElement):
@@ -1274,7 +1763,8 @@ class NodeConfigDependencyType(_NodeElement):
     """
     tag = "dependencyType"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigInstallPatterns,
             NodeConfigDefaultType
@@ -1283,14 +1773,12 @@ class NodeConfigDependencyType(_NodeElement):
             NodeConfigInstallPatterns,
             NodeConfigDefaultType
         )
-        self.init(
+        return _node_schema(
             "Dependency Type",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             required_children=required
         )
-        super()._init()
 
 
 class NodeConfigDefaultType(_NodeElement):
@@ -1299,18 +1787,17 @@ class NodeConfigDefaultType(_NodeElement):
     """
     tag = "defaultType"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("name", PropertyCombo("Type", ["Required", "Recommended", "Optional", "CouldBeUsable", "NotUsable"]))
         ])
-        self.init(
+        return _node_schema(
             "Default Type",
-            type(self).tag,
             1,
             properties=properties,
             sort_order="1"
         )
-        super()._init()
 
     def update_item_name(self):
         """
@@ -1318,11 +1805,11 @@ class NodeConfigDefaultType(_NodeElement):
 
         Override in subclasses as needed.
         """
-        if not self.properties["name"].value:
-            self.model_item.setText(self.name)
+        if not self.value_of("name"):
+            self.set_item_text(self.name)
             return self.name
-        self.model_item.setText(self.properties["name"].value)
-        return self.properties["name"].value
+        self.set_item_text(self.value_of("name"))
+        return self.value_of("name")
 
 
 class NodeConfigType(_NodeElement):
@@ -1331,18 +1818,17 @@ class NodeConfigType(_NodeElement):
     """
     tag = "type"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         properties = OrderedDict([
             ("name", PropertyCombo("Type", ["Required", "Recommended", "Optional", "CouldBeUsable", "NotUsable"]))
         ])
-        self.init(
+        return _node_schema(
             "Type",
-            type(self).tag,
             1,
             properties=properties,
             sort_order="2"
         )
-        super()._init()
 
     def update_item_name(self):
         """
@@ -1350,11 +1836,11 @@ class NodeConfigType(_NodeElement):
 
         Override in subclasses as needed.
         """
-        if not self.properties["name"].value:
-            self.model_item.setText(self.name)
+        if not self.value_of("name"):
+            self.set_item_text(self.name)
             return self.name
-        self.model_item.setText(self.properties["name"].value)
-        return self.properties["name"].value
+        self.set_item_text(self.value_of("name"))
+        return self.value_of("name")
 
 
 class NodeConfigInstallPatterns(_NodeElement):
@@ -1363,22 +1849,21 @@ class NodeConfigInstallPatterns(_NodeElement):
     """
     tag = "patterns"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigInstallPattern,
         )
         required = (
             NodeConfigInstallPattern,
         )
-        self.init(
+        return _node_schema(
             "Patterns",
-            type(self).tag,
             1,
             allowed_children=allowed_children,
             sort_order="2",
             required_children=required
         )
-        super()._init()
 
 
 class NodeConfigInstallPattern(_NodeElement):
@@ -1387,7 +1872,8 @@ class NodeConfigInstallPattern(_NodeElement):
     """
     tag = "pattern"
 
-    def _init(self):
+    @classmethod
+    def _define_schema(cls):
         allowed_children = (
             NodeConfigType,
             NodeConfigDependencies
@@ -1396,12 +1882,10 @@ class NodeConfigInstallPattern(_NodeElement):
             NodeConfigType,
             NodeConfigDependencies
         )
-        self.init(
+        return _node_schema(
             "Pattern",
-            type(self).tag,
             0,
             allowed_children=allowed_children,
             required_children=required,
             name_editable=True
         )
-        super()._init()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import scandir, stat
+from os.path import join, normpath
+from collections import namedtuple
+from threading import RLock
+from .exceptions import MissingFileError
+
+#: A file or folder in a package. *path* is the real path relative to the package, *name* the real name.
+PackageEntry = namedtuple("PackageEntry", ["path", "name", "is_dir", "size", "mtime"])
+
+
+def _split(rel_path):
+    """
+    :return: The components of the package relative path *rel_path*, both slashes are accepted as separators.
+    """
+    rel_path = normpath(rel_path.replace("\\", "/")).replace("\\", "/")
+    return [part for part in rel_path.split("/") if part and part != "."]
+
+
+class PackageIndex(object):
+    """
+    A case-insensitive index of the files and folders in a package.
+
+    Folders are scanned once, the first time something inside them is looked up, and the scan is kept until the
+    folder's mtime changes or the index is invalidated (for example by a filesystem watcher).
+
+    Safe to use from several threads.
+
+    :param package_path: The package's root folder.
+    :param check_mtime: Optional. Whether cached folders are checked against their mtime on every lookup.
+                        Turn it off when every change is reported through invalidate.
+    """
+    def __init__(self, package_path, check_mtime=True):
+        self.package_path = package_path
+        self.check_mtime = check_mtime
+        self._folders = {}
+        self._lock = RLock()
+
+    def _scan(self, rel_folder):
+        """
+        :param rel_folder: The real path, relative to the package, of the folder to scan.
+        :return: The folder's mtime and a dict of its casefolded entry names to PackageEntry.
+        """
+        abs_folder = join(self.package_path, rel_folder)
+        folder_mtime = stat(abs_folder).st_mtime_ns
+        entries = {}
+        with scandir(abs_folder) as iterator:
+            for entry in iterator:
+                try:
+                    entry_stat = entry.stat()
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                entries[entry.name.casefold()] = PackageEntry(
+                    join(rel_folder, entry.name) if rel_folder else entry.name,
+                    entry.name,
+                    is_dir,
+                    0 if is_dir else entry_stat.st_size,
+                    entry_stat.st_mtime_ns,
+                )
+        return folder_mtime, entries
+
+    def _entries(self, rel_folder):
+        """
+        :param rel_folder: The real path, relative to the package, of the folder.
+        :return: The cached entries of the folder, rescanned if the folder changed. None if it doesn't exist.
+        """
+        key = rel_folder.casefold()
+        with self._lock:
+            cached = self._folders.get(key)
+            if cached is not None and self.check_mtime:
+                try:
+                    if stat(join(self.package_path, rel_folder)).st_mtime_ns != cached[0]:
+                        cached = None
+                except OSError:
+                    cached = None
+            if cached is None:
+                try:
+                    cached = self._scan(rel_folder)
+                except OSError:
+                    self._folders.pop(key, None)
+                    return None
+                self._folders[key] = cached
+            return cached[1]
+
+    def lookup(self, rel_path):
+        """
+        Looks up a file or folder case-insensitively.
+
+        :param rel_path: The path relative to the package.
+        :return: The PackageEntry for the path or None if it doesn't exist.
+        """
+        entry = None
+        rel_folder = ""
+        for part in _split(rel_path):
+            entries = self._entries(rel_folder)
+            if entries is None:
+                return None
+            entry = entries.get(part.casefold())
+            if entry is None:
+                return None
+            rel_folder = entry.path
+        return entry
+
+    def find(self, rel_folder, name):
+        """
+        Searches case-insensitively for a file or folder in a given folder.
+
+        :param rel_folder: The folder to search in, relative to the package.
+        :param name: The name to search for.
+        :return: The real name. Raises MissingFileError if it doesn't exist.
+        """
+        entry = self.lookup(join(rel_folder, name))
+        if entry is None:
+            raise MissingFileError(name)
+        return entry.name
+
+    def real_path(self, rel_path):
+        """
+        :param rel_path: The path relative to the package.
+        :return: The absolute path with the case as it is on disk or None if it doesn't exist.
+        """
+        if not _split(rel_path):
+            return self.package_path
+        entry = self.lookup(rel_path)
+        if entry is None:
+            return None
+        return join(self.package_path, entry.path)
+
+    def listdir(self, rel_folder=""):
+        """
+        :param rel_folder: The folder relative to the package.
+        :return: A list of PackageEntry for the folder's contents. Empty if the folder doesn't exist.
+        """
+        if _split(rel_folder):
+            folder = self.lookup(rel_folder)
+            if folder is None or not folder.is_dir:
+                return []
+            rel_folder = folder.path
+        else:
+            rel_folder = ""
+        entries = self._entries(rel_folder)
+        return list(entries.values()) if entries is not None else []
+
+    def invalidate(self, rel_folder=None):
+        """
+        Drops cached folders so they're scanned again on the next lookup.
+
+        :param rel_folder: Optional. The folder to drop, relative to the package. Drops every folder if missing.
+        """
+        with self._lock:
+            if rel_folder is None:
+                self._folders.clear()
+            else:
+                parts = _split(rel_folder)
+                self._folders.pop(join(*parts).casefold() if parts else "", None)
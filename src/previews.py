@@ -15,83 +15,305 @@
 # limitations under the License.
 
 from os.path import join, sep, normpath
-from queue import Queue
+from array import array
+from collections import namedtuple, OrderedDict
+from hashlib import sha1
+from itertools import chain
+from threading import Condition
+from timeit import default_timer
 from PyQt5.QtCore import QThread
 from lxml.etree import XML, tostring, Comment
 from lxml.objectify import deannotate
-from pygments import highlight
-from pygments.formatters.html import HtmlFormatter
-from pygments.lexers.html import XmlLexer
+from .nodes import flush_metadata
+
+
+_EMPTY = object()
+
+#: What the preview workers render, taken on the ui thread by take_snapshot and never changed afterwards.
+#: The subtrees are serialized bytes, each with the sort keys of its nodes in document order.
+PreviewSnapshot = namedtuple(
+    "PreviewSnapshot",
+    ["element", "element_keys", "is_comment", "step", "step_keys", "has_steps", "info"]
+)
+
+
+def _freeze(node):
+    """
+    :return: The serialized *node* and the sort keys of its nodes in document order.
+    """
+    return tostring(node, with_tail=False), tuple(elem.sort_key for elem in node.iter())
+
+
+def _thaw(xml, keys):
+    """
+    Parses a frozen subtree into plain lxml elements, sorted the way the document would be sorted.
+
+    :param xml: The serialized subtree.
+    :param keys: The sort keys of the subtree's nodes in document order.
+    :return: The subtree's root.
+    """
+    root = XML(xml)
+    key_of = dict(zip(root.iter(), keys))
+    for elem in key_of:
+        if len(elem) > 1:
+            elem[:] = sorted(elem, key=key_of.__getitem__)
+    return root
+
+
+def _info_text(info_root, tag):
+    if info_root is None:
+        return ""
+    elem = info_root.find(tag)
+    return elem.text if elem is not None else ""
+
+
+def take_snapshot(element, info_root, config_root):
+    """
+    Takes what the previews need from the document, to be called on the ui thread.
+
+    Only the selected element and the installStep it belongs to are serialized, the workers parse and sort their own
+    copies so the document itself is never touched outside the ui thread.
+
+    :param element: The selected node, may be None.
+    :param info_root: The info root node.
+    :param config_root: The config root node.
+    :return: A PreviewSnapshot.
+    """
+    if element is None:
+        return None
+
+    element.write_attribs()
+    flush_metadata()
+    is_comment = element.tag is Comment
+    if element.tag == "installStep":
+        step = element
+    else:
+        step = next(element.iterancestors("installStep"), None)
+
+    element_xml, element_keys = _freeze(element) if not is_comment else (None, ())
+    step_xml, step_keys = _freeze(step) if step is not None else (None, ())
+    return PreviewSnapshot(
+        element_xml,
+        element_keys,
+        is_comment,
+        step_xml,
+        step_keys,
+        step is not None or (config_root is not None and config_root.find(".//installStep") is not None),
+        tuple(_info_text(info_root, tag) for tag in ("Name", "Author", "Version", "Website")),
+    )
+
+
+class PreviewQueue(object):
+    """
+    A latest-wins queue for preview requests.
+
+    Only the newest request is kept - putting a request replaces the pending one, which counts as a skipped render.
+    Every put starts a new generation so the threads working on an older request can tell it went stale and drop it.
+
+    :param debounce: Optional. The seconds get waits after the latest put, so a burst of requests renders only once.
+    """
+    def __init__(self, debounce=0.0):
+        self.debounce = debounce
+        self.generation = 0
+        self.skipped = 0
+        self._pending = _EMPTY
+        self._last_put = 0.0
+        self._condition = Condition()
+
+    def put(self, request):
+        """
+        Replaces the pending request with *request*.
+        """
+        with self._condition:
+            if self._pending is not _EMPTY:
+                self.skipped += 1
+            self._pending = request
+            self.generation += 1
+            self._last_put = default_timer()
+            self._condition.notify()
+
+    def get(self):
+        """
+        Waits for a request and for the debounce window after the latest put to pass.
+
+        :return: The generation of the request and the request.
+        """
+        with self._condition:
+            while True:
+                if self._pending is _EMPTY:
+                    self._condition.wait()
+                    continue
+                remaining = self._last_put + self.debounce - default_timer()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                request, self._pending = self._pending, _EMPTY
+                return self.generation, request
+
+    def is_stale(self, generation):
+        """
+        :return: True if a request newer than *generation* was put.
+        """
+        return generation != self.generation
+
+    def skip(self):
+        """
+        Counts a render that was abandoned because its request went stale.
+        """
+        with self._condition:
+            self.skipped += 1
+
+
+def fragment_key(xml, keys):
+    """
+    :param xml: A frozen subtree, as in a PreviewSnapshot.
+    :param keys: The sort keys of the subtree's nodes.
+    :return: A digest of the subtree's content and order, equal for subtrees that preview the same.
+    """
+    digest = sha1(xml)
+    digest.update(array("q", chain.from_iterable(keys)).tobytes())
+    return digest.digest()
+
+
+class CodeCache(object):
+    """
+    A least recently used cache of generated code, keyed by fragment_key.
+
+    Only used by the code worker's thread so it has no lock.
+
+    :param max_size: Optional. The most characters of code kept, the least recently used entries go first.
+    """
+    def __init__(self, max_size=32 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """
+        :return: The code cached for *key* or None.
+        """
+        code = self._entries.get(key)
+        if code is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return code
+
+    def put(self, key, code):
+        """
+        Caches *code* for *key*, unless it alone is larger than the cache.
+        """
+        if len(code) > self.max_size:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._entries[key] = code
+        self.size += len(code)
+        while self.size > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
 
 
 class PreviewDispatcherThread(QThread):
     """
-    Thread used to dispatch the element to each preview worker thread.
+    Thread used to dispatch the snapshot to each preview worker thread.
 
-    :param queue: The main queue containing the elements to process.
-    :param mo_signal: The signal to pass to the MO preview worker, updates the MO preview.
-    :param nmm_signal: The signal to pass to the NMM preview worker, updates the NMM preview.
+    The snapshot is only handed to the workers if no newer one arrived in the meantime, and the workers drop it as
+    soon as a newer one does. The generation a snapshot was put with is its revision.
+
+    :param queue: The main PreviewQueue containing the PreviewSnapshots (or None) to process.
     :param code_signal: The signal to pass to the code preview worker, updates the code preview.
     """
     def __init__(self, queue, code_signal, **kwargs):
         super().__init__()
         self.queue = queue
-        self.gui_queue = Queue()
-        self.code_queue = Queue()
+        self.gui_queue = PreviewQueue()
+        self.code_queue = PreviewQueue()
 
-        self.code_thread = PreviewCodeWorker(self.code_queue, code_signal)
+        self.code_thread = PreviewCodeWorker(self.code_queue, code_signal, queue)
         self.code_thread.start()
-        self.gui_thread = PreviewGuiWorker(self.gui_queue, **kwargs)
+        self.gui_thread = PreviewGuiWorker(self.gui_queue, queue, **kwargs)
         self.gui_thread.start()
 
+    def stats(self):
+        """
+        :return: A dict with the number of preview requests, of the renders skipped because they went stale and of
+                 the code previews served from the cache.
+        """
+        return {
+            "requests": self.queue.generation,
+            "skipped": self.queue.skipped + self.gui_queue.skipped + self.code_queue.skipped,
+            "cache_hits": self.code_thread.cache.hits,
+            "cache_size": self.code_thread.cache.size,
+        }
+
     def run(self):
         while True:
-            # wait for next element
-            element = self.queue.get()
+            # wait for next snapshot
+            generation, snapshot = self.queue.get()
 
-            if element is not None:
-                element.write_attribs()
-                element.load_metadata()
-                element.sort()
+            if self.queue.is_stale(generation):
+                self.queue.skip()
+                continue
 
             # dispatch to every queue
-            self.gui_queue.put(element)
-            self.code_queue.put(element)
+            self.gui_queue.put((generation, snapshot))
+            self.code_queue.put((generation, snapshot))
 
 
 class PreviewCodeWorker(QThread):
     """
-    Takes a xml element, writes the code, highlights it with inline css and returns the html code.
+    Takes a snapshot, writes the selected element's code and returns it. Highlighting is left to the code view.
+
+    The code is cached by content, so elements that didn't change since they were last previewed return at once.
 
-    :param queue: The queue that receives the elements to be processed.
-    :param return_signal: The signal used to send the return code through.
-    :return: The highlighted element html code.
+    :param queue: The queue that receives the snapshots to be processed.
+    :param return_signal: The signal used to send the code through.
+    :param requests: The dispatcher's PreviewQueue, tells when an element went stale.
+    :return: The element's code.
     """
-    def __init__(self, queue, return_signal):
+    def __init__(self, queue, return_signal, requests):
         super().__init__()
         self.queue = queue
         self.return_signal = return_signal
+        self.requests = requests
+        self.cache = CodeCache()
 
     def run(self):
         while True:
-            # wait for next element
-            element = self.queue.get()
+            # wait for next snapshot, tagged with the generation it was requested with
+            _, (generation, snapshot) = self.queue.get()
 
-            if element is None or element.tag is Comment:
+            if snapshot is None or snapshot.is_comment:
                 self.return_signal.emit("")
                 continue
 
-            element = XML(tostring(element))
-
-            # process the element
-            deannotate(element, cleanup_namespaces=True)
-            code = tostring(element, encoding="Unicode", pretty_print=True, xml_declaration=False)
-            self.return_signal.emit(highlight(code, XmlLexer(), HtmlFormatter(
-                noclasses=True, style="autumn", linenos="table"
-            )))
+            key = fragment_key(snapshot.element, snapshot.element_keys)
+            code = self.cache.get(key)
+            if code is None:
+                element = _thaw(snapshot.element, snapshot.element_keys)
+
+                # process the element
+                deannotate(element, cleanup_namespaces=True)
+                code = tostring(element, encoding="Unicode", pretty_print=True, xml_declaration=False)
+                self.cache.put(key, code)
+            if self.requests.is_stale(generation):
+                self.queue.skip()
+                continue
+            self.return_signal.emit(code)
 
 
 class PreviewGuiWorker(QThread):
+    """
+    Takes a snapshot and builds the installer page of its installStep for the mo preview.
+
+    :param queue: The queue that receives the snapshots to be processed.
+    :param requests: The dispatcher's PreviewQueue, tells when a snapshot went stale.
+    """
     class InstallStepData(object):
         def __init__(self, name):
             self.name = name
@@ -148,139 +370,177 @@ class PreviewGuiWorker(QThread):
             self.label = label
             self.value = value
 
-    def __init__(self, queue, **kwargs):
+    def __init__(self, queue, requests, **kwargs):
         super().__init__()
         self.queue = queue
+        self.requests = requests
         self.kwargs = kwargs
+        self.max_steps = 16
+        self._steps = OrderedDict()
+
+    @staticmethod
+    def _resolve(source, package_path, package_index):
+        """
+        :param source: A path relative to the package, as written in the installer.
+        :param package_path: The package's root folder.
+        :param package_index: The package's PackageIndex, may be None.
+        :return: The absolute path to source, with the case it has on disk when it exists.
+        """
+        source = source.replace("\\", "/")
+        real_path = package_index.real_path(source) if package_index is not None else None
+        if real_path is not None:
+            return real_path
+        return normpath(join(package_path, source))
+
+    def _compile_step(self, element, generation, package_path, package_index):
+        """
+        Reads an installStep into an InstallStepData tree.
+
+        :param element: The sorted copy of the installStep.
+        :param generation: The generation of the request, the step is dropped if it goes stale.
+        :param package_path: The package's root folder.
+        :param package_index: The package's PackageIndex, may be None.
+        :return: The InstallStepData or None if the request went stale.
+        """
+        step_data = self.InstallStepData(element.get("name"))
+        opt_group_elem = element.find("optionalFileGroups")
+        if opt_group_elem is not None:
+            group_data_list = []
+
+            for group_elem in opt_group_elem.findall("group"):
+                if self.requests.is_stale(generation):
+                    return None
+                group_data = self.GroupData(group_elem.get("name"), group_elem.get("type"))
+
+                plugins_elem = group_elem.find("plugins")
+                if plugins_elem is not None:
+                    plugin_data_list = []
+
+                    for plugin_elem in plugins_elem.findall("plugin"):
+                        name_ = plugin_elem.get("name")
+                        description_elem = plugin_elem.find("description")
+                        description_ = description_elem.text if description_elem is not None else ""
+                        image_elem = plugin_elem.find("image")
+                        image_ = image_elem.get("path") if image_elem is not None else ""
+                        if image_:
+                            # normalize path, for some reason normpath wasn't working
+                            image_ = self._resolve(image_, package_path, package_index).replace("\\", "/")
+                            image_ = image_.replace("/", sep)
+
+                        file_data_list = []
+                        for file_elem in plugin_elem.findall("files/file"):
+                            file_data_list.append(
+                                self.FileData(
+                                    self._resolve(file_elem.get("source"), package_path, package_index),
+                                    file_elem.get("source"),
+                                    normpath(file_elem.get("destination").replace("\\", "/")),
+                                    file_elem.get("priority"),
+                                    file_elem.get("alwaysInstall"),
+                                    file_elem.get("installIfUsable")
+                                )
+                            )
+
+                        folder_data_list = []
+                        for folder_elem in plugin_elem.findall("files/folder"):
+                            folder_data_list.append(
+                                self.FolderData(
+                                    self._resolve(folder_elem.get("source"), package_path, package_index),
+                                    folder_elem.get("source"),
+                                    normpath(folder_elem.get("destination").replace("\\", "/")),
+                                    folder_elem.get("priority"),
+                                    folder_elem.get("alwaysInstall"),
+                                    folder_elem.get("installIfUsable")
+                                )
+                            )
+
+                        flag_data_list = []
+                        for flag_elem in plugin_elem.findall("conditionFlags/flag"):
+                            flag_data_list.append(
+                                self.FlagData(
+                                    flag_elem.get("name"),
+                                    flag_elem.text
+                                )
+                            )
+
+                        type_elem = plugin_elem.find("typeDescriptor/type")
+                        default_type_elem = plugin_elem.find("typeDescriptor/dependencyType/defaultType")
+                        if type_elem is not None:
+                            type_ = type_elem.get("name")
+                        elif default_type_elem is not None:
+                            type_ = default_type_elem.get("name")
+                        else:
+                            type_ = "Required"
+
+                        plugin_data_list.append(
+                            self.PluginData(
+                                name_,
+                                description_,
+                                image_,
+                                file_data_list,
+                                folder_data_list,
+                                flag_data_list,
+                                type_
+                            )
+                        )
+
+                    group_data.set_plugin_list(plugin_data_list)
+                    if plugins_elem.get("order") == "Ascending":
+                        group_data.sort_ascending()
+                    elif plugins_elem.get("order") == "Descending":
+                        group_data.sort_descending()
+
+                group_data_list.append(group_data)
+
+            step_data.set_group_list(group_data_list)
+            if opt_group_elem.get("order") == "Ascending":
+                step_data.sort_ascending()
+            elif opt_group_elem.get("order") == "Descending":
+                step_data.sort_descending()
+        return step_data
+
+    def step_data(self, snapshot, generation):
+        """
+        Steps are compiled once per revision of their content and package, selecting around inside one is free.
+
+        :param snapshot: A PreviewSnapshot with a step.
+        :param generation: The generation of the request.
+        :return: The snapshot step's InstallStepData or None if the request went stale while compiling it.
+        """
+        package_path = self.kwargs["package_path"]()
+        key = (fragment_key(snapshot.step, snapshot.step_keys), package_path)
+        step_data = self._steps.get(key)
+        if step_data is not None:
+            self._steps.move_to_end(key)
+            return step_data
+
+        element = _thaw(snapshot.step, snapshot.step_keys)
+        step_data = self._compile_step(element, generation, package_path, self.kwargs["package_index"]())
+        if step_data is not None:
+            self._steps[key] = step_data
+            if len(self._steps) > self.max_steps:
+                self._steps.popitem(last=False)
+        return step_data
 
     def run(self):
         while True:
-            # wait for next element
-            element = self.queue.get()
+            # wait for next snapshot, tagged with the generation it was requested with
+            _, (generation, snapshot) = self.queue.get()
 
-            if element is None:
+            if snapshot is None:
                 self.kwargs["gui_worker"].invalid_node_signal.emit()
                 continue
-            elif element.tag == "installStep":
-                pass
-            elif [elem for elem in element.iterancestors() if elem.tag == "installStep"]:
-                element = [elem for elem in element.iterancestors() if elem.tag == "installStep"][0]
-            elif not [elem for elem in self.kwargs["config_root"]().iter() if elem.tag == "installStep"]:
+            elif snapshot.step is None and not snapshot.has_steps:
                 self.kwargs["gui_worker"].missing_node_signal.emit()
                 continue
-            else:
+            elif snapshot.step is None:
                 self.kwargs["gui_worker"].invalid_node_signal.emit()
                 continue
 
+            step_data = self.step_data(snapshot, generation)
+            if step_data is None or self.requests.is_stale(generation):
+                self.queue.skip()
+                continue
             self.kwargs["gui_worker"].clear_tab_signal.emit()
             self.kwargs["gui_worker"].clear_ui_signal.emit()
-            info_name = self.kwargs["info_root"]().find("Name").text \
-                if self.kwargs["info_root"]().find("Name") is not None else ""
-            info_author = self.kwargs["info_root"]().find("Author").text \
-                if self.kwargs["info_root"]().find("Author") is not None else ""
-            info_version = self.kwargs["info_root"]().find("Version").text \
-                if self.kwargs["info_root"]().find("Version") is not None else ""
-            info_website = self.kwargs["info_root"]().find("Website").text \
-                if self.kwargs["info_root"]().find("Website") is not None else ""
-            self.kwargs["gui_worker"].set_labels_signal.emit(info_name, info_author, info_version, info_website)
-
-            step_data = self.InstallStepData(element.get("name"))
-            opt_group_elem = element.find("optionalFileGroups")
-            if opt_group_elem is not None:
-                group_data_list = []
-
-                for group_elem in opt_group_elem.findall("group"):
-                    group_data = self.GroupData(group_elem.get("name"), group_elem.get("type"))
-
-                    plugins_elem = group_elem.find("plugins")
-                    if plugins_elem is not None:
-                        plugin_data_list = []
-
-                        for plugin_elem in plugins_elem.findall("plugin"):
-                            name_ = plugin_elem.get("name")
-                            description_ = plugin_elem.find("description").text \
-                                if plugin_elem.find("description") is not None else ""
-                            image_ = plugin_elem.find("image").get("path") \
-                                if plugin_elem.find("image") is not None else ""
-                            if image_:
-                                # normalize path, for some reason normpath wasn't working
-                                image_ = join(self.kwargs["package_path"](), image_).replace("\\", "/")
-                                image_ = image_.replace("/", sep)
-
-                            file_data_list = []
-                            for file_elem in plugin_elem.findall("files/file"):
-                                file_data_list.append(
-                                    self.FileData(
-                                        normpath(join(
-                                            self.kwargs["package_path"](),
-                                            file_elem.get("source").replace("\\", "/")
-                                        )),
-                                        file_elem.get("source"),
-                                        normpath(file_elem.get("destination").replace("\\", "/")),
-                                        file_elem.get("priority"),
-                                        file_elem.get("alwaysInstall"),
-                                        file_elem.get("installIfUsable")
-                                    )
-                                )
-
-                            folder_data_list = []
-                            for folder_elem in plugin_elem.findall("files/folder"):
-                                folder_data_list.append(
-                                    self.FolderData(
-                                        normpath(join(
-                                            self.kwargs["package_path"](),
-                                            folder_elem.get("source").replace("\\", "/")
-                                        )),
-                                        folder_elem.get("source"),
-                                        normpath(folder_elem.get("destination").replace("\\", "/")),
-                                        folder_elem.get("priority"),
-                                        folder_elem.get("alwaysInstall"),
-                                        folder_elem.get("installIfUsable")
-                                    )
-                                )
-
-                            flag_data_list = []
-                            for flag_elem in plugin_elem.findall("conditionFlags/flag"):
-                                flag_data_list.append(
-                                    self.FlagData(
-                                        flag_elem.get("name"),
-                                        flag_elem.text
-                                    )
-                                )
-
-                            type_elem = plugin_elem.find("typeDescriptor/type")
-                            default_type_elem = plugin_elem.find("typeDescriptor/dependencyType/defaultType")
-                            if type_elem is not None:
-                                type_ = type_elem.get("name")
-                            elif default_type_elem is not None:
-                                type_ = default_type_elem.get("name")
-                            else:
-                                type_ = "Required"
-
-                            plugin_data_list.append(
-                                self.PluginData(
-                                    name_,
-                                    description_,
-                                    image_,
-                                    file_data_list,
-                                    folder_data_list,
-                                    flag_data_list,
-                                    type_
-                                )
-                            )
-
-                        group_data.set_plugin_list(plugin_data_list)
-                        if plugins_elem.get("order") == "Ascending":
-                            group_data.sort_ascending()
-                        elif plugins_elem.get("order") == "Descending":
-                            group_data.sort_descending()
-
-                    group_data_list.append(group_data)
-
-                step_data.set_group_list(group_data_list)
-                if opt_group_elem.get("order") == "Ascending":
-                    step_data.sort_ascending()
-                elif opt_group_elem.get("order") == "Descending":
-                    step_data.sort_descending()
-
+            self.kwargs["gui_worker"].set_labels_signal.emit(*snapshot.info)
             self.kwargs["gui_worker"].create_page_signal.emit(step_data)
@@ -14,13 +14,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from copy import copy
+from collections.abc import Mapping
 from .exceptions import BaseInstanceException
 
 
 class _PropertyBase(object):
     """
     Base class for the properties. Shouldn't be used directly.
+
+    A property is declared once per node type, in the type's schema, and holds what every node of the type shares.
+    The nodes only keep their values: node.properties binds a copy of each property to the node, and the value is
+    read from and set on that node. Subclasses declare their own __slots__ (even if empty).
     """
+    __slots__ = ("name", "editable", "default", "values", "_node", "_index")
+
     def __init__(self, name, values, editable=True):
         """
         :param name: The display name of the variable.
@@ -33,45 +41,81 @@ class _PropertyBase(object):
         self.name = name
         self.editable = editable
 
-        self.value = ""
+        self.default = ""
         self.values = values
+        self._node = None
+        self._index = 0
+
+    def bind(self, node, index):
+        """
+        :param node: The node whose value the copy reads and sets.
+        :param index: The position of this property in the node's values.
+        :return: A copy of this property bound to *node*.
+        """
+        bound = copy(self)
+        bound._node = node
+        bound._index = index
+        return bound
+
+    @property
+    def value(self):
+        """
+        The bound node's value, the default for a property that isn't bound.
+        """
+        if self._node is None:
+            return self.default
+        return self._node.property_values[self._index]
+
+    def accepts(self, value):
+        """
+        Sub-classes should validate the value here.
+
+        :param value: The value to check.
+        :return: True if the value can be set.
+        """
+        return self.editable
 
     def set_value(self, value):
         """
-        Method used to set the property's value. Sub-classes should validate the value before setting it.
+        Method used to set the bound node's value, if it's accepted.
 
         :param value: The value to be validated and set.
         """
-        if self.editable:
-            self.value = value
+        if self.accepts(value):
+            self._node.set_property_value(self._index, value)
 
 
 class PropertyText(_PropertyBase):
     """
     A property that holds simple text.
     """
+    __slots__ = ()
+
     def __init__(self, name, text="", editable=True):
         super().__init__(name, (), editable)
-        self.value = text
+        self.default = text
 
 
 class PropertyCombo(_PropertyBase):
     """
     A property that holds a combo list - only one value from this list should be selected.
     """
+    __slots__ = ()
+
     def __init__(self, name, values, editable=True):
         super().__init__(name, values, editable)
-        self.value = values[0]
+        self.default = values[0]
 
-    def set_value(self, value):
-        if value in self.values:
-            super().set_value(value)
+    def accepts(self, value):
+        return value in self.values and super().accepts(value)
 
 
 class PropertyInt(_PropertyBase):
     """
     A property that holds an integer.
     """
+    __slots__ = ("min", "max")
+
     def __init__(self, name, min_value, max_value, default, editable=True):
         """
         :param name: The display name of the variable.
@@ -85,50 +129,75 @@ class PropertyInt(_PropertyBase):
         values = range(min_value, max_value + 1)
 
         super().__init__(name, values, editable)
-        self.value = default
+        self.default = default
 
-    def set_value(self, value):
-        if value in self.values:
-            super().set_value(value)
+    def accepts(self, value):
+        return value in self.values and super().accepts(value)
 
 
 class PropertyFolder(PropertyText):
     """
     A property that holds the path to a folder.
     """
-    pass
+    __slots__ = ()
 
 
 class PropertyFile(PropertyText):
     """
     A property that holds the path to a file.
     """
-    pass
+    __slots__ = ()
 
 
 class PropertyColour(PropertyText):
     """
     A property that holds a colour hex value.
     """
-    pass
+    __slots__ = ()
 
 
 class PropertyFlagLabel(PropertyText):
     """
     A property that holds a flag's label.
     """
-    pass
+    __slots__ = ()
 
 
 class PropertyFlagValue(PropertyText):
     """
     A property that holds a flag's value.
     """
-    pass
+    __slots__ = ()
 
 
 class PropertyHTML(PropertyText):
     """
     A property that allows html text. Used for plugin descriptions.
     """
-    pass
+    __slots__ = ()
+
+
+class BoundProperties(Mapping):
+    """
+    A node's properties by key, in the order they're declared. Every lookup binds the declared property to the node.
+    """
+    __slots__ = ("_node", "_properties", "_index")
+
+    def __init__(self, node, properties, index):
+        """
+        :param node: The node the properties are bound to.
+        :param properties: The properties declared in the node's schema, by key.
+        :param index: The position of each key in the node's values.
+        """
+        self._node = node
+        self._properties = properties
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._properties[key].bind(self._node, self._index[key])
+
+    def __iter__(self):
+        return iter(self._properties)
+
+    def __len__(self):
+        return len(self._properties)
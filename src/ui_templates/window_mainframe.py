@@ -37,9 +37,9 @@ class Ui_MainWindow(object):
         self.label.setAlignment(QtCore.Qt.AlignCenter)
         self.label.setObjectName("label")
         self.verticalLayout.addWidget(self.label)
-        self.xml_code_browser = QtWidgets.QTextBrowser(self.tabWidgetPage2)
+        self.xml_code_browser = CodeView(self.tabWidgetPage2)
         self.xml_code_browser.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
-        self.xml_code_browser.setLineWrapMode(QtWidgets.QTextEdit.NoWrap)
+        self.xml_code_browser.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
         self.xml_code_browser.setObjectName("xml_code_browser")
         self.verticalLayout.addWidget(self.xml_code_browser)
         self.tabWidget.addTab(self.tabWidgetPage2, "")
@@ -342,3 +342,4 @@ class Ui_MainWindow(object):
         self.actionShow_Node.setToolTip(_translate("MainWindow", "Show Node"))
         self.actionShow_Node.setShortcut(_translate("MainWindow", "Ctrl+X"))
 
+from ..code_view import CodeView
@@ -195,15 +195,17 @@ class WizardDepend(_WizardBase):
                 result.set(key, element_.get(key))
             result.parse_attribs()
 
+            children = []
             for child in element_:
                 if child.tag == "dependencies":
-                    result.add_child(copy_depend(child))
+                    children.append(copy_depend(child))
                     continue
                 new_child = deepcopy(child)
                 for key in child.keys():
                     new_child.set(key, child.get(key))
                 new_child.parse_attribs()
-                result.add_child(new_child)
+                children.append(new_child)
+            result.add_children(children)
 
             return result
 
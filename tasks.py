@@ -52,6 +52,11 @@ def preview():
     run("python dev/pyinstaller-bootstrap.py")
 
 
+@task()
+def benchmark(name=""):
+    run("python dev/benchmarks.py {}".format(name), pty=True)
+
+
 @task()
 def clean():
     from shutil import rmtree
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys, os, pytest
+from collections import namedtuple
+from threading import Event
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.io import new, node_factory
+
+
+PreviewInstaller = namedtuple("PreviewInstaller", "info_root config_root step plugins")
+
+
+class Recorder(object):
+    """
+    Stands in for a pyqt signal, keeps every emit's arguments and sets *received* on each.
+    """
+    def __init__(self):
+        self.calls = []
+        self.received = Event()
+
+    def emit(self, *args):
+        self.calls.append(args)
+        self.received.set()
+
+
+@pytest.fixture
+def preview_installer():
+    """
+    Builds a new installer with a single step -> group -> plugins branch.
+
+    :return: A factory, called as preview_installer(plugin_names=("first",), attached=True). *attached* is whether
+             the step is added to the installer. Returns a PreviewInstaller.
+    """
+    def build(plugin_names=("first",), attached=True):
+        info_root, config_root = new()
+        steps = node_factory("installSteps", config_root)
+        step = node_factory("installStep", steps)
+        groups = node_factory("optionalFileGroups", step)
+        group = node_factory("group", groups)
+        plugins = node_factory("plugins", group)
+        for name in plugin_names:
+            plugin = node_factory("plugin", plugins)
+            plugin.properties["name"].set_value(name)
+            plugins.add_child(plugin)
+        group.add_child(plugins)
+        groups.add_child(group)
+        step.add_child(groups)
+        if attached:
+            steps.add_child(step)
+            config_root.add_child(steps)
+        return PreviewInstaller(info_root, config_root, step, plugins)
+
+    return build
+
+
+@pytest.fixture
+def recorder():
+    """
+    :return: The Recorder class, call it for each signal that needs recording.
+    """
+    return Recorder
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.code_view import CodeView
+
+
+def test_code_view(qtbot):
+    code_view = CodeView()
+    code_view.resize(400, 200)
+    code_view.show()
+    qtbot.addWidget(code_view)
+    code_view.set_code("<!-- a\ncomment -->\n" + "\n".join("<plugin name=\"a\"/>" for _ in range(1000)))
+
+    def formats(number):
+        block = code_view.document().findBlockByNumber(number)
+        return [(format_range.start, format_range.length) for format_range in block.layout().formats()]
+
+    assert formats(0) == [(0, 6)] and formats(1) == [(0, 11)]
+    assert formats(2) == [(0, 7), (8, 4), (13, 3), (16, 2)]
+    # blocks that were never on screen aren't highlighted
+    assert formats(900) == []
+    code_view.verticalScrollBar().setValue(898)
+    qtbot.waitUntil(lambda: formats(900) == formats(2))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys, os
+from collections import OrderedDict
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.io import import_
+from src.document import DocumentIndex
+
+
+def test_document_index():
+    info_root, config_root = import_(os.path.join(os.path.dirname(__file__), "data", "valid_fomod"))
+    flags = [elem for elem in config_root.iter() if elem.tag == "flag"]
+    index = DocumentIndex.of(config_root)
+    assert index.flag_labels() == list(OrderedDict.fromkeys(flag.properties["name"].value for flag in flags))
+    label = flags[0].properties["name"].value
+    assert index.flag_setters(label) == list(OrderedDict.fromkeys(
+        flag.getparent().getparent() for flag in flags if flag.properties["name"].value == label
+    ))
+
+    # property changes
+    flags[0].properties["name"].set_value("boop")
+    flags[0].properties["<node_text>"].set_value("beep")
+    flags[0].write_attribs()
+    assert index.flag_values("boop") == ["beep"]
+
+    # adding and removing
+    plugin = flags[0].getparent().getparent()
+    plugins = plugin.getparent()
+    plugins.remove_child(plugin)
+    assert index.flag_labels().count("boop") == 0
+    assert plugin not in index.nodes_named("plugin", plugin.properties["name"].value)
+    # removed nodes are still edited through the undo stack, that mustn't put them back in the index
+    assert flags[0].find_document_index() is None
+    flags[0].properties["name"].set_value("detached")
+    flags[0].write_attribs()
+    assert "detached" not in index.flag_labels()
+    flags[0].properties["name"].set_value("boop")
+    flags[0].write_attribs()
+    plugins.add_child(plugin)
+    assert flags[0].find_document_index() is index
+    assert index.flag_setters("boop", "beep") == [plugin]
+    assert plugin in index.nodes_named("plugin", plugin.properties["name"].value)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys, os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.installed import InstalledFiles, FolderListings, destination_parts, parse_priority, walk_folder
+from src.package import PackageIndex
+
+
+def test_installed_files(tmpdir):
+    assert destination_parts("./textures\\armor/") == ("textures", "armor")
+    assert parse_priority("5") == 5 and parse_priority(None) == 0 and parse_priority("boop") == 0
+
+    tmpdir.join("source", "sub", "a.dds").ensure()
+    tmpdir.join("source", "b.dds").ensure()
+    walked = [(parts, entry.is_dir) for parts, entry in walk_folder(PackageIndex(str(tmpdir)), "source")]
+    assert sorted(walked) == [(("b.dds",), False), (("sub",), True), (("sub", "a.dds"), False)]
+    assert walked.index((("sub",), True)) < walked.index((("sub", "a.dds"), False))
+
+    installed = InstalledFiles()
+    installed.set_plugin("first", 0, [(("textures", "a.dds"), False, 1, "first/a.dds")])
+    removed, changed = installed.set_plugin("second", 1, [(("textures", "a.dds"), False, 0, "second/a.dds")])
+    textures = installed.root.children["textures"]
+    assert not removed and [node.name for node in changed] == ["textures", "a.dds"]
+    assert textures.winner.plugin == "first" and textures.is_dir
+    assert textures.children["a.dds"].winner.source == "first/a.dds" and not textures.children["a.dds"].is_dir
+
+    # a tie goes to the later plugin
+    installed.set_plugin("third", 2, [(("textures", "a.dds"), False, 1, "third/a.dds")])
+    assert textures.children["a.dds"].winner.source == "third/a.dds"
+
+    # toggling a plugin off only touches its own paths
+    removed, changed = installed.set_plugin("third", 2, [])
+    assert not removed and textures.children["a.dds"].winner.source == "first/a.dds"
+    installed.set_plugin("first", 0, [])
+    removed, changed = installed.set_plugin("second", 1, [])
+    assert [node.name for node in removed] == ["a.dds", "textures"] and not changed
+    assert not installed.root.children
+
+
+def test_folder_listings(tmpdir):
+    tmpdir.join("Source", "sub", "a.dds").ensure()
+    listings = FolderListings(PackageIndex(str(tmpdir)))
+    assert listings.get("source") is None
+    assert sorted(listings.scan("source")) == [os.path.join("Source"), os.path.join("Source", "sub")]
+    assert sorted(listings.get("SOURCE/")) == [(("sub",), True), (("sub", "a.dds"), False)]
+    assert listings.stale() == []
+
+    # a watcher reporting a change in any folder of the listing drops it
+    assert listings.invalidate(os.path.join("Source", "sub")) == ["source"]
+    assert listings.get("source") is None
+
+    # as does a folder's mtime changing
+    listings.scan("source")
+    tmpdir.join("Source", "sub", "b.dds").ensure()
+    os.utime(str(tmpdir.join("Source", "sub")), ns=(0, 0))
+    assert listings.stale() == ["source"] and listings.get("source") is None
+    listings.scan("source")
+    assert (("sub", "b.dds"), False) in listings.get("source")
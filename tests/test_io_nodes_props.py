@@ -14,12 +14,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import sys, os, lxml, pytest
+import sys, os, lxml, pytest, subprocess, json
+from threading import Event
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from src.io import import_, export, module_parser, new, copy_node, node_factory
-from src.exceptions import TagNotFound, ParserError, BaseInstanceException
-from src.nodes import _NodeElement
-from src.props import _PropertyBase
+from src.exceptions import TagNotFound, ParserError, BaseInstanceException, CancelledError
+from src.nodes import node_registry, flush_metadata, _NodeElement, NodeConfigVisible, NodeConfigPatterns, \
+    NodeConfigInstallPatterns, NodeConfigNestedDependencies, NodeConfigDependencies, NodeConfigPattern, \
+    NodeConfigInstallPattern, NodeConfigFile
+from src.props import _PropertyBase, PropertyInt
+from src.package import PackageIndex
+from src.batch import process_package, run_batch, main as batch_main
+from src.metadata import decode_metadata, encode_metadata
 
 
 def test_import_export(tmpdir):
@@ -30,6 +36,10 @@ def test_import_export(tmpdir):
     config_root.sort()
     export(info_root, config_root, tmpdir)
 
+    for node in config_root.iter():
+        displayed = [child for child in node if not child.is_metadata_comment()]
+        assert [node.model_item.child(row).xml_node for row in range(node.model_item.rowCount())] == displayed
+
     with open(os.path.join(os.path.dirname(__file__), "data", "valid_fomod", "fomod", "Info.xml")) as info_base:
         with open(os.path.join(tmpdir, "fomod", "Info.xml")) as info_exported:
             assert info_base.read() == info_exported.read()
@@ -45,6 +55,94 @@ def test_import_export(tmpdir):
         with open(os.path.join(tmpdir, "fomod", "ModuleConfig.xml")) as config_exported:
             assert config_base.read() == config_exported.read()
 
+    assert export(info_root, config_root, tmpdir) == []
+
+    hidden_node = config_root[-1]
+    hidden_node.set_hidden(True)
+    assert export(info_root, config_root, tmpdir) == [os.path.join(tmpdir, "fomod", "ModuleConfig.xml")]
+    assert hidden_node.getparent() is config_root
+    exported_root = lxml.etree.parse(os.path.join(tmpdir, "fomod", "ModuleConfig.xml")).getroot()
+    assert len(exported_root.findall(hidden_node.tag)) == len(config_root.findall(hidden_node.tag)) - 1
+
+
+def test_import_progress():
+    package_path = os.path.join(os.path.dirname(__file__), "data", "valid_fomod")
+    reports = []
+    info_root, config_root = import_(package_path, lambda *args: reports.append(args))
+    assert reports
+    assert reports[-1][0] == reports[-1][1]
+    assert [report[0] for report in reports] == sorted(report[0] for report in reports)
+
+    cancel = Event()
+    cancel.set()
+    with pytest.raises(CancelledError):
+        import_(package_path, cancel=cancel)
+
+
+def test_package_index(tmpdir):
+    package_path = str(tmpdir)
+    os.makedirs(os.path.join(package_path, "Fomod"))
+    with open(os.path.join(package_path, "Fomod", "Info.xml"), "w") as info_file:
+        info_file.write("<fomod/>")
+
+    index = PackageIndex(package_path)
+    entry = index.lookup("fomod\\info.XML")
+    assert entry.path == os.path.join("Fomod", "Info.xml")
+    assert not entry.is_dir and entry.size == len("<fomod/>")
+    assert index.find("fomod", "info.xml") == "Info.xml"
+    assert index.real_path("FOMOD") == os.path.join(package_path, "Fomod")
+    assert index.lookup("fomod/moduleconfig.xml") is None
+    assert [entry.name for entry in index.listdir("")] == ["Fomod"]
+
+    index.check_mtime = False
+    open(os.path.join(package_path, "Fomod", "ModuleConfig.xml"), "w").close()
+    assert index.lookup("fomod/moduleconfig.xml") is None
+    index.invalidate("fomod")
+    assert index.lookup("fomod/moduleconfig.xml").name == "ModuleConfig.xml"
+
+
+def test_batch_process_package():
+    report = process_package(os.path.join(os.path.dirname(__file__), "data", "valid_fomod"), validate=False)
+    assert report["status"] == "ok" and report["written"] == []
+    report = process_package(os.path.join(os.path.dirname(__file__), "data", "invalid_fomod"), validate=False)
+    assert report["status"] == "error"
+    report = process_package(os.path.join(os.path.dirname(__file__), "data", "incomplete_fomod"), validate=False)
+    assert report["status"] == "missing"
+
+
+def test_batch_run(tmpdir):
+    tmpdir = str(tmpdir)
+    valid = os.path.join(os.path.dirname(__file__), "data", "valid_fomod")
+    invalid = os.path.join(os.path.dirname(__file__), "data", "invalid_fomod")
+    report_dir = os.path.join(tmpdir, "reports")
+
+    lines = []
+    reports = run_batch([valid, invalid], processes=2, validate=False, report_dir=report_dir, output=lines.append)
+    assert sorted(report["status"] for report in reports) == ["error", "ok"]
+    assert len(os.listdir(report_dir)) == 2
+    for report_name in os.listdir(report_dir):
+        with open(os.path.join(report_dir, report_name)) as report_file:
+            report = json.load(report_file)
+        assert report in reports
+        assert report_name.startswith(os.path.basename(report["package"]) + "-")
+    assert any(line.startswith("[error] " + invalid) for line in lines)
+    assert lines[-1].startswith("Processed 2 packages")
+
+    assert batch_main(["-j", "1", "--no-validate", valid]) == 0
+    assert batch_main(["-j", "1", "--no-validate", "--report-dir", tmpdir, valid, invalid]) == 1
+    assert batch_main(["--no-validate", os.path.join(os.path.dirname(__file__), "data", "incomplete_fomod")]) == 1
+
+
+def test_headless_import():
+    # importing and exporting an installer should never load Qt
+    script = (
+        "import sys\n"
+        "from src.io import import_, export\n"
+        "import_({!r})\n"
+        "assert not [module for module in sys.modules if module.startswith('PyQt5')]\n"
+    ).format(os.path.join(os.path.dirname(__file__), "data", "valid_fomod"))
+    subprocess.check_call([sys.executable, "-c", script], cwd=os.path.join(os.path.dirname(__file__), ".."))
+
 
 def test_exceptions():
     invalid_fomod = "<boopity/>"
@@ -79,18 +177,244 @@ def test_node_operations():
 
     new_elem = node_factory(config_root.allowed_children[0].tag, config_root)
     config_root.add_child(new_elem)
+    assert config_root.child_count(type(new_elem)) == 1
+    assert not config_root.can_add_child(node_factory(config_root.allowed_children[0].tag, config_root))
     new_config_root = copy_node(config_root)
     new_config_root.remove_child(new_config_root[0])
+    assert new_config_root.child_count(type(new_elem)) == 0
 
     assert base_config == lxml.etree.tostring(new_config_root, encoding="unicode")
 
     new_config_root.user_sort_order = "5"
     new_sort_order_xml = "<config xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\" " \
                          "xsi:noNamespaceSchemaLocation=\"http://qconsulting.ca/fo3/ModConfig5.0.xsd\">" \
-                         "<!--<designer.metadata.do.not.edit> {\"user_sort\":\"0000005\"}-->" \
+                         "<!--<designer.metadata.do.not.edit> {\"version\":1,\"user_sort\":\"0000005\"}-->" \
                          "</config>"
 
     new_config_root.save_metadata()
     new_config_root.load_metadata()
 
     assert new_sort_order_xml == lxml.etree.tostring(new_config_root, encoding="unicode")
+
+
+def test_sort():
+    group = node_factory("group")
+    plugins = node_factory("plugins", group)
+    group.add_child(plugins)
+    for name in ("a", "b", "c"):
+        plugin = node_factory("plugin", plugins)
+        plugin.properties["name"].set_value(name)
+        plugins.add_child(plugin)
+    group.sort()
+    assert not group._sort_dirty and not group._dirty_descendants and not plugins._sort_dirty
+
+    plugins[2].user_sort_order = "0000000"
+    plugins[0].user_sort_order = "0000002"
+    plugins[1].user_sort_order = "0000001"
+    assert plugins._sort_dirty and group._dirty_descendants
+    group.sort()
+    assert [plugin.get("name") for plugin in plugins] == ["c", "b", "a"]
+
+    # a clean tree is left alone
+    plugins.insert(0, plugins[2])
+    group.sort()
+    assert [plugin.get("name") for plugin in plugins] == ["a", "c", "b"]
+
+    # the items sort through the cached key too
+    from PyQt5.QtGui import QStandardItemModel
+    from src.items import SORT_ROLE
+    model = QStandardItemModel()
+    model.setSortRole(SORT_ROLE)
+    model.appendRow(group.model_item)
+    changed = []
+    model.itemChanged.connect(changed.append)
+    plugins[0].user_sort_order = "0000003"
+    plugins.model_item.sortChildren(0)
+    assert [plugins.model_item.child(row).text() for row in range(3)] == ["c", "b", "a"]
+    # re-keying isn't an edit, nothing listening for user changes hears about it
+    assert not changed
+
+
+def test_add_children():
+    from PyQt5.QtGui import QStandardItemModel
+
+    group = node_factory("group")
+    model = QStandardItemModel()
+    model.appendRow(group.model_item)
+    inserted = []
+    model.rowsInserted.connect(lambda *args: inserted.append(args))
+
+    first, second = node_factory("plugins", group), node_factory("plugins", group)
+    assert group.add_children([first, second, node_factory("group", group)]) == [first]
+    assert list(group) == [first] and group.child_count(type(first)) == 1
+    assert group.model_item.rowCount() == 1
+
+    plugins = [node_factory("plugin", first) for _ in range(50)]
+    inserted.clear()
+    assert first.add_children(plugins) == plugins
+    assert len(inserted) == 1 and first.model_item.rowCount() == 50
+    assert first.child_count(type(plugins[0])) == 50 and first._sort_dirty
+
+
+def test_hidden_nodes():
+    plugins = node_factory("plugins", node_factory("group"))
+    for name in ("a", "b", "c"):
+        plugin = node_factory("plugin", plugins)
+        plugin.properties["name"].set_value(name)
+        plugins.add_child(plugin)
+    plugins[0].set_hidden(True)
+    plugins[2].set_hidden(True)
+    plugins.save_metadata()
+
+    copy = copy_node(plugins)
+    assert [plugin.get("name") for plugin in copy.hidden_children] == ["a", "c"]
+    assert all(plugin.is_hidden for plugin in copy.hidden_children)
+
+    for plugin in list(plugins.hidden_children):
+        plugins.remove(plugin)
+    plugins.hidden_children = []
+    lazy = lxml.etree.fromstring(lxml.etree.tostring(plugins), module_parser)
+    lazy.load_metadata(lazy_hidden=True)
+    assert [child.get("name") for child in lazy if child.tag == "plugin"] == ["b"]
+    lazy.save_metadata()
+    assert lazy.metadata["hidden_nodes"] == plugins.metadata["hidden_nodes"]
+
+    lazy.restore_hidden()
+    assert [plugin.get("name") for plugin in lazy.hidden_children] == ["a", "c"]
+    assert lazy.child_count(type(lazy.hidden_children[0])) == 3
+
+
+def test_copy_comments():
+    comment = node_factory(lxml.etree.Comment)
+    comment.properties["<node_text>"].set_value("boop")
+    comment.write_attribs()
+    copy = copy_node(comment)
+    assert copy.tag is lxml.etree.Comment and copy is not comment
+    assert copy.text == "boop" and copy.value_of("<node_text>") == "boop"
+
+    plugins = node_factory("plugins", node_factory("group"))
+    plugins.add_children([node_factory("plugin", plugins), comment])
+    copy = copy_node(plugins)
+    assert [child.tag for child in copy] == ["plugin", lxml.etree.Comment]
+    assert copy[1].text == "boop" and copy[1] is not comment
+
+
+def test_node_registry():
+    import gc
+
+    # nodes left over from other tests may only be freed once their pending metadata is written, and their documents
+    # can take several collections to free
+    flush_metadata()
+    while gc.collect():
+        pass
+    node_registry.reset()
+    live = node_registry.stats()["live"]
+    info_root, config_root = import_(os.path.join(os.path.dirname(__file__), "data", "valid_fomod"))
+    info_nodes = len(list(info_root.iter()))
+    stats = node_registry.stats()
+    assert stats["live"] == live + info_nodes + len(list(config_root.iter()))
+
+    # the state survives losing every other reference and the proxies are never rebuilt
+    config_root[0].metadata = {"boop": "beep"}
+    gc.collect()
+    assert config_root[0].metadata == {"boop": "beep"}
+    assert node_registry.stats()["created"] == stats["created"]
+
+    # new nodes are kept by the document they're added to, along with their own children
+    group = node_factory("group")
+    plugins = node_factory("plugins", group)
+    plugins.add_child(node_factory("plugin", plugins))
+    group.add_child(plugins)
+    plugins.metadata = {"boop": "beep"}
+    plugins[0].metadata = {"beep": "boop"}
+    del plugins
+    gc.collect()
+    assert group[0].metadata == {"boop": "beep"} and group[0][0].metadata == {"beep": "boop"}
+    del group
+
+    # nodes don't reference each other, a document is freed along with its root without the garbage collector
+    gc.disable()
+    try:
+        leaf = next(node for node in config_root.iter() if not len(node))
+        del config_root
+        assert node_registry.stats()["live"] == live + info_nodes + 1
+
+        # the proxies alive on reset stay counted as live
+        node_registry.reset()
+        assert node_registry.stats()["live"] == live + info_nodes + 1
+
+        del info_root, leaf
+        assert node_registry.stats()["live"] == live
+    finally:
+        gc.enable()
+
+
+def test_deferred_metadata():
+    plugins = node_factory("plugins", node_factory("group"))
+    children = plugins.add_children([node_factory("plugin", plugins) for _ in range(100)])
+    flush_metadata()
+
+    for index, plugin in enumerate(reversed(children)):
+        plugin.user_sort_order = str(index).zfill(7)
+        plugin.mark_metadata_dirty()
+        plugin.mark_metadata_dirty()
+    assert not any(child.is_metadata_comment() for child in children[0])
+    assert flush_metadata() == 100
+    assert flush_metadata() == 0
+    assert children[0].metadata == {"user_sort": "0000099"}
+    assert children[0][0].is_metadata_comment()
+
+    # pending changes are never overwritten by the stale comment
+    children[0].user_sort_order = "5"
+    children[0].mark_metadata_dirty()
+    children[0].load_metadata()
+    assert children[0].user_sort_order == "0000005"
+    assert copy_node(children[1]).user_sort_order == "0000098"
+
+
+def test_metadata_codec():
+    metadata = {"name": "Foo", "hidden_nodes": ["<image path=\"a.png\"/>"]}
+    text = encode_metadata(metadata)
+    assert text.startswith("<designer.metadata.do.not.edit> {\"version\":1,")
+    assert decode_metadata(text) == metadata
+
+    # the cached payload is never handed out
+    decode_metadata(text)["hidden_nodes"].append("boop")
+    assert decode_metadata(text) == metadata
+
+    # comments from before the version field
+    assert decode_metadata("<designer.metadata.do.not.edit> {\"user_sort\":\"0000005\"}") == {"user_sort": "0000005"}
+    assert decode_metadata("<designer.metadata.do.not.edit> {boop") is None
+
+
+def test_node_factory():
+    file_node = node_factory("file")
+    assert type(file_node) is NodeConfigFile
+    assert "<file/>" == lxml.etree.tostring(file_node, encoding="unicode")
+    assert not hasattr(file_node, "__dict__")
+    assert node_factory("plugins").allowed_children is node_factory("plugins").allowed_children
+
+    # nodes share their type's property values until one of them changes
+    other_file = node_factory("file")
+    assert file_node.property_values is other_file.property_values
+    file_node.properties["priority"].set_value(5)
+    file_node.properties["priority"].set_value(500)
+    file_node.properties["source"].set_value("boop.esp")
+    assert file_node.value_of("priority") == 5 and file_node.properties["source"].value == "boop.esp"
+    assert other_file.value_of("priority") == 0 and other_file.properties["source"].value == ""
+    assert type(file_node.properties["priority"]) is type(other_file.properties["priority"]) is PropertyInt
+    assert list(file_node.properties) == ["source", "destination", "priority", "alwaysInstall", "installIfUsable"]
+
+    assert type(node_factory("dependencies", NodeConfigVisible())) is NodeConfigNestedDependencies
+    assert type(node_factory("dependencies", node_factory("pattern", NodeConfigPatterns()))) is \
+        NodeConfigDependencies
+    assert type(node_factory("pattern", NodeConfigPatterns())) is NodeConfigPattern
+    assert type(node_factory("pattern", NodeConfigInstallPatterns())) is NodeConfigInstallPattern
+
+    with pytest.raises(TagNotFound):
+        node_factory("boopity")
+
+    info_root, config_root = import_(os.path.join(os.path.dirname(__file__), "data", "valid_fomod"))
+    new_config_root = copy_node(config_root)
+    assert [type(elem) for elem in config_root.iter()] == [type(elem) for elem in new_config_root.iter()]
+    assert lxml.etree.tostring(config_root) == lxml.etree.tostring(new_config_root)
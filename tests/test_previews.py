@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+# Copyright 2016 Daniel Nunes
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys, os
+from threading import Thread
+from types import SimpleNamespace
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.io import node_factory
+from src.previews import PreviewQueue, PreviewDispatcherThread, PreviewGuiWorker, CodeCache, take_snapshot, \
+    fragment_key, _thaw
+
+
+def test_preview_queue():
+    queue = PreviewQueue()
+    for request in range(5):
+        queue.put(request)
+    assert queue.get() == (5, 4)
+    assert queue.skipped == 4
+
+    queue.put("old")
+    generation, _ = queue.get()
+    queue.put("new")
+    assert queue.is_stale(generation)
+
+    # the debounce window keeps a burst together
+    queue = PreviewQueue(debounce=0.2)
+    results = []
+    thread = Thread(target=lambda: results.append(queue.get()))
+    thread.start()
+    for request in range(3):
+        queue.put(request)
+    thread.join(5)
+    assert results == [(3, 2)] and queue.skipped == 2
+
+
+def test_preview_snapshot(preview_installer):
+    info_root, config_root, step, plugins = preview_installer(("a", "b", "c"), attached=False)
+    plugins[0].user_sort_order = "0000002"
+    plugins[1].user_sort_order = "0000001"
+
+    snapshot = take_snapshot(plugins[0], info_root, config_root)
+    assert snapshot.has_steps and not snapshot.is_comment
+    # the workers get sorted copies, the document keeps its order
+    assert [plugin.get("name") for plugin in plugins] == ["a", "b", "c"]
+    thawed = _thaw(snapshot.step, snapshot.step_keys)
+    assert [plugin.get("name") for plugin in thawed.iter("plugin")] == ["c", "b", "a"]
+    assert _thaw(snapshot.element, snapshot.element_keys).get("name") == "a"
+
+    # the step was never added to the installer
+    snapshot = take_snapshot(config_root, info_root, config_root)
+    assert snapshot.step is None and not snapshot.has_steps
+    assert take_snapshot(None, info_root, config_root) is None
+
+
+def test_preview_step_cache(preview_installer):
+    info_root, config_root, step, plugins = preview_installer(attached=False)
+    plugin = plugins[0]
+
+    requests = PreviewQueue()
+    worker = PreviewGuiWorker(PreviewQueue(), requests, package_path=lambda: "", package_index=lambda: None)
+    step_data = worker.step_data(take_snapshot(step, info_root, config_root), requests.generation)
+    assert [group_data.plugin_list[0].name for group_data in step_data.group_list] == [plugin.get("name")]
+    assert worker.step_data(take_snapshot(plugin, info_root, config_root), requests.generation) is step_data
+
+    plugin.properties["name"].set_value("changed")
+    plugin.write_attribs()
+    step_data = worker.step_data(take_snapshot(plugin, info_root, config_root), requests.generation)
+    assert step_data.group_list[0].plugin_list[0].name == "changed"
+
+
+def test_code_cache():
+    assert fragment_key(b"<a/>", ((1, 0),)) == fragment_key(b"<a/>", ((1, 0),))
+    assert fragment_key(b"<a/>", ((1, 0),)) != fragment_key(b"<a/>", ((1, 1),))
+
+    cache = CodeCache(max_size=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"
+    # b is the least recently used
+    cache.put("c", "cccc")
+    assert cache.get("b") is None and cache.get("c") == "cccc"
+    assert cache.size == 8 and cache.hits == 2 and cache.misses == 1
+    cache.put("d", "d" * 11)
+    assert cache.get("d") is None and cache.size == 8
+
+
+def test_preview_pipeline(preview_installer, recorder):
+    info_root, config_root, step, plugins = preview_installer()
+    plugin = plugins[0]
+    code_signal = recorder()
+    gui_worker = SimpleNamespace(**{name: recorder() for name in (
+        "invalid_node_signal", "missing_node_signal", "clear_tab_signal", "clear_ui_signal", "set_labels_signal",
+        "create_page_signal"
+    )})
+    queue = PreviewQueue()
+    dispatcher = PreviewDispatcherThread(
+        queue, code_signal, package_path=lambda: "", package_index=lambda: None, gui_worker=gui_worker
+    )
+    dispatcher.start()
+    try:
+        # both workers render the request, the worker queues' own generations don't make it stale
+        for _ in range(3):
+            code_signal.received.clear()
+            gui_worker.create_page_signal.received.clear()
+            queue.put(take_snapshot(plugin, info_root, config_root))
+            assert code_signal.received.wait(5) and gui_worker.create_page_signal.received.wait(5)
+        assert code_signal.calls[-1][0].startswith("<plugin")
+        assert gui_worker.create_page_signal.calls[-1][0].group_list[0].plugin_list[0].name == plugin.get("name")
+        assert dispatcher.stats()["cache_hits"] == 2
+
+        # the workers render sorted copies, the document is left as the user has it
+        second = node_factory("plugin", plugins)
+        second.properties["name"].set_value("second")
+        plugins.add_child(second)
+        second.user_sort_order = "0000001"
+        plugin.user_sort_order = "0000002"
+        code_signal.received.clear()
+        gui_worker.create_page_signal.received.clear()
+        queue.put(take_snapshot(plugins, info_root, config_root))
+        assert code_signal.received.wait(5) and gui_worker.create_page_signal.received.wait(5)
+        assert list(plugins) == [plugin, second]
+        assert code_signal.calls[-1][0].index("second") < code_signal.calls[-1][0].index("first")
+        page = gui_worker.create_page_signal.calls[-1][0]
+
+        # selecting around inside the step reuses its compiled page
+        gui_worker.create_page_signal.received.clear()
+        queue.put(take_snapshot(second, info_root, config_root))
+        assert gui_worker.create_page_signal.received.wait(5)
+        assert gui_worker.create_page_signal.calls[-1][0] is page
+
+        code_signal.received.clear()
+        queue.put(None)
+        assert code_signal.received.wait(5) and code_signal.calls[-1] == ("",)
+        assert gui_worker.invalid_node_signal.received.wait(5)
+    finally:
+        for thread in (dispatcher, dispatcher.code_thread, dispatcher.gui_thread):
+            thread.terminate()
+            thread.wait()